@@ -0,0 +1,58 @@
+# benchmarks/warm_runner_startup.py
+"""Benchmark script start-up through the warm runner against a fresh interpreter.
+
+Run from the project root:
+
+    python -m benchmarks.warm_runner_startup [--runs 200] [--preload json --preload email.mime.text]
+
+The script imports the preloaded modules, so the cold runs pay for those
+imports and the warm runs do not.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from utils.warm_runner import WarmRunner
+
+
+def time_runs(start, runs):
+    """Return the mean wall time in milliseconds of start-and-wait, over runs repetitions."""
+    began = time.perf_counter()
+    for _ in range(runs):
+        start().wait()
+    return (time.perf_counter() - began) / runs * 1000
+
+
+def run(runs, preload):
+    with tempfile.TemporaryDirectory() as directory:
+        script = os.path.join(directory, "script.py")
+        with open(script, "w") as file:
+            file.write("".join(f"import {name}\n" for name in preload))
+
+        runner = WarmRunner(preload)
+        started = time.perf_counter()
+        runner.start()
+        print(f"zygote start-up (preloading {', '.join(preload) or 'nothing'}): "
+              f"{(time.perf_counter() - started) * 1000:.1f} ms")
+        try:
+            cold = time_runs(lambda: subprocess.Popen([sys.executable, script]), runs)
+            warm = time_runs(lambda: runner.popen([script]), runs)
+        finally:
+            runner.close()
+        print(f"cold: {cold:.2f} ms/run   warm: {warm:.2f} ms/run   ({cold / warm:.1f}x faster)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark script start-up through the warm runner.")
+    parser.add_argument("--runs", type=int, default=200, help="Script runs per mode.")
+    parser.add_argument("--preload", action="append", default=[],
+                        help="Module to preload and import from the script (repeatable).")
+    args = parser.parse_args()
+    run(args.runs, args.preload or ["json", "email.mime.text", "http.client"])
+
+
+if __name__ == "__main__":
+    main()
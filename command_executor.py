@@ -5,12 +5,16 @@ import shlex
 import platform
 import queue
 import threading
+import time
 from datetime import datetime
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext
 import tkinter.font as tkFont
 import re
 
+from utils.process_tree import NEW_SESSION, KILL_GRACE_SECONDS, TreeKiller, kill_process_group
+from utils.warm_runner import WarmRunnerError, get_warm_runner, python_script_argv
+
 CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config')
 
 class CommandExecutor:
@@ -20,6 +24,7 @@ class CommandExecutor:
         self.command_history = []
         self.history_index = None
         self.current_process = None
+        self.current_killer = None
         self.expecting_input = False
         self.output_queue = queue.Queue()
         self.command_lock = threading.Lock()
@@ -73,9 +78,15 @@ class CommandExecutor:
         self.working_dir_entry = ttk.Entry(command_input_frame, textvariable=self.working_dir_var, width=70)
         self.working_dir_entry.grid(row=1, column=1, padx=5, pady=5, sticky='ew')
 
+        # Timeout entry (blank for no timeout)
+        ttk.Label(command_input_frame, text="Timeout (s):").grid(row=2, column=0, padx=5, pady=5, sticky='e')
+        self.timeout_var = tk.StringVar()
+        self.timeout_entry = ttk.Entry(command_input_frame, textvariable=self.timeout_var, width=10)
+        self.timeout_entry.grid(row=2, column=1, padx=5, pady=5, sticky='w')
+
         # Progress indicator
         self.progress = ttk.Progressbar(command_input_frame, mode='indeterminate')
-        self.progress.grid(row=2, column=0, columnspan=4, padx=5, pady=5, sticky='ew')
+        self.progress.grid(row=3, column=0, columnspan=4, padx=5, pady=5, sticky='ew')
         self.progress.grid_remove()  # Hide initially
 
         # Frame for output display
@@ -127,6 +138,14 @@ class CommandExecutor:
         """Executes the entered command in a separate thread."""
         command = self.command_var.get().strip()
         if command:
+            try:
+                timeout = float(self.timeout_var.get()) if self.timeout_var.get().strip() else None
+            except ValueError:
+                messagebox.showwarning("Input Error", "Timeout must be a number of seconds.")
+                return
+            if timeout is not None and timeout <= 0:
+                messagebox.showwarning("Input Error", "Timeout must be greater than zero.")
+                return
             # Add to command history
             self.command_history.append(command)
             self.history_index = None
@@ -138,14 +157,14 @@ class CommandExecutor:
             # Start progress indicator
             self.show_progress()
             # Start executing the command in a new thread
-            threading.Thread(target=self.execute_command_thread, args=(command,), daemon=True).start()
+            threading.Thread(target=self.execute_command_thread, args=(command, timeout), daemon=True).start()
             # Clear the command entry
             self.command_var.set('')
         else:
             messagebox.showwarning("Input Error", "Please enter a command to execute.")
 
-    def execute_command_thread(self, command):
-        """Thread target function to execute the command."""
+    def execute_command_thread(self, command, timeout=None):
+        """Thread target function to execute the command, killing its process tree after timeout seconds."""
         try:
             # Determine shell usage based on OS
             use_shell = platform.system() == "Windows"
@@ -157,17 +176,21 @@ class CommandExecutor:
                 if args and args[0] in ["python", "python3"]:
                     args.insert(1, "-u")
 
-            # Start the subprocess
-            self.current_process = subprocess.Popen(
-                args,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                stdin=subprocess.PIPE,
-                text=True,
-                shell=use_shell,
-                cwd=self.working_dir_var.get(),
-                bufsize=1
-            )
+            # Start the subprocess, through the warm runner for plain Python script runs
+            self.current_process = None if use_shell else self.start_warm(args)
+            if self.current_process is None:
+                self.current_process = subprocess.Popen(
+                    args,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    stdin=subprocess.PIPE,
+                    text=True,
+                    shell=use_shell,
+                    cwd=self.working_dir_var.get(),
+                    bufsize=1,
+                    **NEW_SESSION
+                )
+            self.current_killer = TreeKiller(self.current_process, timeout)
 
             # Reset the expecting_input flag
             self.expecting_input = False
@@ -180,20 +203,29 @@ class CommandExecutor:
 
             # Wait for the subprocess to complete
             self.current_process.wait()
+            self.current_killer.stop()
 
-            # Wait for the threads to finish reading output
-            stdout_thread.join()
-            stderr_thread.join()
+            # Wait for the threads to finish reading output. Background processes the
+            # command left behind may hold the pipes open; kill them after a grace period.
+            if not self.join_readers((stdout_thread, stderr_thread), KILL_GRACE_SECONDS):
+                if kill_process_group(self.current_process.pid):
+                    self.output_queue.put(("[INFO] Killed background processes left by the command.\n", 'stdout'))
+                self.join_readers((stdout_thread, stderr_thread), KILL_GRACE_SECONDS)
 
             # After subprocess ends
-            if self.current_process.returncode != 0:
+            if self.current_killer.timed_out:
+                self.output_queue.put((f"\n[ERROR] Command timed out after {timeout} seconds\n", 'stderr'))
+            elif self.current_process.returncode != 0:
                 self.output_queue.put((f"\n[ERROR] Command exited with return code {self.current_process.returncode}\n", 'stderr'))
 
         except Exception as e:
             self.output_queue.put((f"\n[EXCEPTION] {str(e)}\n", 'stderr'))
         finally:
             # Reset process reference
+            if self.current_killer is not None:
+                self.current_killer.stop()
             self.current_process = None
+            self.current_killer = None
             # Stop progress indicator
             self.hide_progress()
             # Enable Execute button and disable Cancel button
@@ -202,6 +234,34 @@ class CommandExecutor:
             # Ensure the flag is reset
             self.expecting_input = False
 
+    def start_warm(self, args):
+        """Starts `python script.py ...` through the warm runner if it is enabled; returns None otherwise."""
+        runner = get_warm_runner()
+        script = python_script_argv(args) if runner is not None else None
+        if script is None:
+            return None
+        argv, unbuffered = script
+        try:
+            return runner.popen(
+                argv,
+                cwd=self.working_dir_var.get(),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                unbuffered=unbuffered
+            )
+        except WarmRunnerError as e:
+            self.output_queue.put((f"[INFO] Warm runner unavailable, starting a new interpreter: {e}\n", 'stdout'))
+            return None
+
+    def join_readers(self, threads, timeout):
+        """Waits up to timeout seconds in total for the reader threads; returns True if all finished."""
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in threads)
+
     def read_stream(self, stream, tag):
         """Reads output from the subprocess's stream."""
         try:
@@ -271,10 +331,10 @@ class CommandExecutor:
             self.command_entry.icursor(tk.END)
 
     def cancel_command(self):
-        """Cancels the currently running command."""
-        if self.current_process:
+        """Cancels the currently running command and everything it started (SIGKILL after a grace period)."""
+        if self.current_killer:
             try:
-                self.current_process.terminate()
+                self.current_killer.terminate()
                 self.output_queue.put(("[INFO] Terminating the command...\n", 'stdout'))
                 self.disable_cancel_button()
             except Exception as e:
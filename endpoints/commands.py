@@ -1,22 +1,59 @@
 # commands.py
 import logging
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse, FileResponse
 from pydantic import BaseModel, Field, validator
-from typing import List
+from typing import List, Optional
+from collections import deque
+from datetime import datetime
 import asyncio
+import atexit
+import codecs
+import functools
+import json
+import os
 import shlex
 import subprocess
+import time
+from contextlib import asynccontextmanager
+from utils.admission import AdmissionController, AdmissionRejected, MAX_PER_CLIENT
+from utils.command_log import CommandLog
+from utils.output_capture import CaptureStore, DEFAULT_HEAD_BYTES, DEFAULT_TAIL_BYTES
+from utils.process_accounting import RunMeter, run_accounted, resource_ledger, PIPE_POLL_SECONDS
+from utils.process_tree import NEW_SESSION, TreeKiller, signal_process_tree
+from utils.result_cache import ResultCache
 
 # Initialize router
 router = APIRouter()
 logger = logging.getLogger("uvicorn")
 
 # Constants
-MAX_HISTORY = 100  # Maximum number of commands to store in history
+MAX_HISTORY = 100  # Commands kept in memory for /history; the full history is in the command log
+MAX_HISTORY_PAGE = 1000  # Maximum number of entries returned per history search page
+STREAM_CHUNK_SIZE = 64 * 1024  # Bytes read from a pipe per streamed frame at most
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+MAX_CAPTURE_BYTES = 16 * 1024 * 1024  # Upper bound for per-request head/tail capture sizes
+OUTPUT_STREAMS = ("stdout", "stderr")
+MAX_CACHE_TTL_SECONDS = 3600  # Longest a cached command result may be reused
+MAX_BATCH_COMMANDS = 1000  # Maximum number of commands in one batch request
+MAX_BATCH_PARALLEL = MAX_PER_CLIENT  # A batch never needs more slots than one client may hold
+DEFAULT_TIMEOUT_SECONDS = 3600  # Commands are terminated, then killed, after this long unless the request says otherwise
+MAX_TIMEOUT_SECONDS = 24 * 3600
 
 # Models for request and response
 class CommandRequest(BaseModel):
     command: str = Field(..., example="ls -la /home/user")
+    head_bytes: int = Field(DEFAULT_HEAD_BYTES, ge=0, le=MAX_CAPTURE_BYTES,
+                            description="Bytes kept from the start of each stream.")
+    tail_bytes: int = Field(DEFAULT_TAIL_BYTES, ge=0, le=MAX_CAPTURE_BYTES,
+                            description="Bytes kept from the end of each stream.")
+    cache_ttl: float = Field(0, ge=0, le=MAX_CACHE_TTL_SECONDS, description=(
+        "Reuse the result of an identical command run within this many seconds. Only for read-only commands."
+    ))
+    cache_env: List[str] = Field([], description="Environment variables whose values are part of the cache key.")
+    timeout: float = Field(DEFAULT_TIMEOUT_SECONDS, gt=0, le=MAX_TIMEOUT_SECONDS, description=(
+        "Seconds before the command's whole process group gets SIGTERM, followed by SIGKILL after a grace period."
+    ))
 
     @validator('command')
     def validate_command(cls, v):
@@ -25,29 +62,143 @@ class CommandRequest(BaseModel):
         # Add more validation rules as needed
         return v
 
+class ResourceRecord(BaseModel):
+    source: str = Field(..., description="'command' for API runs, 'schedule' for scheduled tasks.")
+    name: str = Field(..., description="Command line or task name.")
+    command: str
+    pid: int
+    started_at: str
+    wall_seconds: float
+    user_cpu_seconds: Optional[float] = None
+    system_cpu_seconds: Optional[float] = None
+    max_rss_kb: Optional[int] = Field(None, description="Peak resident set size of the child.")
+    stdout_bytes: Optional[int] = None
+    stderr_bytes: Optional[int] = None
+    exit_code: Optional[int] = None
+    timed_out: bool = False
+    task_id: Optional[str] = None
+
+class ResourceUsage(BaseModel):
+    source: str
+    name: str
+    runs: int
+    cpu_seconds: float
+    wall_seconds: float
+    max_rss_kb: int
+
+class CaptureInfo(BaseModel):
+    total_bytes: int = Field(..., description="Bytes the command wrote to the stream.")
+    truncated: bool = Field(..., description="True if the middle of the stream was left out of the response.")
+    omitted_bytes: int = Field(..., description="Bytes left out between head and tail.")
+
+class AdmissionStats(BaseModel):
+    active: int = Field(..., description="Commands running now.")
+    queued: int = Field(..., description="Requests waiting for a slot.")
+    max_concurrent: int
+    max_per_client: int
+    max_queued: int
+    clients: int = Field(..., description="Clients with running or queued requests.")
+    admitted: int
+    rejected_client: int = Field(..., description="Rejected with 429: too many requests pending for the client.")
+    rejected_queue_full: int = Field(..., description="Rejected with 503: wait queue full.")
+    timed_out: int = Field(..., description="Rejected with 503 after waiting the full queue timeout.")
+    wait_seconds_avg: float
+    wait_seconds_p95: float
+    wait_seconds_max: float
+
+class CacheStats(BaseModel):
+    entries: int
+    max_entries: int
+    inflight: int = Field(..., description="Commands currently running on behalf of cached requests.")
+    hits: int
+    misses: int
+    coalesced: int = Field(..., description="Requests that shared an execution already in progress.")
+    evictions: int
+    expirations: int
+    hit_rate: float
+
 class CommandResponse(BaseModel):
     output: str = Field(..., description="Standard output from the command.")
     error: str = Field(..., description="Error output from the command.")
+    stdout_capture: Optional[CaptureInfo] = None
+    stderr_capture: Optional[CaptureInfo] = None
+    output_id: Optional[str] = Field(
+        None, description="Set when output was truncated; fetch it in full from /commands/output/{output_id}/{stream}."
+    )
+    cache: Optional[str] = Field(None, description="'hit', 'coalesced' or 'miss' when cache_ttl was set.")
+    timed_out: bool = Field(False, description="True if the command was killed for exceeding its timeout.")
+    resources: Optional[ResourceRecord] = Field(None, description="Resource usage of the run.")
+
+class BatchCommand(BaseModel):
+    id: str = Field(..., example="fetch", description="Name other commands use in depends_on.")
+    command: str = Field(..., example="git -C /srv/app fetch")
+    depends_on: List[str] = Field([], description="IDs of commands that must succeed before this one runs.")
+
+class BatchRequest(BaseModel):
+    commands: List[BatchCommand]
+    max_parallel: int = Field(4, ge=1, le=MAX_BATCH_PARALLEL, description="Commands run at once at most.")
+    stop_on_failure: bool = Field(False, description="Skip every command not yet started once one fails.")
+    head_bytes: int = Field(DEFAULT_HEAD_BYTES, ge=0, le=MAX_CAPTURE_BYTES)
+    tail_bytes: int = Field(DEFAULT_TAIL_BYTES, ge=0, le=MAX_CAPTURE_BYTES)
+    timeout: float = Field(DEFAULT_TIMEOUT_SECONDS, gt=0, le=MAX_TIMEOUT_SECONDS,
+                           description="Per-command timeout in seconds.")
+
+class BatchCommandResult(BaseModel):
+    id: str
+    command: str
+    status: str = Field(..., description=(
+        "'success', 'failed' (non-zero exit), 'timed_out', 'error' or 'skipped'."
+    ))
+    detail: Optional[str] = Field(None, description="Why the command errored or was skipped.")
+    exit_code: Optional[int] = None
+    output: Optional[str] = None
+    error: Optional[str] = None
+    stdout_capture: Optional[CaptureInfo] = None
+    stderr_capture: Optional[CaptureInfo] = None
+    output_id: Optional[str] = None
+    resources: Optional[ResourceRecord] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchCommandResult] = Field(..., description="One result per command, in request order.")
+    succeeded: int
+    failed: int
+    skipped: int
+    wall_seconds: float
 
 class CommandHistoryResponse(BaseModel):
     history: List[str] = Field(..., description="List of previously executed commands.")
 
+class HistoryEntry(BaseModel):
+    timestamp: datetime
+    command: str
+
+class HistorySearchResponse(BaseModel):
+    entries: List[HistoryEntry] = Field(..., description="Matching commands, oldest first.")
+    next_cursor: Optional[str] = Field(None, description="Pass as 'cursor' to fetch the next page.")
+
 # Dependency for command history storage
 class CommandHistory:
-    def __init__(self, max_size: int = MAX_HISTORY):
-        self.history: List[str] = []
-        self.lock = asyncio.Lock()
+    """Recent commands in a ring buffer, backed by a durable, searchable command log."""
+
+    def __init__(self, max_size: int = MAX_HISTORY, log: Optional[CommandLog] = None):
+        self.log = log or CommandLog()
+        self.history = deque((entry["command"] for entry in self.log.recent(max_size)), maxlen=max_size)
         self.max_size = max_size
 
     async def add_command(self, command: str):
-        async with self.lock:
-            self.history.append(command)
-            if len(self.history) > self.max_size:
-                self.history.pop(0)
+        # A deque with maxlen evicts the oldest entry in O(1); the log write is a buffered append
+        self.history.append(command)
+        try:
+            self.log.append(command)
+        except OSError as e:
+            logger.error(f"Failed to record command in history log: {e}")
 
     async def get_history(self) -> List[str]:
-        async with self.lock:
-            return list(self.history)
+        return list(self.history)
+
+    async def search(self, **filters):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.log.search, **filters))
 
 async def get_command_history():
     return command_history_instance
@@ -55,6 +206,100 @@ async def get_command_history():
 # Initialize command history
 command_history_instance = CommandHistory()
 
+# Dependency for admission control of everything that spawns a child
+admission_controller_instance = AdmissionController()
+
+def get_admission_controller() -> AdmissionController:
+    return admission_controller_instance
+
+def client_identity(http_request: Request) -> str:
+    """Identify the caller for per-client limits, seeing through a local tunnel such as ngrok."""
+    host = http_request.client.host if http_request.client else "unknown"
+    forwarded = http_request.headers.get("x-forwarded-for")
+    if forwarded and host in ("127.0.0.1", "::1", "localhost"):
+        return forwarded.split(",")[0].strip()
+    return host
+
+async def acquire_execution_slot(admission: AdmissionController, client_id: str):
+    """Wait for an execution slot, turning rejection into 429/503 with Retry-After."""
+    try:
+        await admission.acquire(client_id)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected command from {client_id}: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail,
+                            headers={"Retry-After": str(e.retry_after)})
+
+@asynccontextmanager
+async def execution_slot(admission: AdmissionController, client_id: str):
+    """Hold an execution slot for the duration of the block."""
+    await acquire_execution_slot(admission, client_id)
+    admitted_at = time.monotonic()
+    try:
+        yield
+    finally:
+        admission.release(client_id, time.monotonic() - admitted_at)
+
+# Dependency for cached results of idempotent commands
+result_cache_instance = ResultCache()
+
+def get_result_cache() -> ResultCache:
+    return result_cache_instance
+
+def cache_key(args: List[str], request: CommandRequest) -> tuple:
+    """Key a command result by argv, working directory, selected environment and capture sizes."""
+    environment = tuple((name, os.environ.get(name)) for name in sorted(set(request.cache_env)))
+    return tuple(args), os.getcwd(), environment, request.head_bytes, request.tail_bytes, request.timeout
+
+# Dependency for spilled command output
+capture_store_instance = CaptureStore()
+atexit.register(capture_store_instance.close)
+
+def get_capture_store() -> CaptureStore:
+    return capture_store_instance
+
+async def run_captured(args: List[str], command: str, head_bytes: int, tail_bytes: int,
+                       captures: CaptureStore, source: str = "command", timeout: Optional[float] = None,
+                       **popen_kwargs) -> CommandResponse:
+    """Run a command with bounded output capture, resource accounting and an optional timeout.
+
+    Extra keyword arguments (e.g. on_start) are passed to run_accounted().
+    """
+    # Keep head and tail in memory; anything beyond spills to disk
+    capture_id, streams = captures.new_captures(OUTPUT_STREAMS, head_bytes, tail_bytes)
+
+    # Run in a worker thread so the child can be reaped with its resource usage
+    loop = asyncio.get_running_loop()
+    try:
+        stdout, stderr, record = await loop.run_in_executor(
+            None, functools.partial(
+                run_accounted, args, source, command,
+                stdout=streams["stdout"], stderr=streams["stderr"], timeout=timeout, **popen_kwargs
+            )
+        )
+    finally:
+        for stream in streams.values():
+            stream.close()
+        spilled = captures.register(capture_id, streams)
+
+    logger.info(
+        f"Command exited with code {record['exit_code']} "
+        f"(stdout {stdout.total_bytes} bytes, stderr {stderr.total_bytes} bytes)"
+    )
+    if record["timed_out"]:
+        logger.warning(f"Command '{command}' was killed after its {timeout} s timeout")
+    stdout_text = stdout.text().strip()
+    stderr_text = stderr.text().strip()
+    if stdout_text:
+        logger.debug(f"Command Output: {stdout_text}")
+    if stderr_text:
+        logger.debug(f"Command Error Output: {stderr_text}")
+
+    return CommandResponse(
+        output=stdout_text, error=stderr_text,
+        stdout_capture=CaptureInfo(**stdout.info()), stderr_capture=CaptureInfo(**stderr.info()),
+        output_id=capture_id if spilled else None, timed_out=record["timed_out"], resources=ResourceRecord(**record)
+    )
+
 @router.post(
     "/execute",
     response_model=CommandResponse,
@@ -63,7 +308,11 @@ command_history_instance = CommandHistory()
 )
 async def execute_command(
     request: CommandRequest,
-    history: CommandHistory = Depends(get_command_history)
+    http_request: Request,
+    history: CommandHistory = Depends(get_command_history),
+    captures: CaptureStore = Depends(get_capture_store),
+    admission: AdmissionController = Depends(get_admission_controller),
+    cache: ResultCache = Depends(get_result_cache)
 ) -> CommandResponse:
     command = request.command
     logger.info(f"Received command execution request: {command}")
@@ -75,27 +324,24 @@ async def execute_command(
         # Parse command safely
         args = shlex.split(command)
         logger.debug(f"Executing command with arguments: {args}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid command: {e}")
+    client_id = client_identity(http_request)
 
-        # Execute command asynchronously
-        process = await asyncio.create_subprocess_exec(
-            *args,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-
-        # Decode outputs
-        stdout_decoded = stdout.decode().strip()
-        stderr_decoded = stderr.decode().strip()
+    async def execute() -> CommandResponse:
+        async with execution_slot(admission, client_id):
+            return await run_captured(args, command, request.head_bytes, request.tail_bytes, captures,
+                                      timeout=request.timeout)
 
-        # Log outputs
-        if stdout_decoded:
-            logger.info(f"Command Output: {stdout_decoded}")
-        if stderr_decoded:
-            logger.warning(f"Command Error Output: {stderr_decoded}")
-
-        return CommandResponse(output=stdout_decoded, error=stderr_decoded)
+    try:
+        if request.cache_ttl:
+            # Identical requests within the TTL share one execution and its result
+            response, outcome = await cache.get_or_run(cache_key(args, request), request.cache_ttl, execute)
+            return response.model_copy(update={"cache": outcome})
+        return await execute()
 
+    except HTTPException:
+        raise
     except FileNotFoundError:
         logger.error(f"Command not found: {command}")
         raise HTTPException(status_code=400, detail="Command not found.")
@@ -103,6 +349,334 @@ async def execute_command(
         logger.exception(f"Failed to execute command '{command}': {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error.")
 
+@router.get(
+    "/output/{output_id}/{stream}",
+    response_class=FileResponse,
+    summary="Fetch full command output",
+    description="Downloads the complete stdout or stderr of a command whose output was truncated. "
+                "Output is kept for an hour.",
+)
+async def get_command_output(
+    output_id: str,
+    stream: str,
+    captures: CaptureStore = Depends(get_capture_store)
+) -> FileResponse:
+    if stream not in OUTPUT_STREAMS:
+        raise HTTPException(status_code=400, detail="stream must be 'stdout' or 'stderr'.")
+    path = captures.get_path(output_id, stream)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Output not found or expired.")
+    return FileResponse(path, media_type="text/plain", filename=f"{output_id}.{stream}.txt")
+
+@router.delete(
+    "/output/{output_id}",
+    summary="Delete command output",
+    description="Deletes stored output of a command before it expires.",
+)
+async def delete_command_output(
+    output_id: str,
+    captures: CaptureStore = Depends(get_capture_store)
+):
+    if not captures.delete(output_id):
+        raise HTTPException(status_code=404, detail="Output not found or expired.")
+    return {"message": "Output deleted."}
+
+def check_batch_graph(commands: List[BatchCommand]):
+    """Raise ValueError for duplicate IDs, unknown dependencies or dependency cycles."""
+    ids = [command.id for command in commands]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Command IDs must be unique.")
+    dependents = {command_id: [] for command_id in ids}
+    pending = {}
+    for command in commands:
+        for dependency in command.depends_on:
+            if dependency not in dependents:
+                raise ValueError(f"Command '{command.id}' depends on unknown command '{dependency}'.")
+            dependents[dependency].append(command.id)
+        pending[command.id] = len(set(command.depends_on))
+    # Kahn's algorithm: anything never reaching zero pending dependencies is on a cycle
+    ready = [command_id for command_id, count in pending.items() if count == 0]
+    visited = 0
+    while ready:
+        command_id = ready.pop()
+        visited += 1
+        for dependent in set(dependents[command_id]):
+            pending[dependent] -= 1
+            if pending[dependent] == 0:
+                ready.append(dependent)
+    if visited != len(ids):
+        cyclic = sorted(command_id for command_id, count in pending.items() if count > 0)
+        raise ValueError(f"Dependency cycle among commands: {', '.join(cyclic)}.")
+
+async def run_batch(batch: BatchRequest, client_id: str, captures: CaptureStore,
+                    admission: AdmissionController) -> List[BatchCommandResult]:
+    """Run a validated batch, starting each command once its dependencies have succeeded."""
+    results = {}
+    finished = {command.id: asyncio.Event() for command in batch.commands}
+    parallel = asyncio.Semaphore(batch.max_parallel)
+    stopped = False
+
+    async def run_one(item: BatchCommand) -> BatchCommandResult:
+        nonlocal stopped
+        for dependency in item.depends_on:
+            await finished[dependency].wait()
+        blocked = [dependency for dependency in item.depends_on if results[dependency].status != "success"]
+        if blocked:
+            return BatchCommandResult(id=item.id, command=item.command, status="skipped",
+                                      detail=f"Dependency '{blocked[0]}' did not succeed.")
+        async with parallel:
+            if stopped:
+                return BatchCommandResult(id=item.id, command=item.command, status="skipped",
+                                          detail="Batch stopped after a failure.")
+            try:
+                args = shlex.split(item.command)
+                # The batch was accepted as a whole, so its commands wait for a slot rather than being rejected
+                async with admission.admit(client_id, queue_limits=False):
+                    response = await run_captured(args, item.command, batch.head_bytes, batch.tail_bytes, captures,
+                                                  timeout=batch.timeout)
+            except FileNotFoundError:
+                result = BatchCommandResult(id=item.id, command=item.command, status="error",
+                                            detail="Command not found.")
+            except ValueError as e:
+                result = BatchCommandResult(id=item.id, command=item.command, status="error",
+                                            detail=f"Invalid command: {e}")
+            else:
+                exit_code = response.resources.exit_code
+                if response.timed_out:
+                    status, detail = "timed_out", f"Killed after {batch.timeout} s."
+                else:
+                    status, detail = ("success" if exit_code == 0 else "failed"), None
+                result = BatchCommandResult(
+                    id=item.id, command=item.command, status=status, detail=detail,
+                    exit_code=exit_code, **response.model_dump(include={"output", "error", "output_id"}),
+                    stdout_capture=response.stdout_capture, stderr_capture=response.stderr_capture,
+                    resources=response.resources
+                )
+            if result.status != "success" and batch.stop_on_failure:
+                stopped = True
+            return result
+
+    async def run_and_publish(item: BatchCommand):
+        try:
+            results[item.id] = await run_one(item)
+        except Exception as e:
+            logger.exception(f"Batch command '{item.id}' failed: {e}")
+            results[item.id] = BatchCommandResult(id=item.id, command=item.command, status="error",
+                                                  detail="Internal Server Error.")
+        finally:
+            finished[item.id].set()
+
+    await asyncio.gather(*(run_and_publish(item) for item in batch.commands))
+    return [results[item.id] for item in batch.commands]
+
+@router.post(
+    "/batch",
+    response_model=BatchResponse,
+    summary="Execute a batch of commands",
+    description=(
+        "Runs several commands in one request. Commands run in parallel up to max_parallel; a command "
+        "with depends_on starts only after those commands succeed, and is skipped if any of them does not."
+    ),
+)
+async def execute_batch(
+    batch: BatchRequest,
+    http_request: Request,
+    history: CommandHistory = Depends(get_command_history),
+    captures: CaptureStore = Depends(get_capture_store),
+    admission: AdmissionController = Depends(get_admission_controller)
+) -> BatchResponse:
+    if len(batch.commands) > MAX_BATCH_COMMANDS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_COMMANDS} commands per batch.")
+    try:
+        check_batch_graph(batch.commands)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    logger.info(f"Received batch of {len(batch.commands)} command(s)")
+    for item in batch.commands:
+        await history.add_command(item.command)
+
+    started = time.monotonic()
+    results = await run_batch(batch, client_identity(http_request), captures, admission)
+    return BatchResponse(
+        results=results,
+        succeeded=sum(1 for result in results if result.status == "success"),
+        failed=sum(1 for result in results if result.status in ("failed", "timed_out", "error")),
+        skipped=sum(1 for result in results if result.status == "skipped"),
+        wall_seconds=round(time.monotonic() - started, 3)
+    )
+
+async def pump_pipe(pipe, stream: str, frames: asyncio.Queue):
+    """Forward chunks from a child's pipe to the frame queue; None marks EOF."""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=STREAM_CHUNK_SIZE)
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    try:
+        while True:
+            chunk = await reader.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            await frames.put((stream, chunk))
+        await frames.put((stream, None))
+    finally:
+        transport.close()
+
+def format_frame(frame: dict, output_format: str) -> str:
+    if output_format == "sse":
+        return f"event: {frame['type']}\ndata: {json.dumps(frame)}\n\n"
+    return json.dumps(frame) + "\n"
+
+async def stream_command(args: List[str], command: str, output_format: str, timeout: float):
+    """Run a command and yield its output as frames while it runs.
+
+    Frames are a 'start' frame with the pid, 'output' frames tagged with the
+    stream they came from, and a final 'exit' frame with the exit code and
+    resource usage. The child's process tree is killed if it exceeds the
+    timeout or the client disconnects.
+    """
+    loop = asyncio.get_running_loop()
+    meter = RunMeter("command", command, command)
+    process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               **NEW_SESSION)
+    killer = TreeKiller(process, timeout)
+    frames = asyncio.Queue(maxsize=16)  # Backpressure: a slow client slows the reads, not memory
+    pumps = [
+        asyncio.ensure_future(pump_pipe(process.stdout, "stdout", frames)),
+        asyncio.ensure_future(pump_pipe(process.stderr, "stderr", frames)),
+    ]
+    decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace") for name in ("stdout", "stderr")}
+    byte_counts = {"stdout": 0, "stderr": 0}
+    finished = False
+    try:
+        yield format_frame({"type": "start", "pid": process.pid}, output_format)
+        open_streams = 2
+        while open_streams:
+            if not killer.timed_out:
+                stream, chunk = await frames.get()
+            else:
+                try:
+                    stream, chunk = await asyncio.wait_for(frames.get(), PIPE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    if killer.pipes_abandoned():
+                        # Only processes that escaped the group still hold the pipes
+                        break
+                    continue
+            if chunk is None:
+                open_streams -= 1
+                data = decoders[stream].decode(b"", final=True)
+            else:
+                byte_counts[stream] += len(chunk)
+                data = decoders[stream].decode(chunk)
+            if data:
+                yield format_frame({"type": "output", "stream": stream, "data": data}, output_format)
+        for pump in pumps:
+            pump.cancel()
+        record = await loop.run_in_executor(
+            None, functools.partial(meter.finish, process, byte_counts["stdout"], byte_counts["stderr"],
+                                    killer.timed_out)
+        )
+        finished = True
+        killer.stop()
+        resource_ledger.add(record)
+        logger.info(f"Streamed command '{command}' exited with code {record['exit_code']}")
+        yield format_frame({
+            "type": "exit", "exit_code": record["exit_code"], "timed_out": record["timed_out"], "resources": record
+        }, output_format)
+    finally:
+        if not finished:
+            # Client went away (or the stream failed) before the child exited
+            for pump in pumps:
+                pump.cancel()
+            killer.stop()
+            if signal_process_tree(process, force=True):
+                logger.warning(f"Killed streamed command '{command}' after the client disconnected")
+            loop.run_in_executor(None, process.wait)
+
+@router.post(
+    "/execute/stream",
+    summary="Execute a shell command and stream its output",
+    description=(
+        "Executes a command and streams stdout/stderr chunks as they are produced, tagged by stream, "
+        "followed by a final exit frame. Frames are newline-delimited JSON by default, or Server-Sent "
+        "Events with format=sse."
+    ),
+    response_class=StreamingResponse,
+    responses={200: {"content": {media_type: {} for media_type in STREAM_MEDIA_TYPES.values()}}},
+)
+async def execute_command_stream(
+    request: CommandRequest,
+    http_request: Request,
+    output_format: str = Query("ndjson", alias="format", description="'ndjson' or 'sse'."),
+    history: CommandHistory = Depends(get_command_history),
+    admission: AdmissionController = Depends(get_admission_controller)
+) -> StreamingResponse:
+    command = request.command
+    if output_format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'.")
+    logger.info(f"Received streaming command execution request: {command}")
+    await history.add_command(command)
+
+    try:
+        args = shlex.split(command)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid command: {e}")
+    # The slot is held until the stream ends, not just until the response starts
+    client_id = client_identity(http_request)
+    await acquire_execution_slot(admission, client_id)
+    admitted_at = time.monotonic()
+    generator = stream_command(args, command, output_format, request.timeout)
+    try:
+        # Start the child now so launch errors become HTTP errors, not a broken stream
+        first_frame = await generator.__anext__()
+    except BaseException as e:
+        admission.release(client_id, time.monotonic() - admitted_at)
+        if isinstance(e, FileNotFoundError):
+            logger.error(f"Command not found: {command}")
+            raise HTTPException(status_code=400, detail="Command not found.")
+        raise
+
+    async def frames():
+        try:
+            yield first_frame
+            async for frame in generator:
+                yield frame
+        finally:
+            await generator.aclose()
+            admission.release(client_id, time.monotonic() - admitted_at)
+
+    return StreamingResponse(
+        frames(), media_type=STREAM_MEDIA_TYPES[output_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get(
+    "/cache",
+    response_model=CacheStats,
+    summary="Get Result Cache Metrics",
+    description="Reports entries, hits, misses and coalesced requests of the command result cache.",
+)
+async def get_cache_stats(cache: ResultCache = Depends(get_result_cache)) -> CacheStats:
+    return CacheStats(**cache.stats())
+
+@router.delete(
+    "/cache",
+    summary="Clear Result Cache",
+    description="Drops every cached command result.",
+)
+async def clear_cache(cache: ResultCache = Depends(get_result_cache)):
+    cache.clear()
+    return {"message": "Cache cleared."}
+
+@router.get(
+    "/admission",
+    response_model=AdmissionStats,
+    summary="Get Admission Metrics",
+    description="Reports running and queued command executions, rejections and queue wait times.",
+)
+async def get_admission_stats(
+    admission: AdmissionController = Depends(get_admission_controller)
+) -> AdmissionStats:
+    return AdmissionStats(**admission.stats())
+
 @router.get(
     "/history",
     response_model=CommandHistoryResponse,
@@ -116,3 +690,59 @@ async def get_command_history_endpoint(
     history_list = await history.get_history()
     return CommandHistoryResponse(history=history_list)
 
+
+@router.get(
+    "/resources",
+    response_model=List[ResourceRecord],
+    summary="Get Resource Records",
+    description="Lists resource usage of recent command and scheduled task runs in this process, newest first.",
+)
+async def get_resource_records(
+    limit: int = Query(100, ge=1, le=1000),
+    source: Optional[str] = Query(None, description="'command' or 'schedule'."),
+    name: Optional[str] = Query(None, description="Command line or task name."),
+) -> List[ResourceRecord]:
+    return [ResourceRecord(**record) for record in resource_ledger.recent(limit, source=source, name=name)]
+
+@router.get(
+    "/resources/top",
+    response_model=List[ResourceUsage],
+    summary="Get Most Expensive Commands",
+    description="Aggregates recent resource records by command or task, most total CPU time first.",
+)
+async def get_top_resource_usage(
+    limit: int = Query(10, ge=1, le=1000),
+    source: Optional[str] = Query(None, description="'command' or 'schedule'."),
+) -> List[ResourceUsage]:
+    return [ResourceUsage(**entry) for entry in resource_ledger.top(limit, source=source)]
+
+@router.get(
+    "/history/search",
+    response_model=HistorySearchResponse,
+    summary="Search Command History",
+    description=(
+        "Searches the persistent command history by substring, prefix and time range, oldest first, "
+        "with cursor pagination."
+    ),
+)
+async def search_command_history(
+    contains: Optional[str] = Query(None, description="Only commands containing this text."),
+    prefix: Optional[str] = Query(None, description="Only commands starting with this text."),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=MAX_HISTORY_PAGE),
+    cursor: Optional[str] = None,
+    history: CommandHistory = Depends(get_command_history)
+) -> HistorySearchResponse:
+    # The log records naive local time
+    since, until = [
+        value.astimezone().replace(tzinfo=None) if value is not None and value.tzinfo is not None else value
+        for value in (since, until)
+    ]
+    try:
+        entries, next_cursor = await history.search(
+            contains=contains, prefix=prefix, since=since, until=until, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return HistorySearchResponse(entries=entries, next_cursor=next_cursor)
@@ -1,17 +1,48 @@
 # endpoints/filesystem.py
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 import os
+import stat
+import asyncio
+import functools
+import hashlib
+import json
+import re
 import shutil
 import logging
-from pydantic import BaseModel
+import tempfile
+import mimetypes
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from starlette.requests import ClientDisconnect
 import datetime
+from utils.dir_listing import list_directory, ENTRY_TYPES, SORT_FIELDS
+from utils.fs_cache import FilesystemCache
+from utils.tree_search import SearchCriteria, TreeSearch, DEFAULT_EXCLUDES, DEFAULT_WORKERS, MAX_WORKERS
+from utils.file_response import (
+    FileRangeResponse, RangeNotSatisfiable, parse_range, validator_headers, content_disposition
+)
 
 router = APIRouter()
 logger = logging.getLogger("uvicorn")
 
+DOWNLOAD_MEDIA_TYPE = "application/octet-stream"
+SEARCH_MEDIA_TYPE = "application/x-ndjson"
+UPLOAD_WRITE_SIZE = 1024 * 1024  # Bytes buffered before each write to the temp file
+
+# New files get the usual 0666 & ~umask mode; temp files are created 0600
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+# Dependency for cached listings and stats, kept fresh by inotify
+fs_cache_instance = FilesystemCache()
+
+def get_fs_cache() -> FilesystemCache:
+    return fs_cache_instance
+
 # Endpoint to create a new directory
 @router.post("/create-directory")
-async def create_directory(path: str):
+async def create_directory(path: str, fs_cache: FilesystemCache = Depends(get_fs_cache)):
     """Creates a new directory at the specified path."""
     try:
         logger.info(f"Attempting to create directory at path: {path}")
@@ -20,6 +51,7 @@ async def create_directory(path: str):
             return {"message": f"Directory already exists at {path}"}
         
         os.makedirs(path, exist_ok=True)
+        fs_cache.invalidate(path)
         logger.info(f"Directory successfully created at: {path}")
         return {"message": f"Directory created at {path}"}
     except PermissionError as e:
@@ -31,7 +63,7 @@ async def create_directory(path: str):
 
 # Endpoint to delete a file or directory
 @router.delete("/delete")
-async def delete_file_or_directory(path: str):
+async def delete_file_or_directory(path: str, fs_cache: FilesystemCache = Depends(get_fs_cache)):
     """Deletes a file or directory at the specified path."""
     if not os.path.exists(path):
         logger.warning(f"Delete failed - path not found: {path}")
@@ -44,6 +76,7 @@ async def delete_file_or_directory(path: str):
         else:
             os.remove(path)
             logger.info(f"File deleted at path: {path}")
+        fs_cache.invalidate(path)
         return {"message": f"Deleted {path}"}
     except PermissionError as e:
         logger.error(f"Permission denied when deleting path at {path}: {e}")
@@ -54,16 +87,15 @@ async def delete_file_or_directory(path: str):
 
 # Endpoint to list contents of a directory
 @router.get("/list")
-async def list_directory_contents(path: str):
+async def list_directory_contents(path: str, fs_cache: FilesystemCache = Depends(get_fs_cache)):
     """Lists contents of the specified directory."""
-    if not os.path.isdir(path):
-        logger.warning(f"List contents failed - path is not a directory or does not exist: {path}")
-        raise HTTPException(status_code=400, detail="Path is not a directory or does not exist")
-    
     try:
-        contents = os.listdir(path)
+        contents = fs_cache.listdir(path)
         logger.info(f"Listed contents of directory at path: {path}")
         return {"contents": contents}
+    except (FileNotFoundError, NotADirectoryError):
+        logger.warning(f"List contents failed - path is not a directory or does not exist: {path}")
+        raise HTTPException(status_code=400, detail="Path is not a directory or does not exist")
     except PermissionError as e:
         logger.error(f"Permission denied when listing directory contents at {path}: {e}")
         raise HTTPException(status_code=403, detail=f"Permission denied: {str(e)}")
@@ -71,6 +103,155 @@ async def list_directory_contents(path: str):
         logger.error(f"Unexpected error listing directory contents at {path}: {e}")
         raise HTTPException(status_code=500, detail=f"Error listing directory contents: {str(e)}")
 
+# Models for paginated directory listings
+class DirectoryEntry(BaseModel):
+    name: str
+    type: str = Field(..., description="'file', 'directory', 'symlink' or 'other'.")
+    size: Optional[int] = None
+    modified: Optional[datetime.datetime] = None
+
+class DirectoryListing(BaseModel):
+    path: str
+    entries: List[DirectoryEntry]
+    total: int = Field(..., description="Entries matching the filters, across all pages.")
+    next_cursor: Optional[str] = Field(None, description="Pass as 'cursor' to fetch the next page.")
+
+# Endpoint to list a directory page by page, with type, size and modification time
+@router.get(
+    "/entries",
+    response_model=DirectoryListing,
+    summary="List directory entries",
+    description=(
+        "Lists a directory with each entry's type, size and modification time in one pass, filtered by "
+        "a glob pattern and entry type, sorted, and paginated with an opaque cursor."
+    ),
+)
+async def list_directory_entries(
+    path: str,
+    pattern: Optional[str] = Query(None, description="Glob matched against entry names, e.g. '*.log'."),
+    type: Optional[List[str]] = Query(None, description="Entry types to include; repeat for several."),
+    include_hidden: bool = True,
+    sort: str = Query("name", description=f"One of {', '.join(SORT_FIELDS)}."),
+    order: str = Query("asc", description="'asc' or 'desc'."),
+    limit: int = Query(1000, ge=1, le=10000),
+    cursor: Optional[str] = None,
+    fs_cache: FilesystemCache = Depends(get_fs_cache)
+) -> DirectoryListing:
+    """Lists one page of a directory."""
+    if type and any(kind not in ENTRY_TYPES for kind in type):
+        raise HTTPException(status_code=400, detail=f"type must be one of {', '.join(ENTRY_TYPES)}.")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'.")
+    loop = asyncio.get_running_loop()
+    try:
+        entries, next_cursor, total = await loop.run_in_executor(None, functools.partial(
+            list_directory, path, pattern=pattern, types=set(type) if type else None,
+            include_hidden=include_hidden, sort=sort, descending=order == "desc", limit=limit, cursor=cursor,
+            scan=fs_cache.scan, stat=fs_cache.stat_entry
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (FileNotFoundError, NotADirectoryError):
+        logger.warning(f"List entries failed - path is not a directory or does not exist: {path}")
+        raise HTTPException(status_code=400, detail="Path is not a directory or does not exist")
+    except PermissionError as e:
+        logger.error(f"Permission denied when listing directory entries at {path}: {e}")
+        raise HTTPException(status_code=403, detail=f"Permission denied: {str(e)}")
+    logger.info(f"Listed {len(entries)} of {total} entries of directory at path: {path}")
+    return DirectoryListing(
+        path=path,
+        entries=[
+            DirectoryEntry(
+                name=entry["name"], type=entry["type"], size=entry["size"],
+                modified=datetime.datetime.fromtimestamp(entry["mtime"]) if entry["mtime"] is not None else None
+            )
+            for entry in entries
+        ],
+        total=total,
+        next_cursor=next_cursor
+    )
+
+async def search_frames(search: TreeSearch):
+    """Yield NDJSON 'match' frames as the walk finds them, then a 'done' frame; closing stops the walk."""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            batch = await loop.run_in_executor(None, search.next_batch)
+            if batch is None:
+                break
+            yield "".join(
+                json.dumps({
+                    "type": "match", "path": result["path"], "entry_type": result["type"], "size": result["size"],
+                    "modified": datetime.datetime.fromtimestamp(result["mtime"]).isoformat(),
+                }) + "\n"
+                for result in batch
+            )
+        summary = search.summary()
+        logger.info(
+            f"Search under {search.root} found {summary['matches']} match(es) in {summary['directories']} "
+            f"directories in {summary['elapsed_seconds']} s"
+        )
+        yield json.dumps({"type": "done", **summary}) + "\n"
+    finally:
+        search.close()
+
+# Endpoint to search a directory tree recursively
+@router.get(
+    "/search",
+    summary="Search a directory tree",
+    description=(
+        "Walks the tree under path on several threads and streams matching entries as newline-delimited "
+        "JSON 'match' frames while it runs, followed by a 'done' frame with totals. Entries can be filtered "
+        "by name glob, path regex, type, size and modification time. Excluded directory names are not "
+        "descended into. The walk stops once limit matches were sent."
+    ),
+    response_class=StreamingResponse,
+    responses={200: {"content": {SEARCH_MEDIA_TYPE: {}}}},
+)
+async def search_files(
+    path: str,
+    pattern: Optional[str] = Query(None, description="Glob matched against entry names, e.g. '*.log'."),
+    regex: Optional[str] = Query(None, description="Regular expression searched in paths relative to path."),
+    type: Optional[List[str]] = Query(None, description="Entry types to include; repeat for several."),
+    min_size: Optional[int] = Query(None, ge=0, description="Minimum size in bytes."),
+    max_size: Optional[int] = Query(None, ge=0, description="Maximum size in bytes."),
+    modified_after: Optional[datetime.datetime] = None,
+    modified_before: Optional[datetime.datetime] = None,
+    include_hidden: bool = True,
+    exclude: Optional[List[str]] = Query(
+        None, description=f"Directory names to skip; defaults to {', '.join(DEFAULT_EXCLUDES)}. Pass an empty value to skip none."
+    ),
+    max_depth: Optional[int] = Query(None, ge=0, description="Levels below path to descend; 0 searches path only."),
+    limit: int = Query(10000, ge=1, le=1000000, description="Maximum matches to return."),
+    workers: int = Query(DEFAULT_WORKERS, ge=1, le=MAX_WORKERS, description="Directories scanned in parallel.")
+) -> StreamingResponse:
+    """Streams entries under a directory that match the filters."""
+    if not os.path.isdir(path):
+        logger.warning(f"Search failed - path is not a directory or does not exist: {path}")
+        raise HTTPException(status_code=400, detail="Path is not a directory or does not exist")
+    if type and any(kind not in ENTRY_TYPES for kind in type):
+        raise HTTPException(status_code=400, detail=f"type must be one of {', '.join(ENTRY_TYPES)}.")
+    try:
+        criteria = SearchCriteria(
+            pattern=pattern, regex=regex, types=type, min_size=min_size, max_size=max_size,
+            modified_after=modified_after.timestamp() if modified_after else None,
+            modified_before=modified_before.timestamp() if modified_before else None
+        )
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid regex: {e}")
+
+    search = TreeSearch(
+        os.path.abspath(path), criteria,
+        exclude=DEFAULT_EXCLUDES if exclude is None else [name for name in exclude if name],
+        include_hidden=include_hidden, max_depth=max_depth, max_results=limit, workers=workers
+    )
+    search.start()
+    logger.info(f"Searching under {path} with {workers} worker(s)")
+    return StreamingResponse(
+        search_frames(search), media_type=SEARCH_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Endpoint to read a file
 @router.get("/read-file")
 async def read_file(path: str):
@@ -90,6 +271,75 @@ async def read_file(path: str):
         logger.error(f"Unexpected error reading file at {path}: {e}")
         raise HTTPException(status_code=500, detail=f"Error reading file: {str(e)}")
 
+# Endpoint to download a file, or part of it, as raw bytes
+@router.get(
+    "/download",
+    response_class=StreamingResponse,
+    summary="Download a file",
+    description=(
+        "Streams a file as raw bytes in constant memory. Supports a single-range HTTP Range header "
+        "(e.g. 'bytes=-1048576' for the last MiB), or offset/length to select a window."
+    ),
+    responses={
+        200: {"content": {DOWNLOAD_MEDIA_TYPE: {}}, "description": "The file, or the offset/length window of it."},
+        206: {"content": {DOWNLOAD_MEDIA_TYPE: {}}, "description": "The requested range."},
+        416: {"description": "The range or offset starts past the end of the file."},
+    },
+)
+async def download_file(
+    path: str,
+    http_request: Request,
+    offset: int = Query(0, ge=0, description="First byte to send."),
+    length: Optional[int] = Query(None, ge=0, description="Bytes to send at most; the rest of the file if omitted.")
+):
+    """Streams a file's bytes, honouring Range or offset/length."""
+    range_header = http_request.headers.get("range")
+    if range_header and (offset or length is not None):
+        raise HTTPException(status_code=400, detail="Use either a Range header or offset/length, not both.")
+    try:
+        file = open(path, "rb", buffering=0)
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        logger.warning(f"Download failed - path is not a file or does not exist: {path}")
+        raise HTTPException(status_code=400, detail="Path is not a file or does not exist")
+    except PermissionError as e:
+        logger.error(f"Permission denied when downloading file at {path}: {e}")
+        raise HTTPException(status_code=403, detail=f"Permission denied: {str(e)}")
+
+    try:
+        # fstat the open file, so size and validators match the bytes we send
+        stats = os.fstat(file.fileno())
+        if not stat.S_ISREG(stats.st_mode):
+            raise HTTPException(status_code=400, detail="Path is not a file or does not exist")
+        size = stats.st_size
+        validators = validator_headers(stats)
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Content-Disposition": content_disposition(os.path.basename(path)),
+            **validators,
+        }
+        start, end, status_code = offset, size if length is None else min(size, offset + length), 200
+        if_range = http_request.headers.get("if-range")
+        if range_header and if_range in (None, validators["ETag"], validators["Last-Modified"]):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                raise HTTPException(status_code=416, detail="Range not satisfiable.",
+                                    headers={"Content-Range": f"bytes */{size}"})
+            if byte_range is not None:
+                start, end, status_code = byte_range[0], byte_range[1] + 1, 206
+                headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        elif offset > size:
+            raise HTTPException(status_code=416, detail="Offset is past the end of the file.",
+                                headers={"Content-Range": f"bytes */{size}"})
+        logger.info(f"Downloading {path}: {end - start} bytes from offset {start} of {size}")
+        return FileRangeResponse(
+            file, start, end - start, status_code=status_code, headers=headers,
+            media_type=mimetypes.guess_type(path)[0] or DOWNLOAD_MEDIA_TYPE
+        )
+    except BaseException:
+        file.close()
+        raise
+
 # Model for write file request
 class FileWriteRequest(BaseModel):
     path: str
@@ -97,11 +347,12 @@ class FileWriteRequest(BaseModel):
 
 # Endpoint to write to a file
 @router.post("/write-file")
-async def write_file(request: FileWriteRequest):
+async def write_file(request: FileWriteRequest, fs_cache: FilesystemCache = Depends(get_fs_cache)):
     """Writes content to a specified file."""
     try:
         with open(request.path, 'w') as file:
             file.write(request.content)
+        fs_cache.invalidate(request.path)
         logger.info(f"Wrote to file at path: {request.path}")
         return {"message": f"File written at {request.path}"}
     except PermissionError as e:
@@ -111,23 +362,121 @@ async def write_file(request: FileWriteRequest):
         logger.error(f"Unexpected error writing file at {request.path}: {e}")
         raise HTTPException(status_code=500, detail=f"Error writing file: {str(e)}")
 
+def write_chunk(file, digest, data):
+    file.write(data)
+    digest.update(data)
+
+def finish_upload(file, temp_path, path):
+    """Flush the temp file to disk and rename it over the target, then persist the rename."""
+    file.flush()
+    os.fsync(file.fileno())
+    file.close()
+    os.replace(temp_path, path)
+    if hasattr(os, "O_DIRECTORY"):
+        directory = os.open(os.path.dirname(path), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+# Endpoint to upload a file as a raw request body
+@router.put(
+    "/upload",
+    summary="Upload a file",
+    description=(
+        "Streams the raw request body to a temporary file next to the target, fsyncs it and renames it "
+        "over the target, so readers never see a partial file. With sha256, the upload is rejected "
+        "unless the body matches that checksum."
+    ),
+    openapi_extra={"requestBody": {"content": {DOWNLOAD_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}}}}},
+)
+async def upload_file(
+    path: str,
+    http_request: Request,
+    sha256: Optional[str] = Query(None, description="Expected SHA-256 of the body, hex-encoded."),
+    overwrite: bool = Query(True, description="Replace the file if it exists; 409 otherwise."),
+    fs_cache: FilesystemCache = Depends(get_fs_cache)
+):
+    """Writes the request body to a file atomically."""
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        raise HTTPException(status_code=400, detail="Parent directory does not exist")
+    if os.path.isdir(path):
+        raise HTTPException(status_code=400, detail="Path is a directory")
+    if not overwrite and os.path.exists(path):
+        raise HTTPException(status_code=409, detail="File already exists")
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".upload")
+    except PermissionError as e:
+        logger.error(f"Permission denied when uploading file to {path}: {e}")
+        raise HTTPException(status_code=403, detail=f"Permission denied: {str(e)}")
+
+    loop = asyncio.get_running_loop()
+    file = os.fdopen(fd, "wb")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        try:
+            existing_mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            existing_mode = 0o666 & ~UMASK
+        os.chmod(temp_path, existing_mode)
+
+        # Hashing and disk writes run on a worker thread, a buffer at a time
+        buffer = bytearray()
+        async for chunk in http_request.stream():
+            buffer += chunk
+            if len(buffer) >= UPLOAD_WRITE_SIZE:
+                await loop.run_in_executor(None, write_chunk, file, digest, bytes(buffer))
+                size += len(buffer)
+                buffer.clear()
+        await loop.run_in_executor(None, write_chunk, file, digest, bytes(buffer))
+        size += len(buffer)
+
+        checksum = digest.hexdigest()
+        if sha256 is not None and sha256.strip().lower() != checksum:
+            logger.warning(f"Upload to {path} rejected: checksum mismatch")
+            raise HTTPException(status_code=400, detail=f"Checksum mismatch: received body has SHA-256 {checksum}")
+        await loop.run_in_executor(None, finish_upload, file, temp_path, path)
+    except BaseException as e:
+        file.close()
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        if isinstance(e, ClientDisconnect):
+            logger.warning(f"Upload to {path} aborted by the client after {size} bytes")
+            raise HTTPException(status_code=400, detail="Upload aborted before the body was complete")
+        if isinstance(e, PermissionError):
+            logger.error(f"Permission denied when uploading file to {path}: {e}")
+            raise HTTPException(status_code=403, detail=f"Permission denied: {str(e)}")
+        if isinstance(e, OSError):
+            logger.error(f"Unexpected error uploading file to {path}: {e}")
+            raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
+        raise
+
+    fs_cache.invalidate(path)
+    logger.info(f"Uploaded {size} bytes to {path}")
+    return {"message": f"File written at {path}", "path": path, "size": size, "sha256": checksum}
+
 # Endpoint to get metadata for a file or directory
 @router.get("/metadata")
-async def get_metadata(path: str):
+async def get_metadata(path: str, fs_cache: FilesystemCache = Depends(get_fs_cache)):
     """Retrieves metadata for a file or directory."""
-    if not os.path.exists(path):
-        logger.warning(f"Metadata request failed - path does not exist: {path}")
-        raise HTTPException(status_code=404, detail="Path does not exist")
     try:
-        stats = os.stat(path)
+        stats = fs_cache.stat(path)
         metadata = {
             "size": stats.st_size,
             "modified": datetime.datetime.fromtimestamp(stats.st_mtime).isoformat(),
             "created": datetime.datetime.fromtimestamp(stats.st_ctime).isoformat(),
-            "is_directory": os.path.isdir(path),
+            "is_directory": stat.S_ISDIR(stats.st_mode),
         }
         logger.info(f"Retrieved metadata for path: {path}")
         return {"metadata": metadata}
+    except (FileNotFoundError, NotADirectoryError):
+        logger.warning(f"Metadata request failed - path does not exist: {path}")
+        raise HTTPException(status_code=404, detail="Path does not exist")
     except PermissionError as e:
         logger.error(f"Permission denied when accessing metadata at {path}: {e}")
         raise HTTPException(status_code=403, detail=f"Permission denied: {str(e)}")
@@ -135,3 +484,37 @@ async def get_metadata(path: str):
         logger.error(f"Unexpected error retrieving metadata at {path}: {e}")
         raise HTTPException(status_code=500, detail=f"Error retrieving metadata: {str(e)}")
 
+class FilesystemCacheStats(BaseModel):
+    mode: str = Field(..., description="'inotify', or 'ttl' when inotify is unavailable.")
+    directories: int
+    max_directories: int
+    items: int = Field(..., description="Cached listing entries plus stat results.")
+    max_items: int
+    watches: int = Field(..., description="inotify watches held, including those on ancestor directories.")
+    ttl_directories: int = Field(..., description="Cached directories that expire instead of being watched.")
+    hits: int
+    misses: int
+    hit_rate: float
+    invalidations: int
+    evictions: int
+    expirations: int
+    watch_failures: int
+    overflows: int
+
+@router.get(
+    "/cache",
+    response_model=FilesystemCacheStats,
+    summary="Get Filesystem Cache Metrics",
+    description="Reports cached directories, inotify watches, hits, misses and invalidations of the listing and stat cache.",
+)
+async def get_fs_cache_stats(fs_cache: FilesystemCache = Depends(get_fs_cache)) -> FilesystemCacheStats:
+    return FilesystemCacheStats(**fs_cache.stats())
+
+@router.delete(
+    "/cache",
+    summary="Clear Filesystem Cache",
+    description="Drops every cached listing and stat result and releases their inotify watches.",
+)
+async def clear_fs_cache(fs_cache: FilesystemCache = Depends(get_fs_cache)):
+    fs_cache.clear()
+    return {"message": "Cache cleared."}
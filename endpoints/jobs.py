@@ -0,0 +1,285 @@
+# jobs.py
+import asyncio
+import logging
+import shlex
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from endpoints.commands import (
+    CommandRequest, CommandResponse, CommandHistory, CaptureStore,
+    get_command_history, get_capture_store, client_identity, run_captured
+)
+from utils.process_tree import NEW_SESSION, KILL_GRACE_SECONDS, signal_process_tree
+
+# Initialize router
+router = APIRouter()
+logger = logging.getLogger("uvicorn")
+
+# Constants
+MAX_RUNNING_JOBS = 4  # Jobs whose commands run at once; the rest wait in the registry
+MAX_JOBS = 10000  # Jobs kept in memory, finished or not
+RESULT_TTL_SECONDS = 3600  # Finished jobs are forgotten this long after they finish
+FINISHED_STATES = ("succeeded", "failed", "cancelled", "error")
+EXPIRY_SWEEP_SECONDS = 1.0  # Minimum time between TTL sweeps of the job table
+
+# Models for request and response
+class JobInfo(BaseModel):
+    job_id: str
+    command: str
+    status: str = Field(..., description="'queued', 'running', 'succeeded', 'failed', 'cancelled' or 'error'.")
+    detail: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    exit_code: Optional[int] = None
+
+class JobListResponse(BaseModel):
+    jobs: List[JobInfo] = Field(..., description="Jobs, most recently submitted first.")
+    total: int = Field(..., description="Jobs matching the filter before the limit was applied.")
+
+class Job:
+    """One submitted command and, once finished, its result."""
+
+    def __init__(self, command: str, client_id: str, head_bytes: int, tail_bytes: int, timeout: float):
+        self.job_id = uuid.uuid4().hex
+        self.command = command
+        self.client_id = client_id
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.timeout = timeout
+        self.status = "queued"
+        self.detail = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.finished_monotonic = None
+        self.result: Optional[CommandResponse] = None
+        self.process = None
+        self.task = None
+        self.cancel_requested = False
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def finish(self, status: str, detail: Optional[str] = None):
+        self.status = status
+        self.detail = detail
+        self.finished_at = datetime.now()
+        self.finished_monotonic = time.monotonic()
+        self.process = None
+
+    def info(self) -> JobInfo:
+        return JobInfo(
+            job_id=self.job_id, command=self.command, status=self.status, detail=self.detail,
+            created_at=self.created_at, started_at=self.started_at, finished_at=self.finished_at,
+            exit_code=self.result.resources.exit_code if self.result and self.result.resources else None
+        )
+
+class JobRegistry:
+    """Bounded in-memory job table. Finished jobs expire by TTL, then least recently used first."""
+
+    def __init__(self, max_running: int = MAX_RUNNING_JOBS, max_jobs: int = MAX_JOBS,
+                 result_ttl: float = RESULT_TTL_SECONDS):
+        self.max_running = max_running
+        self.max_jobs = max_jobs
+        self.result_ttl = result_ttl
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()  # Least recently used first
+        self.slots = None  # Created on first use so it binds to the running loop
+        self.last_sweep = 0.0
+
+    def evict(self):
+        """Drop expired finished jobs, then the least recently used ones while over capacity."""
+        now = time.monotonic()
+        if now - self.last_sweep >= EXPIRY_SWEEP_SECONDS:
+            self.last_sweep = now
+            cutoff = now - self.result_ttl
+            for job_id, job in list(self.jobs.items()):
+                if job.finished and job.finished_monotonic < cutoff:
+                    del self.jobs[job_id]
+        if len(self.jobs) >= self.max_jobs:
+            for job_id, job in list(self.jobs.items()):
+                if job.finished:
+                    del self.jobs[job_id]
+                    if len(self.jobs) < self.max_jobs:
+                        break
+
+    def submit(self, job: Job, captures: CaptureStore) -> bool:
+        """Register and start a job. Returns False if the registry is full of unfinished jobs."""
+        self.evict()
+        if len(self.jobs) >= self.max_jobs:
+            return False
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_running)
+        self.jobs[job.job_id] = job
+        job.task = asyncio.ensure_future(self.run(job, captures))
+        return True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self.evict()
+        job = self.jobs.get(job_id)
+        if job is not None:
+            self.jobs.move_to_end(job_id)
+        return job
+
+    def list(self, status: Optional[str] = None) -> List[Job]:
+        self.evict()
+        # self.jobs is in LRU order (get() moves a job to the end), so sort by submission time
+        jobs = sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+        return [job for job in jobs if status is None or job.status == status]
+
+    def remove(self, job_id: str):
+        self.jobs.pop(job_id, None)
+
+    async def run(self, job: Job, captures: CaptureStore):
+        def on_start(process):
+            # Called on the worker thread right after the child is launched
+            job.process = process
+            if job.cancel_requested:
+                signal_process_tree(process)
+
+        try:
+            async with self.slots:
+                if job.cancel_requested:
+                    job.finish("cancelled")
+                    return
+                job.status = "running"
+                job.started_at = datetime.now()
+                args = shlex.split(job.command)
+                job.result = await run_captured(
+                    args, job.command, job.head_bytes, job.tail_bytes, captures,
+                    source="job", timeout=job.timeout, on_start=on_start, **NEW_SESSION
+                )
+            if job.cancel_requested:
+                job.finish("cancelled")
+            elif job.result.timed_out:
+                job.finish("failed", f"Timed out after {job.timeout} s.")
+            else:
+                job.finish("succeeded" if job.result.resources.exit_code == 0 else "failed")
+        except asyncio.CancelledError:
+            job.finish("cancelled")
+            raise
+        except FileNotFoundError:
+            job.finish("error", "Command not found.")
+        except ValueError as e:
+            job.finish("error", f"Invalid command: {e}")
+        except Exception as e:
+            logger.exception(f"Job {job.job_id} failed: {e}")
+            job.finish("error", "Internal Server Error.")
+        logger.info(f"Job {job.job_id} {job.status}")
+
+    def cancel(self, job: Job):
+        """Cancel a queued job, or kill a running job's process tree (SIGKILL after a grace period)."""
+        job.cancel_requested = True
+        if job.status == "queued":
+            job.task.cancel()
+            return
+        process = job.process
+        if process is not None and signal_process_tree(process):
+            def escalate():
+                if job.process is process:
+                    logger.warning(f"Job {job.job_id} ignored SIGTERM; killing it")
+                    signal_process_tree(process, force=True)
+            asyncio.get_running_loop().call_later(KILL_GRACE_SECONDS, escalate)
+
+# Dependency for the job registry
+job_registry_instance = JobRegistry()
+
+def get_job_registry() -> JobRegistry:
+    return job_registry_instance
+
+def get_job_or_404(job_id: str, registry: JobRegistry) -> Job:
+    job = registry.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return job
+
+@router.post(
+    "",
+    response_model=JobInfo,
+    status_code=202,
+    summary="Submit a command job",
+    description="Starts a command in the background and returns its job ID immediately.",
+)
+async def submit_job(
+    request: CommandRequest,
+    http_request: Request,
+    registry: JobRegistry = Depends(get_job_registry),
+    history: CommandHistory = Depends(get_command_history),
+    captures: CaptureStore = Depends(get_capture_store)
+) -> JobInfo:
+    job = Job(request.command, client_identity(http_request), request.head_bytes, request.tail_bytes,
+              request.timeout)
+    if not registry.submit(job, captures):
+        raise HTTPException(status_code=503, detail="Too many unfinished jobs.", headers={"Retry-After": "30"})
+    await history.add_command(request.command)
+    logger.info(f"Submitted job {job.job_id}: {request.command}")
+    return job.info()
+
+@router.get(
+    "",
+    response_model=JobListResponse,
+    summary="List jobs",
+    description="Lists known jobs, most recently submitted first, optionally filtered by status.",
+)
+async def list_jobs(
+    status: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    registry: JobRegistry = Depends(get_job_registry)
+) -> JobListResponse:
+    jobs = registry.list(status)
+    return JobListResponse(jobs=[job.info() for job in jobs[:limit]], total=len(jobs))
+
+@router.get(
+    "/{job_id}",
+    response_model=JobInfo,
+    summary="Get job status",
+    description="Retrieves the status of a job.",
+)
+async def get_job(job_id: str, registry: JobRegistry = Depends(get_job_registry)) -> JobInfo:
+    return get_job_or_404(job_id, registry).info()
+
+@router.get(
+    "/{job_id}/result",
+    response_model=CommandResponse,
+    summary="Get job result",
+    description="Retrieves the output of a finished job. Returns 409 while the job is still queued or running.",
+)
+async def get_job_result(job_id: str, registry: JobRegistry = Depends(get_job_registry)) -> CommandResponse:
+    job = get_job_or_404(job_id, registry)
+    if not job.finished:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}.")
+    if job.result is None:
+        raise HTTPException(status_code=409, detail=job.detail or f"Job {job.status} without output.")
+    return job.result
+
+@router.post(
+    "/{job_id}/cancel",
+    response_model=JobInfo,
+    summary="Cancel a job",
+    description="Cancels a queued job, or terminates a running job's whole process tree.",
+)
+async def cancel_job(job_id: str, registry: JobRegistry = Depends(get_job_registry)) -> JobInfo:
+    job = get_job_or_404(job_id, registry)
+    if job.finished:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}.")
+    registry.cancel(job)
+    logger.info(f"Cancelling job {job.job_id}")
+    return job.info()
+
+@router.delete(
+    "/{job_id}",
+    summary="Delete a job",
+    description="Forgets a finished job and its result before it expires.",
+)
+async def delete_job(job_id: str, registry: JobRegistry = Depends(get_job_registry)):
+    job = get_job_or_404(job_id, registry)
+    if not job.finished:
+        raise HTTPException(status_code=409, detail="Cancel the job before deleting it.")
+    registry.remove(job_id)
+    return {"message": "Job deleted."}
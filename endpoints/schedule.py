@@ -0,0 +1,336 @@
+# endpoints/schedule.py
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel, Field
+
+from scheduler.engine import create_task, update_task, resume_task_state, DEFAULT_MISFIRE_MAX_RUNS
+from scheduler.history import RunHistory
+from scheduler.store import TaskStore
+
+# Initialize router
+router = APIRouter()
+logger = logging.getLogger("uvicorn")
+
+# Constants
+MAX_BULK_TASKS = 10000  # Maximum number of tasks accepted in one bulk request
+MAX_PAGE_SIZE = 1000  # Maximum number of tasks returned per page
+DEFAULT_STATS_WINDOW = timedelta(hours=24)  # Window used when a stats query gives no 'since'
+
+# Models for request and response
+class SaveOutput(BaseModel):
+    enabled: bool = False
+    method: Optional[str] = Field(None, description="'single_file' or 'separate_files'.")
+    path: Optional[str] = Field(None, description="Output file or directory.")
+    compression: Optional[str] = Field(None, description="'gzip', 'zstd' or 'none' for finished segments.")
+    max_bytes: Optional[int] = Field(None, description="single_file: rotate once the file reaches this size.")
+    rotate_seconds: Optional[int] = Field(None, description="single_file: rotate once the file is this old.")
+    backup_count: Optional[int] = Field(None, description="single_file: rotated segments to keep.")
+    max_files: Optional[int] = Field(None, description="separate_files: run files to keep per task.")
+    max_age_days: Optional[float] = Field(None, description="Delete finished output older than this.")
+
+class TaskSpec(BaseModel):
+    task_name: str = Field(..., example="nightly-backup")
+    command: str = Field(..., example="tar czf /backups/home.tgz /home/user")
+    schedule_type: str = Field(..., example="Cron", description="One-time, Recurring, Interval or Cron.")
+    working_directory: Optional[str] = None
+    close_after: Optional[int] = Field(None, description="Remove the task after this many runs.")
+    save_output: Optional[SaveOutput] = None
+    run_at: Optional[datetime] = Field(None, description="One-time: when to run.")
+    frequency: Optional[str] = Field(None, description="Recurring: Daily, Weekly or Monthly.")
+    time_of_day: Optional[str] = Field(None, example="02:30", description="Recurring: HH:MM.")
+    days_of_week: Optional[List[str]] = Field(None, description="Recurring Weekly: day names.")
+    day_of_month: Optional[int] = Field(None, ge=1, le=31, description="Recurring Monthly: day to run; defaults to today.")
+    interval_seconds: Optional[int] = Field(None, description="Interval: seconds between runs.")
+    cron_expression: Optional[str] = Field(None, example="30 2 * * *", description="Cron: five-field expression.")
+    misfire_policy: str = Field("run_once", description="run_once, skip or run_all.")
+    misfire_max_runs: int = Field(DEFAULT_MISFIRE_MAX_RUNS, description="Cap on catch-up runs for run_all.")
+
+class TaskUpdate(BaseModel):
+    task_id: str
+    task_name: Optional[str] = None
+    command: Optional[str] = None
+    schedule_type: Optional[str] = None
+    working_directory: Optional[str] = None
+    close_after: Optional[int] = None
+    save_output: Optional[SaveOutput] = None
+    run_at: Optional[datetime] = None
+    frequency: Optional[str] = None
+    time_of_day: Optional[str] = None
+    days_of_week: Optional[List[str]] = None
+    day_of_month: Optional[int] = Field(None, ge=1, le=31)
+    interval_seconds: Optional[int] = None
+    cron_expression: Optional[str] = None
+    misfire_policy: Optional[str] = None
+    misfire_max_runs: Optional[int] = None
+
+class BulkCreateRequest(BaseModel):
+    tasks: List[TaskSpec] = Field(..., description="Tasks to create; all are validated before any is stored.")
+
+class BulkUpdateRequest(BaseModel):
+    updates: List[TaskUpdate] = Field(..., description="Fields to change per task; omitted fields are kept.")
+
+class TaskIdsRequest(BaseModel):
+    task_ids: List[str] = Field(..., description="IDs of the tasks to act on.")
+
+class TaskListResponse(BaseModel):
+    tasks: List[dict] = Field(..., description="Tasks ordered by next run time.")
+    next_cursor: Optional[str] = Field(None, description="Pass as 'cursor' to fetch the next page.")
+
+class RunRecord(BaseModel):
+    run_id: int
+    task_id: str
+    task_name: str
+    started_at: datetime
+    finished_at: datetime
+    duration: float = Field(..., description="Seconds from start to exit.")
+    status: str = Field(..., description=(
+        "'success', 'failed' (non-zero exit), 'error' (could not run) or 'output_error' (ran, but its output "
+        "could not be saved)."
+    ))
+    exit_code: Optional[int] = None
+    output_path: Optional[str] = Field(None, description="Where the run's output was saved, if anywhere.")
+
+class RunListResponse(BaseModel):
+    runs: List[RunRecord] = Field(..., description="Runs newest first.")
+
+class TaskRunStats(BaseModel):
+    task_id: str
+    task_name: Optional[str] = None
+    runs: int
+    failures: int
+    failure_rate: Optional[float] = None
+    p50_seconds: Optional[float] = None
+    p95_seconds: Optional[float] = None
+    p99_seconds: Optional[float] = None
+    max_seconds: Optional[float] = None
+
+class BulkResultResponse(BaseModel):
+    task_ids: List[str] = Field(..., description="IDs of the tasks that were changed.")
+    missing: List[str] = Field(default_factory=list, description="Requested IDs that do not exist.")
+
+# Dependency for the task store shared with the Schedule Manager and scheduler service
+task_store_instance = None
+
+def get_task_store() -> TaskStore:
+    global task_store_instance
+    if task_store_instance is None:
+        task_store_instance = TaskStore()
+    return task_store_instance
+
+# Dependency for the run history written by the scheduler
+run_history_instance = None
+
+def get_run_history() -> RunHistory:
+    global run_history_instance
+    if run_history_instance is None:
+        run_history_instance = RunHistory()
+    return run_history_instance
+
+def naive_local(value: Optional[datetime]) -> Optional[datetime]:
+    """Convert an aware datetime to the naive local time the scheduler uses."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+def stats_window(since: Optional[datetime], until: Optional[datetime]):
+    since, until = naive_local(since), naive_local(until)
+    if since is None:
+        since = (until or datetime.now()) - DEFAULT_STATS_WINDOW
+    return since, until
+
+def spec_to_kwargs(spec: Dict) -> Dict:
+    """Convert API field values to the types create_task() expects."""
+    kwargs = dict(spec)
+    if kwargs.get("time_of_day") is not None:
+        try:
+            hours, minutes = kwargs["time_of_day"].split(":")[:2]
+            kwargs["time_of_day"] = timedelta(hours=int(hours), minutes=int(minutes))
+        except ValueError:
+            raise ValueError("time_of_day must be HH:MM.")
+    kwargs["run_at"] = naive_local(kwargs.get("run_at"))
+    return kwargs
+
+def check_bulk_size(count: int):
+    if count > MAX_BULK_TASKS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_TASKS} tasks per request.")
+
+@router.get(
+    "/tasks",
+    response_model=TaskListResponse,
+    summary="List scheduled tasks",
+    description="Lists tasks ordered by next run time, with cursor pagination and optional filters.",
+)
+def list_tasks(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    schedule_type: Optional[str] = None,
+    next_run_after: Optional[datetime] = None,
+    next_run_before: Optional[datetime] = None,
+    store: TaskStore = Depends(get_task_store)
+) -> TaskListResponse:
+    try:
+        tasks, next_cursor = store.list_page(
+            limit=limit, cursor=cursor, schedule_type=schedule_type,
+            next_run_after=naive_local(next_run_after), next_run_before=naive_local(next_run_before)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return TaskListResponse(tasks=tasks, next_cursor=next_cursor)
+
+@router.get(
+    "/tasks/{task_id}",
+    summary="Get a scheduled task",
+    description="Retrieves a single scheduled task by ID.",
+)
+def get_task(task_id: str, store: TaskStore = Depends(get_task_store)):
+    task = store.get_task(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
+
+@router.get(
+    "/tasks/{task_id}/stats",
+    response_model=TaskRunStats,
+    summary="Get run statistics for a task",
+    description="Returns run count, failure rate and p50/p95/p99 durations over a window (default: last 24 hours).",
+)
+def get_task_stats(
+    task_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    history: RunHistory = Depends(get_run_history)
+) -> TaskRunStats:
+    since, until = stats_window(since, until)
+    return TaskRunStats(**history.task_stats(task_id, since=since, until=until))
+
+@router.get(
+    "/runs",
+    response_model=RunListResponse,
+    summary="List task runs",
+    description="Lists recorded task runs newest first, optionally for one task and time window.",
+)
+def list_runs(
+    task_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    history: RunHistory = Depends(get_run_history)
+) -> RunListResponse:
+    runs = history.list_runs(task_id=task_id, since=naive_local(since), until=naive_local(until), limit=limit)
+    return RunListResponse(runs=runs)
+
+@router.get(
+    "/stats",
+    response_model=List[TaskRunStats],
+    summary="Get run statistics for all tasks",
+    description="Returns per-task run statistics over a window (default: last 24 hours), most failures first.",
+)
+def get_all_task_stats(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    history: RunHistory = Depends(get_run_history)
+) -> List[TaskRunStats]:
+    since, until = stats_window(since, until)
+    return [TaskRunStats(**entry) for entry in history.all_task_stats(since=since, until=until)]
+
+@router.post(
+    "/tasks/bulk-create",
+    response_model=BulkResultResponse,
+    summary="Create scheduled tasks in bulk",
+    description="Validates every task, then stores them all in one transaction. Nothing is stored if any task is invalid.",
+)
+def bulk_create_tasks(
+    request: BulkCreateRequest,
+    store: TaskStore = Depends(get_task_store)
+) -> BulkResultResponse:
+    check_bulk_size(len(request.tasks))
+    tasks, errors = [], []
+    for index, spec in enumerate(request.tasks):
+        try:
+            tasks.append(create_task(**spec_to_kwargs(spec.model_dump())))
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    store.write_batch(tasks)
+    logger.info(f"Created {len(tasks)} scheduled task(s)")
+    return BulkResultResponse(task_ids=[task["task_id"] for task in tasks])
+
+@router.post(
+    "/tasks/bulk-update",
+    response_model=BulkResultResponse,
+    summary="Update scheduled tasks in bulk",
+    description="Applies partial updates to many tasks in one transaction. Nothing is changed if any update is invalid.",
+)
+def bulk_update_tasks(
+    request: BulkUpdateRequest,
+    store: TaskStore = Depends(get_task_store)
+) -> BulkResultResponse:
+    check_bulk_size(len(request.updates))
+    changes_by_id = {}
+    for update in request.updates:
+        changes = update.model_dump(exclude_unset=True)
+        task_id = changes.pop("task_id")
+        try:
+            changes_by_id[task_id] = spec_to_kwargs(changes)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+    def apply(task):
+        return update_task(task, changes_by_id[task["task_id"]])
+
+    try:
+        updated, missing = store.update_tasks(list(changes_by_id), apply)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    logger.info(f"Updated {len(updated)} scheduled task(s)")
+    return BulkResultResponse(task_ids=[task["task_id"] for task in updated], missing=missing)
+
+@router.post(
+    "/tasks/bulk-delete",
+    response_model=BulkResultResponse,
+    summary="Delete scheduled tasks in bulk",
+    description="Deletes many tasks in one transaction.",
+)
+def bulk_delete_tasks(
+    request: TaskIdsRequest,
+    store: TaskStore = Depends(get_task_store)
+) -> BulkResultResponse:
+    check_bulk_size(len(request.task_ids))
+    missing = set(store.update_tasks(request.task_ids, lambda task: None)[1])
+    deleted = [task_id for task_id in dict.fromkeys(request.task_ids) if task_id not in missing]
+    logger.info(f"Deleted {len(deleted)} scheduled task(s)")
+    return BulkResultResponse(task_ids=deleted, missing=sorted(missing))
+
+@router.post(
+    "/tasks/pause",
+    response_model=BulkResultResponse,
+    summary="Pause scheduled tasks",
+    description="Stops the given tasks from running until they are resumed.",
+)
+def pause_tasks(
+    request: TaskIdsRequest,
+    store: TaskStore = Depends(get_task_store)
+) -> BulkResultResponse:
+    check_bulk_size(len(request.task_ids))
+    updated, missing = store.update_tasks(request.task_ids, lambda task: {**task, "paused": True})
+    return BulkResultResponse(task_ids=[task["task_id"] for task in updated], missing=missing)
+
+@router.post(
+    "/tasks/resume",
+    response_model=BulkResultResponse,
+    summary="Resume scheduled tasks",
+    description="Resumes paused tasks, skipping runs that fell due while they were paused.",
+)
+def resume_tasks(
+    request: TaskIdsRequest,
+    store: TaskStore = Depends(get_task_store)
+) -> BulkResultResponse:
+    check_bulk_size(len(request.task_ids))
+    now = datetime.now()
+    updated, missing = store.update_tasks(
+        request.task_ids, lambda task: resume_task_state(task, now) if task.get("paused") else task
+    )
+    return BulkResultResponse(task_ids=[task["task_id"] for task in updated], missing=missing)
@@ -1,21 +1,22 @@
 # main.py
 import logging
 from fastapi import FastAPI
-from endpoints import commands, filesystem, network, processes
+from endpoints import commands, filesystem, jobs, network, processes, schedule
+from utils.logging_setup import setup_logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+# Log through a background writer; uvicorn's own loggers are rerouted through it too
+setup_logging("api", capture=("uvicorn", "uvicorn.access"))
 
 # Initialize the app
 app = FastAPI(title="SITS API")
 
 # Include routes
 app.include_router(commands.router, prefix="/commands", tags=["Commands"])
+app.include_router(jobs.router, prefix="/jobs", tags=["Jobs"])
 app.include_router(filesystem.router, prefix="/filesystem", tags=["Filesystem"])
 app.include_router(network.router, prefix="/network", tags=["Network"])
 app.include_router(processes.router, prefix="/processes", tags=["Processes"])
+app.include_router(schedule.router, prefix="/schedule", tags=["Schedule"])
 
 # Root and health check endpoints
 @app.get("/")
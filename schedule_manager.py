@@ -1,28 +1,31 @@
-import os
-import json
-import threading
-import time
 from datetime import datetime, timedelta
 from tkinter import ttk, messagebox
 import tkinter as tk
 from tkinter import filedialog
 from tkcalendar import DateEntry  # Install via 'pip install tkcalendar'
-import subprocess
+from scheduler.engine import (
+    SchedulerEngine, create_task, DAYS_OF_WEEK, SCHEDULE_TYPES, DEFAULT_MISFIRE_MAX_RUNS
+)
 
 class ScheduleManager:
-    CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config')
-    SCHEDULE_FILE = os.path.join(CONFIG_DIR, "scheduled_tasks.json") # File to persist scheduled tasks
-    
-    def __init__(self, parent_notebook):
+    """Tk view over a SchedulerEngine; all scheduling happens in the engine."""
+    # Misfire policy labels shown in the form, mapped to engine policy names
+    MISFIRE_LABELS = {
+        "Run once": "run_once",
+        "Skip": "skip",
+        f"Run all (up to {DEFAULT_MISFIRE_MAX_RUNS})": "run_all",
+    }
+
+    def __init__(self, parent_notebook, engine=None, max_workers=None):
         self.parent_notebook = parent_notebook
         self.tab = ttk.Frame(self.parent_notebook)
         self.parent_notebook.add(self.tab, text="Schedule Manager")
-        self.scheduled_tasks = []
-        self.lock = threading.Lock()
-        self.load_scheduled_tasks()
+        self.engine = engine or SchedulerEngine(max_workers=max_workers)
+        if self.engine.load_error:
+            messagebox.showerror("Error", "Failed to load scheduled tasks.")
         self.create_widgets()
-        self.scheduler_thread = threading.Thread(target=self.run_scheduler, daemon=True)
-        self.scheduler_thread.start()
+        self.engine.add_listener(self.handle_engine_event)
+        self.engine.start()
 
     def create_widgets(self):
         """Set up UI components for the Schedule Manager tab."""
@@ -58,7 +61,7 @@ class ScheduleManager:
 
         # Schedule Type
         ttk.Label(frame, text="Schedule Type:").grid(row=3, column=0, padx=5, pady=5, sticky='e')
-        self.schedule_type = ttk.Combobox(frame, values=["One-time", "Recurring", "Interval"], state="readonly")
+        self.schedule_type = ttk.Combobox(frame, values=list(SCHEDULE_TYPES), state="readonly")
         self.schedule_type.current(0)  # Default to "One-time"
         self.schedule_type.grid(row=3, column=1, padx=5, pady=5, sticky='w')
         self.schedule_type.bind("<<ComboboxSelected>>", self.update_schedule_type)
@@ -71,6 +74,7 @@ class ScheduleManager:
         self.init_one_time_frame()
         self.init_recurring_frame()
         self.init_interval_frame()
+        self.init_cron_frame()
 
         # Show default schedule type frame
         self.one_time_frame.pack(fill='x', expand=True)
@@ -104,12 +108,19 @@ class ScheduleManager:
         self.output_path_entry = ttk.Entry(frame, width=50)
         self.output_path_browse_button = ttk.Button(frame, text="Browse", command=self.browse_output_path)
 
+        # Misfire Policy
+        ttk.Label(frame, text="If Missed:").grid(row=9, column=0, padx=5, pady=5, sticky='e')
+        self.misfire_policy = ttk.Combobox(frame, values=list(self.MISFIRE_LABELS), state="readonly")
+        self.misfire_policy.current(0)  # Default to "Run once"
+        self.misfire_policy.grid(row=9, column=1, padx=5, pady=5, sticky='w')
+
         # Add Task Button
         self.add_task_button = ttk.Button(frame, text="Add Task", command=self.add_task)
-        self.add_task_button.grid(row=9, column=2, pady=10, sticky='e')
+        self.add_task_button.grid(row=10, column=2, pady=10, sticky='e')
 
         # Task List
-        columns = ("Task", "Type", "Next Run", "Command", "Working Directory", "Schedule Details", "Close After", "Save Output")
+        columns = ("Task", "Type", "Next Run", "Command", "Working Directory", "Schedule Details", "Close After", "Save Output", "Status",
+                   "Last Run", "CPU Total (s)", "Peak RSS (MB)")
         self.task_list = ttk.Treeview(main_frame, columns=columns, show='headings')
         for col in columns:
             self.task_list.heading(col, text=col)
@@ -124,9 +135,21 @@ class ScheduleManager:
         # Populate task list
         self.populate_task_list()
 
-        # Delete Task Button
-        self.delete_task_button = ttk.Button(main_frame, text="Delete Selected Task", command=self.delete_task)
-        self.delete_task_button.pack(pady=5)
+        # Task action buttons
+        task_buttons_frame = ttk.Frame(main_frame)
+        task_buttons_frame.pack(pady=5)
+        self.delete_task_button = ttk.Button(task_buttons_frame, text="Delete Selected Task", command=self.delete_task)
+        self.delete_task_button.pack(side='left', padx=5)
+        self.pause_task_button = ttk.Button(task_buttons_frame, text="Pause/Resume Selected Task", command=self.toggle_pause_task)
+        self.pause_task_button.pack(side='left', padx=5)
+
+        # Worker pool status
+        self.pool_status_label = ttk.Label(main_frame, text="")
+        self.pool_status_label.pack(pady=5)
+
+        # Shown when another scheduler process runs the tasks
+        self.dispatch_status_label = ttk.Label(main_frame, text="")
+        self.dispatch_status_label.pack(pady=5)
 
     def init_one_time_frame(self):
         """Initialize the one-time schedule frame."""
@@ -182,8 +205,7 @@ class ScheduleManager:
         self.weekly_days_frame = ttk.Frame(self.recurring_frame)
         self.weekly_days_frame.grid(row=2, column=0, columnspan=3, padx=5, pady=5)
         self.weekly_days_vars = []
-        days_of_week = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        for i, day in enumerate(days_of_week):
+        for i, day in enumerate(DAYS_OF_WEEK):
             var = tk.BooleanVar()
             chk = ttk.Checkbutton(self.weekly_days_frame, text=day, variable=var)
             chk.grid(row=i//4, column=i%4, sticky='w')
@@ -206,6 +228,17 @@ class ScheduleManager:
         self.interval_unit.current(0)
         self.interval_unit.grid(row=0, column=2, padx=5, pady=5, sticky='w')
 
+    def init_cron_frame(self):
+        """Initialize the cron expression schedule frame."""
+        self.cron_frame = ttk.Frame(self.schedule_details_frame)
+
+        ttk.Label(self.cron_frame, text="Cron Expression:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+        self.cron_expression_entry = ttk.Entry(self.cron_frame, width=30)
+        self.cron_expression_entry.grid(row=0, column=1, padx=5, pady=5, sticky='w')
+        ttk.Label(
+            self.cron_frame, text="minute hour day-of-month month day-of-week, e.g. */15 9-17 * * mon-fri"
+        ).grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky='w')
+
     def toggle_save_output(self):
         """Toggle the visibility of the output file selection based on the save output checkbox."""
         if self.save_output_var.get():
@@ -262,7 +295,7 @@ class ScheduleManager:
         """Show/hide schedule detail frames based on schedule type."""
         schedule_type = self.schedule_type.get()
         # Clear all frames
-        for frame in (self.one_time_frame, self.recurring_frame, self.interval_frame):
+        for frame in (self.one_time_frame, self.recurring_frame, self.interval_frame, self.cron_frame):
             frame.pack_forget()
         # Show the selected frame
         if schedule_type == "One-time":
@@ -272,6 +305,8 @@ class ScheduleManager:
             self.update_recurring_frequency()
         elif schedule_type == "Interval":
             self.interval_frame.pack(fill='x', expand=True)
+        elif schedule_type == "Cron":
+            self.cron_frame.pack(fill='x', expand=True)
 
     def update_recurring_frequency(self, event=None):
         """Show/hide weekly days selection based on frequency."""
@@ -281,31 +316,6 @@ class ScheduleManager:
         else:
             self.weekly_days_frame.grid_remove()
 
-    def load_scheduled_tasks(self):
-        """Load scheduled tasks from JSON."""
-        if os.path.exists(self.SCHEDULE_FILE):
-            try:
-                with open(self.SCHEDULE_FILE, "r") as file:
-                    self.scheduled_tasks = json.load(file)
-                # Convert next_run from string to datetime object
-                for task in self.scheduled_tasks:
-                    task["next_run"] = datetime.fromisoformat(task["next_run"])
-            except json.JSONDecodeError:
-                messagebox.showerror("Error", "Failed to load scheduled tasks.")
-                self.scheduled_tasks = []
-
-    def save_scheduled_tasks(self):
-        """Save the current list of scheduled tasks to JSON."""
-        try:
-            with open(self.SCHEDULE_FILE, "w") as file:
-                # Convert next_run to string for JSON serialization
-                tasks_to_save = [
-                    {**task, "next_run": task["next_run"].isoformat()} for task in self.scheduled_tasks
-                ]
-                json.dump(tasks_to_save, file)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save scheduled tasks:\n{str(e)}")
-
     def add_task(self):
         """Add a new task to the scheduler."""
         task_name = self.task_name_entry.get().strip()
@@ -340,128 +350,57 @@ class ScheduleManager:
             save_output["method"] = output_method
             save_output["path"] = output_path
 
-        # Prepare task dictionary
-        task = {
-            "task_name": task_name,
-            "command": command,
-            "working_directory": working_dir or None,
-            "schedule_type": schedule_type,
-            "next_run": None,  # Will be set later
-            "schedule_details": "",
-            "close_after": close_after,
-            "run_count": 0,
-            "save_output": save_output,
-        }
-
         # Schedule details based on schedule type
+        schedule = {}
         if schedule_type == "One-time":
             date = self.one_time_date.get_date()
             hour = int(self.one_time_hour.get())
             minute = int(self.one_time_minute.get())
-            run_at = datetime.combine(date, datetime.min.time()) + timedelta(hours=hour, minutes=minute)
-            if run_at <= datetime.now():
-                messagebox.showwarning("Input Error", "The scheduled time must be in the future.")
-                return
-            task["next_run"] = run_at
-            task["schedule_details"] = f"At {run_at.strftime('%Y-%m-%d %H:%M:%S')}"
+            schedule["run_at"] = datetime.combine(date, datetime.min.time()) + timedelta(hours=hour, minutes=minute)
         elif schedule_type == "Recurring":
-            frequency = self.recurring_frequency.get()
             hour = int(self.recurring_hour.get())
             minute = int(self.recurring_minute.get())
-            time_of_day = timedelta(hours=hour, minutes=minute)
-            task["frequency"] = frequency
-            task["time_of_day"] = str(time_of_day)
-
-            if frequency == "Weekly":
-                days_selected = [
-                    day for day, var in self.weekly_days_vars if var.get()
-                ]
-                if not days_selected:
-                    messagebox.showwarning("Input Error", "Please select at least one day of the week.")
-                    return
-                task["days_of_week"] = days_selected
-                task["schedule_details"] = f"Every {', '.join(days_selected)} at {hour:02d}:{minute:02d}"
-            else:
-                task["days_of_week"] = None
-                if frequency == "Daily":
-                    task["schedule_details"] = f"Daily at {hour:02d}:{minute:02d}"
-                elif frequency == "Monthly":
-                    task["schedule_details"] = f"Monthly at {hour:02d}:{minute:02d}"
-
-            # Calculate next run time
-            task["next_run"] = self.calculate_next_run(task)
+            schedule["frequency"] = self.recurring_frequency.get()
+            schedule["time_of_day"] = timedelta(hours=hour, minutes=minute)
+            schedule["days_of_week"] = [day for day, var in self.weekly_days_vars if var.get()]
         elif schedule_type == "Interval":
             interval_value = self.interval_value.get()
             if not interval_value.isdigit() or int(interval_value) <= 0:
                 messagebox.showwarning("Input Error", "Interval must be a positive integer.")
                 return
-            interval_value = int(interval_value)
+            interval_seconds = int(interval_value)
             interval_unit = self.interval_unit.get()
-            interval_seconds = interval_value
             if interval_unit == "Minutes":
                 interval_seconds *= 60
             elif interval_unit == "Hours":
                 interval_seconds *= 3600
-            task["interval_seconds"] = interval_seconds
-            task["next_run"] = datetime.now() + timedelta(seconds=interval_seconds)
-            task["schedule_details"] = f"Every {interval_value} {interval_unit.lower()}"
-        else:
-            messagebox.showwarning("Input Error", "Invalid schedule type.")
-            return
+            schedule["interval_seconds"] = interval_seconds
+        elif schedule_type == "Cron":
+            schedule["cron_expression"] = self.cron_expression_entry.get()
 
-        with self.lock:
-            self.scheduled_tasks.append(task)
-            self.save_scheduled_tasks()
+        try:
+            task = create_task(
+                task_name, command, schedule_type,
+                working_directory=working_dir, close_after=close_after,
+                save_output=save_output, misfire_policy=self.MISFIRE_LABELS[self.misfire_policy.get()],
+                **schedule
+            )
+        except ValueError as e:
+            messagebox.showwarning("Input Error", str(e))
+            return
 
-        # Update task list in GUI
-        self.task_list.insert('', 'end', values=(
-            task_name, schedule_type, task["next_run"].strftime("%Y-%m-%d %H:%M:%S"),
-            command, working_dir or "", task["schedule_details"],
-            close_after if close_after is not None else "Unlimited",
-            "Yes" if save_output_enabled else "No"
-        ))
+        # The task list row is added by the engine's task_added event
+        self.engine.add_task(task)
 
         # Clear input fields
         self.task_name_entry.delete(0, 'end')
         self.command_entry.delete(0, 'end')
         self.working_dir_entry.delete(0, 'end')
         self.close_after_entry.delete(0, 'end')
+        self.cron_expression_entry.delete(0, 'end')
         self.save_output_var.set(False)
         self.toggle_save_output()
 
-    def calculate_next_run(self, task):
-        """Calculate the next run time for recurring tasks."""
-        now = datetime.now()
-        frequency = task["frequency"]
-        time_parts = task["time_of_day"].split(":")
-        hours = int(time_parts[0])
-        minutes = int(time_parts[1])
-        time_of_day = timedelta(hours=hours, minutes=minutes)
-        next_run = datetime.combine(now.date(), datetime.min.time()) + time_of_day
-
-        if frequency == "Daily":
-            if next_run <= now:
-                next_run += timedelta(days=1)
-        elif frequency == "Weekly":
-            days_of_week = task["days_of_week"]
-            days_mapping = {
-                'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3,
-                'Friday': 4, 'Saturday': 5, 'Sunday': 6
-            }
-            today = now.weekday()
-            days_indices = [days_mapping[day] for day in days_of_week]
-            days_ahead = [(day - today) % 7 for day in days_indices]
-            days_ahead = [day if day != 0 or next_run > now else 7 for day in days_ahead]
-            min_days_ahead = min(days_ahead)
-            next_run += timedelta(days=min_days_ahead)
-        elif frequency == "Monthly":
-            day = now.day
-            if next_run <= now:
-                month = now.month + 1 if now.month < 12 else 1
-                year = now.year + 1 if month == 1 else now.year
-                next_run = datetime(year, month, day, next_run.hour, next_run.minute)
-        return next_run
-
     def delete_task(self):
         """Delete the selected task from the scheduler."""
         selected_item = self.task_list.selection()
@@ -469,139 +408,90 @@ class ScheduleManager:
             messagebox.showwarning("Selection Error", "Please select a task to delete.")
             return
 
-        task_index = self.task_list.index(selected_item)
-        with self.lock:
-            del self.scheduled_tasks[task_index]
-            self.save_scheduled_tasks()
+        self.engine.remove_task(selected_item[0])
 
-        self.task_list.delete(selected_item)
+    def toggle_pause_task(self):
+        """Pause the selected task, or resume it if it is already paused."""
+        selected_item = self.task_list.selection()
+        if not selected_item:
+            messagebox.showwarning("Selection Error", "Please select a task to pause or resume.")
+            return
 
-    def populate_task_list(self):
-        """Populate the task list from the scheduled tasks."""
-        for task in self.scheduled_tasks:
-            self.task_list.insert('', 'end', values=(
-                task["task_name"], task["schedule_type"],
-                task["next_run"].strftime("%Y-%m-%d %H:%M:%S"),
-                task["command"], task.get("working_directory") or "", task.get("schedule_details") or "",
-                task.get("close_after", "Unlimited"),
-                "Yes" if task.get("save_output", {}).get("enabled") else "No"
-            ))
+        task = self.engine.get_task(selected_item[0])
+        if task is None:
+            return
+        if task.get("paused"):
+            self.engine.resume_task(task["task_id"])
+        else:
+            self.engine.pause_task(task["task_id"])
+
+    def task_row_values(self, task):
+        """Return the task list column values for a task."""
+        return (
+            task["task_name"], task["schedule_type"],
+            task["next_run"].strftime("%Y-%m-%d %H:%M:%S"),
+            task["command"], task.get("working_directory") or "", task.get("schedule_details") or "",
+            task["close_after"] if task.get("close_after") is not None else "Unlimited",
+            "Yes" if (task.get("save_output") or {}).get("enabled") else "No",
+            "Paused" if task.get("paused") else "Active",
+            *self.resource_column_values(task)
+        )
 
-    def run_scheduler(self):
-        """Run scheduled tasks based on their schedules."""
-        while True:
-            now = datetime.now()
-            tasks_to_reschedule = []
-            with self.lock:
-                for index, task in enumerate(self.scheduled_tasks.copy()):
-                    if now >= task["next_run"]:
-                        # Execute the task
-                        self.execute_task(task)
-
-                        # Increment run count
-                        task["run_count"] += 1
-
-                        # Check if task should be closed after a certain number of executions
-                        if task["close_after"] is not None and task["run_count"] >= task["close_after"]:
-                            # Remove task
-                            self.scheduled_tasks.pop(index)
-                            self.delete_task_in_gui(index)
-                            continue  # Skip rescheduling
-
-                        # Determine next run time based on schedule type
-                        next_run = self.get_next_run_time(task)
-                        if next_run:
-                            task["next_run"] = next_run
-                            tasks_to_reschedule.append((index, next_run))
-                        else:
-                            # Remove one-time tasks after execution
-                            self.scheduled_tasks.pop(index)
-                            self.delete_task_in_gui(index)
-
-                self.save_scheduled_tasks()
-
-            # Update the GUI for rescheduled tasks
-            for index, next_run in tasks_to_reschedule:
-                self.update_task_in_gui(index, next_run)
-
-            time.sleep(1)  # Sleep briefly to prevent excessive CPU usage
-
-    def get_next_run_time(self, task):
-        """Calculate the next run time based on the task's schedule."""
-        now = datetime.now()
-        schedule_type = task["schedule_type"]
-        if schedule_type == "One-time":
-            return None  # One-time tasks are not rescheduled
-        elif schedule_type == "Recurring":
-            return self.calculate_next_run(task)
-        elif schedule_type == "Interval":
-            return now + timedelta(seconds=task["interval_seconds"])
-        return None
-
-    def execute_task(self, task):
-        """Execute the specified task."""
-        command = task["command"]
-        working_directory = task.get("working_directory")
-        save_output = task.get("save_output", {})
-        save_output_enabled = save_output.get("enabled", False)
-        output_method = save_output.get("method")
-        output_path = save_output.get("path")
+    def resource_column_values(self, task):
+        """Return the last-run and cumulative resource columns for a task."""
+        last_run = task.get("last_run")
+        totals = task.get("resource_totals")
+        if not last_run or not totals:
+            return ("", "", "")
+        cpu = (last_run["user_cpu_seconds"] or 0) + (last_run["system_cpu_seconds"] or 0)
+        return (
+            f"{last_run['wall_seconds']:.1f}s wall, {cpu:.1f}s CPU, exit {last_run['exit_code']}",
+            f"{totals['cpu_seconds']:.1f}",
+            f"{totals['max_rss_kb'] / 1024:.1f}"
+        )
 
-        try:
-            if save_output_enabled and output_method and output_path:
-                if output_method == "single_file":
-                    # Append output to single file with timestamp
-                    with open(output_path, 'a') as output_file:
-                        output_file.write(f"\n--- Output at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ---\n")
-                        process = subprocess.Popen(
-                            command, cwd=working_directory, shell=True,
-                            stdout=output_file, stderr=subprocess.STDOUT
-                        )
-                        process.wait()
-                elif output_method == "separate_files":
-                    # Save output to a separate file
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    file_name = f"{task['task_name']}_{timestamp}.txt"
-                    output_file_path = os.path.join(output_path, file_name)
-                    with open(output_file_path, 'w') as output_file:
-                        process = subprocess.Popen(
-                            command, cwd=working_directory, shell=True,
-                            stdout=output_file, stderr=subprocess.STDOUT
-                        )
-                        process.wait()
-            else:
-                subprocess.Popen(command, cwd=working_directory, shell=True)
-            # Update GUI (must be done on the main thread)
+    def populate_task_list(self):
+        """Populate the task list from the scheduled tasks."""
+        for task in self.engine.list_tasks():
+            self.task_list.insert('', 'end', iid=task["task_id"], values=self.task_row_values(task))
+
+    def handle_engine_event(self, event, payload):
+        """Marshal engine events onto the Tk main loop."""
+        if event in ("task_added", "task_updated"):
+            self.tab.after(0, lambda: self.upsert_task_in_gui(payload))
+        elif event == "task_removed":
+            self.tab.after(0, lambda: self.delete_task_in_gui(payload))
+        elif event == "task_executed":
             self.tab.after(0, lambda: messagebox.showinfo(
-                "Task Executed", f"Task '{task['task_name']}' has been executed."
+                "Task Executed", f"Task '{payload['task_name']}' has been executed."
             ))
-        except Exception as e:
+        elif event == "task_failed":
             self.tab.after(0, lambda: messagebox.showerror(
-                "Execution Error", f"Failed to execute task '{task['task_name']}':\n{str(e)}"
+                "Execution Error", f"Failed to execute task '{payload['task_name']}':\n{payload['error']}"
             ))
+        elif event == "pool_changed":
+            self.tab.after(0, lambda: self.update_pool_status_in_gui(payload))
+        elif event == "dispatcher_changed":
+            self.tab.after(0, lambda: self.update_dispatch_status_in_gui(payload))
+
+    def upsert_task_in_gui(self, task):
+        """Insert a task row, or refresh it if it is already listed."""
+        if self.task_list.exists(task["task_id"]):
+            self.task_list.item(task["task_id"], values=self.task_row_values(task))
+        else:
+            self.task_list.insert('', 'end', iid=task["task_id"], values=self.task_row_values(task))
 
-    def update_task_in_gui(self, index, next_run):
-        """Update the 'Next Run' time in the GUI for a task."""
-        # Must be called from the main thread
-        def update():
-            try:
-                item_id = self.task_list.get_children()[index]
-                values = list(self.task_list.item(item_id, 'values'))
-                values[2] = next_run.strftime("%Y-%m-%d %H:%M:%S")
-                self.task_list.item(item_id, values=values)
-            except IndexError:
-                pass  # Task might have been deleted
-
-        self.tab.after(0, update)
-
-    def delete_task_in_gui(self, index):
+    def delete_task_in_gui(self, task_id):
         """Delete a task from the GUI task list."""
-        def delete():
-            try:
-                item_id = self.task_list.get_children()[index]
-                self.task_list.delete(item_id)
-            except IndexError:
-                pass  # Task might have been deleted already
-
-        self.tab.after(0, delete)
-
+        if self.task_list.exists(task_id):
+            self.task_list.delete(task_id)
+
+    def update_pool_status_in_gui(self, stats):
+        """Show worker pool activity and queue depth below the task list."""
+        text = f"Running: {stats['active']}/{stats['max_workers']}  Queued: {stats['queued']}"
+        self.pool_status_label.config(text=text)
+
+    def update_dispatch_status_in_gui(self, status):
+        """Say when tasks are run by another scheduler process rather than this one."""
+        text = "" if status["dispatching"] else "Tasks are run by another scheduler process; changes here are saved for it."
+        self.dispatch_status_label.config(text=text)
@@ -0,0 +1,198 @@
+# scheduler/cron.py
+"""Cron expressions compiled to bitsets.
+
+Each field (minute, hour, day of month, month, day of week) is parsed once
+into an integer bitmask. The next fire time is found by scanning for the
+lowest set bit at or above the current position in each field, so a lookup
+costs a handful of integer operations per field instead of walking the
+calendar minute by minute.
+"""
+import calendar
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+MONTH_NAMES = {name.lower(): index for index, name in enumerate(calendar.month_abbr) if name}
+DAY_NAMES = {"sun": 0, "mon": 1, "tue": 2, "wed": 3, "thu": 4, "fri": 5, "sat": 6}
+MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+MAX_SEARCH_STEPS = 2000  # Enough to cross several leap-year cycles before declaring "never"
+
+
+def next_bit(mask, start):
+    """Return the lowest set bit index >= start, or None."""
+    remaining = mask >> start
+    if not remaining:
+        return None
+    return start + (remaining & -remaining).bit_length() - 1
+
+
+@lru_cache(maxsize=1024)
+def month_layout(year, month):
+    """Return (cron weekday of the 1st, days in month) for a month."""
+    first_weekday, days_in_month = calendar.monthrange(year, month)
+    return (first_weekday + 1) % 7, days_in_month  # Python Monday=0 -> cron Sunday=0
+
+
+def parse_field(field, low, high, names=None):
+    """Parse one cron field (lists, ranges, steps, names) into a bitmask."""
+    mask = 0
+    for part in field.split(","):
+        if not part:
+            raise ValueError(f"Empty list item in cron field '{field}'")
+        range_part, _, step_part = part.partition("/")
+        step = 1
+        if step_part:
+            if not step_part.isdigit() or int(step_part) <= 0:
+                raise ValueError(f"Invalid step '{step_part}' in cron field '{field}'")
+            step = int(step_part)
+
+        if range_part == "*":
+            start, end = low, high
+        else:
+            start_text, _, end_text = range_part.partition("-")
+            start = parse_value(start_text, low, high, names)
+            if end_text:
+                end = parse_value(end_text, low, high, names)
+            else:
+                # "5/15" means "from 5 to the end of the range, every 15"
+                end = high if step_part else start
+            if end < start:
+                raise ValueError(f"Range '{range_part}' runs backwards in cron field '{field}'")
+
+        for value in range(start, end + 1, step):
+            mask |= 1 << value
+    return mask
+
+
+def parse_value(text, low, high, names):
+    text = text.lower()
+    if names and text in names:
+        return names[text]
+    if not text.isdigit():
+        raise ValueError(f"Invalid cron value '{text}'")
+    value = int(text)
+    if not low <= value <= high:
+        raise ValueError(f"Cron value {value} is outside {low}-{high}")
+    return value
+
+
+class CronExpression:
+    """A compiled five-field cron expression: minute hour day-of-month month day-of-week."""
+
+    def __init__(self, expression):
+        self.expression = expression.strip()
+        fields = MACROS.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise ValueError("A cron expression needs five fields: minute hour day-of-month month day-of-week.")
+        minute, hour, day_of_month, month, day_of_week = fields
+
+        self.minutes = parse_field(minute, 0, 59)
+        self.hours = parse_field(hour, 0, 23)
+        self.days_of_month = parse_field(day_of_month, 1, 31)
+        self.months = parse_field(month, 1, 12, MONTH_NAMES)
+        days_of_week = parse_field(day_of_week, 0, 7, DAY_NAMES)
+        if days_of_week & (1 << 7):
+            days_of_week = (days_of_week | 1) & ~(1 << 7)  # 7 is an alias for Sunday
+        self.days_of_week = days_of_week
+
+        # Classic cron: when both day fields are restricted, a day matches if either does.
+        # Like vixie cron, a field starting with "*" (e.g. "*/2") counts as unrestricted.
+        self.dom_restricted = not day_of_month.startswith("*")
+        self.dow_restricted = not day_of_week.startswith("*")
+
+        # For each weekday the 1st of a month can fall on (cron numbering, 0 = Sunday),
+        # precompute which days 1..31 satisfy the day-of-week field
+        self.dow_day_masks = []
+        for first_weekday in range(7):
+            mask = 0
+            for day in range(1, 32):
+                if self.days_of_week >> ((first_weekday + day - 1) % 7) & 1:
+                    mask |= 1 << day
+            self.dow_day_masks.append(mask)
+
+        # Scan tables derived from the bitsets: entry i is the first set bit >= i, or None.
+        # One past the end of each range is included so overflow (minute 60) maps to None.
+        self.next_minutes = tuple(next_bit(self.minutes, index) for index in range(61))
+        self.next_hours = tuple(next_bit(self.hours, index) for index in range(25))
+        self.next_months = tuple(next_bit(self.months, index) for index in range(14))
+
+        # Many tasks share an expression and are rescheduled in the same minute;
+        # remember the last answer so repeated lookups are a tuple comparison
+        self.last_lookup = (None, None)
+
+    def __repr__(self):
+        return f"CronExpression({self.expression!r})"
+
+    def day_mask(self, year, month):
+        """Return the bitmask of matching days (bit n = day n) for a month."""
+        first_weekday, days_in_month = month_layout(year, month)
+        valid_days = (1 << (days_in_month + 1)) - 2
+        dow_mask = self.dow_day_masks[first_weekday]
+        if self.dom_restricted and self.dow_restricted:
+            mask = self.days_of_month | dow_mask
+        elif self.dom_restricted:
+            mask = self.days_of_month
+        elif self.dow_restricted:
+            mask = dow_mask
+        else:
+            mask = valid_days
+        return mask & valid_days
+
+    def next_fire(self, after):
+        """Return the first matching minute strictly after `after`, or None if it never fires."""
+        key = (after.year, after.month, after.day, after.hour, after.minute)
+        last_key, last_result = self.last_lookup
+        if key == last_key:
+            return last_result
+        result = self.search(*key)
+        self.last_lookup = (key, result)
+        return result
+
+    def search(self, year, month, day, hour, minute):
+        """Scan forward from the minute after the given one."""
+        next_months, next_hours, next_minutes = self.next_months, self.next_hours, self.next_minutes
+        minute += 1
+
+        for _ in range(MAX_SEARCH_STEPS):
+            next_month = next_months[month]
+            if next_month is None:
+                year, month, day, hour, minute = year + 1, 1, 1, 0, 0
+                continue
+            if next_month != month:
+                month, day, hour, minute = next_month, 1, 0, 0
+
+            next_day = next_bit(self.day_mask(year, month), day)
+            if next_day is None:
+                year, month, day, hour, minute = (year + 1, 1, 1, 0, 0) if month == 12 else (year, month + 1, 1, 0, 0)
+                continue
+            if next_day != day:
+                day, hour, minute = next_day, 0, 0
+
+            next_hour = next_hours[hour]
+            if next_hour is not None:
+                if next_hour != hour:
+                    hour, minute = next_hour, 0
+                next_minute = next_minutes[minute]
+                if next_minute is not None:
+                    return datetime(year, month, day, hour, next_minute)
+                next_hour = next_hours[hour + 1]
+                if next_hour is not None:
+                    return datetime(year, month, day, next_hour, next_minutes[0])
+
+            # Past the last matching hour of the day: continue from the start of tomorrow
+            tomorrow = datetime(year, month, day) + timedelta(days=1)
+            year, month, day, hour, minute = tomorrow.year, tomorrow.month, tomorrow.day, 0, 0
+        return None
+
+
+@lru_cache(maxsize=4096)
+def compile_cron(expression):
+    """Parse an expression once and share the compiled form between tasks."""
+    return CronExpression(expression)
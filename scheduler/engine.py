@@ -0,0 +1,901 @@
+# scheduler/engine.py
+"""Headless task scheduling engine.
+
+The engine owns the task table, next-run calculation, persistence and
+dispatch. It never imports Tk, so it can run as a service process beside the
+FastAPI app; the Schedule Manager tab is just one view on top of it.
+"""
+import os
+import heapq
+import itertools
+import logging
+import signal
+import subprocess
+import threading
+import uuid
+import calendar
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from scheduler.cron import compile_cron
+from scheduler.history import RunHistory
+from scheduler.lease import DispatchLease
+from scheduler.output_sink import OutputSinkManager, COMPRESSION_METHODS
+from scheduler.store import TaskStore, TASK_DB
+from utils.logging_setup import setup_logging
+from utils.process_accounting import RunMeter, resource_ledger
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_TYPES = ("One-time", "Recurring", "Interval", "Cron")
+FREQUENCIES = ("Daily", "Weekly", "Monthly")
+DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+OUTPUT_METHODS = ("single_file", "separate_files")
+# What to do with runs that fell due while the scheduler was not running
+MISFIRE_POLICIES = ("run_once", "skip", "run_all")
+DEFAULT_MISFIRE_MAX_RUNS = 10  # Cap on back-to-back catch-up runs under "run_all"
+OUTPUT_CHUNK_SIZE = 64 * 1024  # Bytes read from a task's output pipe at a time
+# Fields the engine itself changes while running tasks; flushes write only these, so edits
+# made through the REST API in the meantime are kept
+RUN_STATE_FIELDS = ("next_run", "run_count", "last_run", "resource_totals", "catch_up_runs")
+
+
+class TaskWorkerPool:
+    """Bounded thread pool that runs due tasks and tracks its queue depth."""
+
+    def __init__(self, max_workers, on_change=None):
+        self.max_workers = max_workers
+        self.on_change = on_change  # Called with stats() whenever queue depth or activity changes
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sits-task")
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) for execution on the next free worker."""
+        with self.lock:
+            self.queued += 1
+        self.notify_change()
+        return self.executor.submit(self.run_job, fn, args)
+
+    def run_job(self, fn, args):
+        """Worker wrapper that keeps the queued/active counters accurate."""
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+        self.notify_change()
+        try:
+            return fn(*args)
+        finally:
+            with self.lock:
+                self.active -= 1
+            self.notify_change()
+
+    def stats(self):
+        """Return the concurrency cap, running job count and queue depth."""
+        with self.lock:
+            return {"max_workers": self.max_workers, "active": self.active, "queued": self.queued}
+
+    def notify_change(self):
+        if self.on_change:
+            self.on_change(self.stats())
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and optionally wait for running ones to finish."""
+        self.executor.shutdown(wait=wait)
+
+
+def calculate_next_run(task, now=None):
+    """Calculate the next run time for recurring tasks."""
+    now = now or datetime.now()
+    frequency = task["frequency"]
+    time_parts = task["time_of_day"].split(":")
+    hours = int(time_parts[0])
+    minutes = int(time_parts[1])
+    time_of_day = timedelta(hours=hours, minutes=minutes)
+    next_run = datetime.combine(now.date(), datetime.min.time()) + time_of_day
+
+    if frequency == "Daily":
+        if next_run <= now:
+            next_run += timedelta(days=1)
+    elif frequency == "Weekly":
+        today = now.weekday()
+        days_indices = [DAYS_OF_WEEK.index(day) for day in task["days_of_week"]]
+        days_ahead = [(day - today) % 7 for day in days_indices]
+        days_ahead = [day if day != 0 or next_run > now else 7 for day in days_ahead]
+        next_run += timedelta(days=min(days_ahead))
+    elif frequency == "Monthly":
+        # Tasks saved before day_of_month existed keep the old "today's day" behaviour
+        day = task.get("day_of_month") or now.day
+        year, month = now.year, now.month
+        next_run = monthly_run(year, month, day, hours, minutes)
+        if next_run <= now:
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+            next_run = monthly_run(year, month, day, hours, minutes)
+    return next_run
+
+
+def monthly_run(year, month, day, hours, minutes):
+    """Run time for a monthly task, clamping days like the 31st to the month's last day."""
+    day = min(day, calendar.monthrange(year, month)[1])
+    return datetime(year, month, day, hours, minutes)
+
+
+def get_next_run_time(task, now=None):
+    """Calculate the next run time based on the task's schedule, or None if it is finished."""
+    now = now or datetime.now()
+    schedule_type = task["schedule_type"]
+    if schedule_type == "One-time":
+        return None  # One-time tasks are not rescheduled
+    elif schedule_type == "Recurring":
+        return calculate_next_run(task, now)
+    elif schedule_type == "Interval":
+        return now + timedelta(seconds=task["interval_seconds"])
+    elif schedule_type == "Cron":
+        return compile_cron(task["cron_expression"]).next_fire(now)
+    return None
+
+
+def describe_interval(interval_seconds):
+    """Render an interval the way the Schedule Manager form expresses it."""
+    if interval_seconds % 3600 == 0:
+        return f"Every {interval_seconds // 3600} hours"
+    if interval_seconds % 60 == 0:
+        return f"Every {interval_seconds // 60} minutes"
+    return f"Every {interval_seconds} seconds"
+
+
+def count_missed_runs(task, now, limit):
+    """Count how many runs of a task fell due up to now, stopping at limit."""
+    schedule_type = task["schedule_type"]
+    if task["next_run"] > now:
+        return 0
+    if schedule_type == "One-time":
+        return 1
+    if schedule_type == "Interval":
+        elapsed = (now - task["next_run"]).total_seconds()
+        return min(limit, 1 + int(elapsed // task["interval_seconds"]))
+    count, run = 0, task["next_run"]
+    while run is not None and run <= now and count < limit:
+        count += 1
+        run = get_next_run_time(task, run)
+    return count
+
+
+def startup_jitter(task_id, window_seconds):
+    """Deterministic offset within the startup window, so restarts spread tasks the same way."""
+    return window_seconds * (zlib.crc32(task_id.encode()) / 0xFFFFFFFF)
+
+
+def create_task(task_name, command, schedule_type, working_directory=None, close_after=None,
+                save_output=None, run_at=None, frequency=None, time_of_day=None, days_of_week=None,
+                interval_seconds=None, cron_expression=None, misfire_policy="run_once",
+                misfire_max_runs=DEFAULT_MISFIRE_MAX_RUNS, day_of_month=None, allow_past_run_at=False):
+    """Validate a task definition and return a task dictionary ready for SchedulerEngine.add_task.
+
+    Monthly tasks run on day_of_month, today's day if not given. A One-time
+    run_at must be in the future unless allow_past_run_at is set.
+    Raises ValueError with a user-facing message when the definition is invalid.
+    """
+    task_name = (task_name or "").strip()
+    command = (command or "").strip()
+    if not task_name or not command:
+        raise ValueError("Please enter a task name and command/script.")
+    if close_after is not None and (not isinstance(close_after, int) or close_after <= 0):
+        raise ValueError("Close After must be a positive integer.")
+    if misfire_policy not in MISFIRE_POLICIES:
+        raise ValueError("Misfire policy must be 'run_once', 'skip' or 'run_all'.")
+    if not isinstance(misfire_max_runs, int) or misfire_max_runs <= 0:
+        raise ValueError("Misfire max runs must be a positive integer.")
+
+    save_output = dict(save_output or {})
+    save_output_enabled = bool(save_output.get("enabled"))
+    if save_output_enabled:
+        if save_output.get("method") not in OUTPUT_METHODS:
+            raise ValueError("Output method must be 'single_file' or 'separate_files'.")
+        if not save_output.get("path"):
+            raise ValueError("Please specify an output file or directory.")
+        if save_output.get("compression") not in (None,) + COMPRESSION_METHODS:
+            raise ValueError("Output compression must be 'gzip', 'zstd' or 'none'.")
+        # Unset rotation/retention options fall back to the sink defaults
+        save_output = {key: value for key, value in save_output.items()
+                       if value is not None or key in ("enabled", "method", "path")}
+    else:
+        save_output = {"enabled": False, "method": None, "path": None}
+
+    task = {
+        "task_id": uuid.uuid4().hex,
+        "task_name": task_name,
+        "command": command,
+        "working_directory": working_directory or None,
+        "schedule_type": schedule_type,
+        "next_run": None,  # Will be set later
+        "schedule_details": "",
+        "close_after": close_after,
+        "run_count": 0,
+        "save_output": save_output,
+        "paused": False,
+        "misfire_policy": misfire_policy,
+        "misfire_max_runs": misfire_max_runs,
+    }
+
+    # Schedule details based on schedule type
+    if schedule_type == "One-time":
+        if run_at is None or (run_at <= datetime.now() and not allow_past_run_at):
+            raise ValueError("The scheduled time must be in the future.")
+        task["next_run"] = run_at
+        task["schedule_details"] = f"At {run_at.strftime('%Y-%m-%d %H:%M:%S')}"
+    elif schedule_type == "Recurring":
+        if frequency not in FREQUENCIES:
+            raise ValueError("Frequency must be Daily, Weekly or Monthly.")
+        if not isinstance(time_of_day, timedelta):
+            raise ValueError("Please specify a time of day.")
+        hour, minute = divmod(int(time_of_day.total_seconds()) // 60, 60)
+        task["frequency"] = frequency
+        task["time_of_day"] = str(time_of_day)
+        if frequency == "Monthly":
+            if day_of_month is not None and (not isinstance(day_of_month, int) or not 1 <= day_of_month <= 31):
+                raise ValueError("Day of month must be between 1 and 31.")
+            task["day_of_month"] = day_of_month or datetime.now().day
+
+        if frequency == "Weekly":
+            if not days_of_week or any(day not in DAYS_OF_WEEK for day in days_of_week):
+                raise ValueError("Please select at least one day of the week.")
+            task["days_of_week"] = list(days_of_week)
+            task["schedule_details"] = f"Every {', '.join(days_of_week)} at {hour:02d}:{minute:02d}"
+        elif frequency == "Monthly":
+            task["days_of_week"] = None
+            task["schedule_details"] = f"Monthly on day {task['day_of_month']} at {hour:02d}:{minute:02d}"
+        else:
+            task["days_of_week"] = None
+            task["schedule_details"] = f"Daily at {hour:02d}:{minute:02d}"
+
+        # Calculate next run time
+        task["next_run"] = calculate_next_run(task)
+    elif schedule_type == "Interval":
+        if not isinstance(interval_seconds, int) or interval_seconds <= 0:
+            raise ValueError("Interval must be a positive integer.")
+        task["interval_seconds"] = interval_seconds
+        task["next_run"] = datetime.now() + timedelta(seconds=interval_seconds)
+        task["schedule_details"] = describe_interval(interval_seconds)
+    elif schedule_type == "Cron":
+        try:
+            next_run = compile_cron((cron_expression or "").strip()).next_fire(datetime.now())
+        except ValueError as e:
+            raise ValueError(f"Invalid cron expression: {e}")
+        if next_run is None:
+            raise ValueError("The cron expression never matches a date.")
+        task["cron_expression"] = cron_expression.strip()
+        task["next_run"] = next_run
+        task["schedule_details"] = f"Cron: {task['cron_expression']}"
+    else:
+        raise ValueError("Invalid schedule type.")
+    return task
+
+
+# Fields of create_task() that determine when a task runs
+SCHEDULE_FIELDS = (
+    "schedule_type", "run_at", "frequency", "time_of_day", "days_of_week", "day_of_month", "interval_seconds",
+    "cron_expression"
+)
+
+
+def task_to_spec(task):
+    """Return the create_task() keyword arguments that describe an existing task."""
+    time_of_day = None
+    if task.get("time_of_day"):
+        hours, minutes = task["time_of_day"].split(":")[:2]
+        time_of_day = timedelta(hours=int(hours), minutes=int(minutes))
+    return {
+        "task_name": task["task_name"],
+        "command": task["command"],
+        "schedule_type": task["schedule_type"],
+        "working_directory": task.get("working_directory"),
+        "close_after": task.get("close_after"),
+        "save_output": task.get("save_output"),
+        "run_at": task["next_run"] if task["schedule_type"] == "One-time" else None,
+        "frequency": task.get("frequency"),
+        "time_of_day": time_of_day,
+        "days_of_week": task.get("days_of_week"),
+        "day_of_month": task.get("day_of_month"),
+        "interval_seconds": task.get("interval_seconds"),
+        "cron_expression": task.get("cron_expression"),
+        "misfire_policy": task.get("misfire_policy", "run_once"),
+        "misfire_max_runs": task.get("misfire_max_runs", DEFAULT_MISFIRE_MAX_RUNS),
+    }
+
+
+def update_task(task, changes):
+    """Return a copy of task with create_task() fields in `changes` applied.
+
+    The task keeps its id, run count and paused state; next_run is only
+    recalculated when a schedule field changes. An overdue One-time task stays
+    editable as long as run_at is not changed. Raises ValueError like create_task().
+    """
+    spec = task_to_spec(task)
+    spec.update(changes)
+    run_at_changed = "run_at" in changes and changes["run_at"] != task["next_run"]
+    updated = create_task(**spec, allow_past_run_at=not run_at_changed)
+    if not any(field in changes for field in SCHEDULE_FIELDS):
+        updated["next_run"] = task["next_run"]
+        if "catch_up_runs" in task:
+            updated["catch_up_runs"] = task["catch_up_runs"]
+    updated["task_id"] = task["task_id"]
+    updated["run_count"] = task.get("run_count", 0)
+    updated["paused"] = task.get("paused", False)
+    for field in ("last_run", "resource_totals"):
+        if field in task:
+            updated[field] = task[field]
+    return updated
+
+
+def needs_requeue(current, task):
+    """True if a task loaded from the store needs a new run heap entry: it is new, rescheduled or resumed."""
+    return (
+        current is None
+        or current["next_run"] != task["next_run"]
+        or (current.get("paused") and not task.get("paused"))
+    )
+
+
+def resume_task_state(task, now=None):
+    """Mark a task active again, skipping any runs that fell due while it was paused."""
+    now = now or datetime.now()
+    task["paused"] = False
+    if task["next_run"] <= now and task["schedule_type"] != "One-time":
+        task["next_run"] = get_next_run_time(task, now) or task["next_run"]
+    return task
+
+
+class SchedulerEngine:
+    """Owns scheduled tasks and runs them on time without any GUI dependency.
+
+    Views subscribe with add_listener(callback); callbacks receive an event name
+    and a payload and are invoked on engine threads, so GUI views must marshal
+    them onto their own main loop. Events: task_added, task_updated,
+    task_removed, task_executed, task_failed, pool_changed, dispatcher_changed.
+
+    Several engines may share one task database, but only the one holding its
+    DispatchLease runs tasks. The others keep their view in sync with the store
+    and write edits to it, and one of them takes over if the dispatcher exits.
+    """
+    MAX_SLEEP_SECONDS = 60  # Upper bound on a single wait so wall-clock jumps are picked up
+    MAX_CONCURRENT_TASKS = 4  # Default cap on tasks running at the same time
+    STARTUP_SPREAD_SECONDS = 60  # Window over which missed runs are spread after a restart
+    STORE_SYNC_SECONDS = 2  # How often to look for changes made by other processes, e.g. the REST API
+
+    def __init__(self, store=None, max_workers=None, startup_spread_seconds=None, history=None):
+        self.store = store or TaskStore()
+        # Run history sits next to the task database unless given explicitly
+        self.history = history or RunHistory(os.path.join(os.path.dirname(self.store.db_path), "run_history.db"))
+        self.startup_spread_seconds = (
+            self.STARTUP_SPREAD_SECONDS if startup_spread_seconds is None else startup_spread_seconds
+        )
+        self.scheduled_tasks = {}  # task_id -> task, in insertion order
+        self.lease = DispatchLease(self.store.db_path)
+        self.dispatching = None  # Whether this engine holds the lease; None until start() first tries
+        self.run_queue = []  # Heap of (next_run, sequence, task_id); only kept while dispatching
+        self.queue_sequence = itertools.count()
+        self.queued_sequences = {}  # task_id -> sequence of its live heap entry; older entries are stale
+        self.lock = threading.Condition()
+        self.flush_lock = threading.Lock()  # Keeps store writes in the order changes were made
+        self.dirty_tasks = {}  # task_id -> fields changed since the last flush, or None for the whole task
+        self.deleted_tasks = set()  # task_ids removed since the last flush
+        self.listeners = []
+        self.running = False
+        self.scheduler_thread = None
+        self.load_error = None
+        self.worker_pool = TaskWorkerPool(
+            max_workers or self.MAX_CONCURRENT_TASKS,
+            on_change=lambda stats: self.emit("pool_changed", stats)
+        )
+        self.output_sinks = OutputSinkManager()
+        self.load_scheduled_tasks()
+
+    # --- Listeners -------------------------------------------------------
+
+    def add_listener(self, callback):
+        """Register callback(event, payload) for task and pool events."""
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def emit(self, event, payload):
+        for callback in list(self.listeners):
+            try:
+                callback(event, payload)
+            except Exception:
+                logger.exception(f"Scheduler listener failed handling '{event}'")
+
+    # --- Lifecycle -------------------------------------------------------
+
+    def start(self):
+        """Start the scheduler thread."""
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        self.scheduler_thread = threading.Thread(target=self.run_scheduler, name="sits-scheduler", daemon=True)
+        self.scheduler_thread.start()
+
+    def stop(self, wait=True):
+        """Stop dispatching and optionally wait for running tasks to finish."""
+        with self.lock:
+            self.running = False
+            self.lock.notify()
+        if self.scheduler_thread:
+            self.scheduler_thread.join()
+            self.scheduler_thread = None
+        self.worker_pool.shutdown(wait=wait)
+        self.output_sinks.flush()
+        self.history.flush()
+        self.flush_changes()
+        with self.lock:
+            self.lease.release()
+            self.run_queue.clear()
+            self.queued_sequences.clear()
+
+    def acquire_lease(self):
+        """Become the dispatcher unless another engine is; emits dispatcher_changed when that changes."""
+        with self.lock:
+            acquired = not self.lease.held and self.lease.try_acquire()
+            if acquired:
+                # Viewers keep no run queue, so build it from the current tasks
+                self.run_queue.clear()
+                self.queued_sequences.clear()
+                for task in self.scheduled_tasks.values():
+                    self.push_task(task)
+            dispatching = self.lease.held
+            changed = dispatching != self.dispatching
+            self.dispatching = dispatching
+        if acquired:
+            logger.info(f"Dispatching tasks from {self.store.db_path}")
+            # Catch up on the latest stored state and on runs missed while no engine dispatched
+            self.sync_from_store()
+            self.plan_missed_runs()
+            self.flush_changes()
+        elif changed:
+            logger.info(f"Another scheduler holds {self.lease.path}; only watching for task changes")
+        if changed:
+            self.emit("dispatcher_changed", {"dispatching": dispatching})
+        return dispatching
+
+    # --- Task API --------------------------------------------------------
+
+    def add_task(self, task):
+        """Add a task created by create_task() and return its task_id."""
+        task = dict(task)
+        task.setdefault("task_id", uuid.uuid4().hex)
+        task.setdefault("run_count", 0)
+        task.setdefault("paused", False)
+        with self.lock:
+            self.scheduled_tasks[task["task_id"]] = task
+            self.push_task(task)
+            self.mark_dirty(task["task_id"])
+            self.lock.notify()  # Wake the scheduler in case this task is due sooner
+        self.flush_changes()
+        self.emit("task_added", dict(task))
+        return task["task_id"]
+
+    def remove_task(self, task_id):
+        """Delete a task. Returns False if it does not exist."""
+        with self.lock:
+            # The stale heap entry is discarded lazily when it reaches the top
+            if self.scheduled_tasks.pop(task_id, None) is None:
+                return False
+            self.mark_deleted(task_id)
+            self.lock.notify()
+        self.flush_changes()
+        self.emit("task_removed", task_id)
+        return True
+
+    def pause_task(self, task_id):
+        """Stop a task from firing until it is resumed. Returns False if it does not exist."""
+        with self.lock:
+            task = self.scheduled_tasks.get(task_id)
+            if task is None:
+                return False
+            task["paused"] = True
+            self.mark_dirty(task_id, ("paused",))
+            snapshot = dict(task)
+        self.flush_changes()
+        self.emit("task_updated", snapshot)
+        return True
+
+    def resume_task(self, task_id):
+        """Resume a paused task, skipping any runs that fell due while it was paused."""
+        with self.lock:
+            task = self.scheduled_tasks.get(task_id)
+            if task is None:
+                return False
+            if task.get("paused"):
+                resume_task_state(task)
+                self.push_task(task)
+                self.mark_dirty(task_id, ("paused", "next_run"))
+                self.lock.notify()
+            snapshot = dict(task)
+        self.flush_changes()
+        self.emit("task_updated", snapshot)
+        return True
+
+    def get_task(self, task_id):
+        """Return a copy of a task, or None."""
+        with self.lock:
+            task = self.scheduled_tasks.get(task_id)
+            return dict(task) if task else None
+
+    def list_tasks(self):
+        """Return copies of all tasks in insertion order."""
+        with self.lock:
+            return [dict(task) for task in self.scheduled_tasks.values()]
+
+    def pool_stats(self):
+        return self.worker_pool.stats()
+
+    # --- Persistence -----------------------------------------------------
+
+    def load_scheduled_tasks(self):
+        """Load scheduled tasks from the task store."""
+        try:
+            tasks = self.store.load_tasks()
+        except Exception as e:
+            logger.error(f"Failed to load scheduled tasks: {e}")
+            self.load_error = str(e)
+            return
+        with self.lock:
+            for task in tasks:
+                task.setdefault("paused", False)
+                self.scheduled_tasks[task["task_id"]] = task
+                self.push_task(task)
+
+    def sync_from_store(self):
+        """Pick up tasks created, changed or deleted in the store by other processes."""
+        try:
+            stored_tasks = self.store.load_tasks()
+        except Exception as e:
+            logger.error(f"Failed to sync scheduled tasks: {e}")
+            return
+        added, updated, removed = [], [], []
+        with self.lock:
+            stored_ids = set()
+            for task in stored_tasks:
+                task_id = task["task_id"]
+                stored_ids.add(task_id)
+                current = self.scheduled_tasks.get(task_id)
+                # Skip unchanged tasks and tasks with local changes not yet flushed
+                if current == task or task_id in self.dirty_tasks:
+                    continue
+                self.scheduled_tasks[task_id] = task
+                if needs_requeue(current, task):
+                    self.push_task(task)
+                (updated if current else added).append(dict(task))
+            for task_id in list(self.scheduled_tasks):
+                if task_id not in stored_ids and task_id not in self.dirty_tasks:
+                    del self.scheduled_tasks[task_id]
+                    removed.append(task_id)
+        for task in added:
+            self.emit("task_added", task)
+        for task in updated:
+            self.emit("task_updated", task)
+        for task_id in removed:
+            self.emit("task_removed", task_id)
+
+    def plan_missed_runs(self, now=None):
+        """Apply each task's misfire policy to runs missed while the scheduler was down.
+
+        Instead of firing every overdue task in the same second, catch-up runs
+        are placed at a deterministic offset inside the startup spreading window.
+        """
+        now = now or datetime.now()
+        with self.lock:
+            for task in list(self.scheduled_tasks.values()):
+                if task.get("paused") or task["next_run"] > now:
+                    continue
+                policy = task.get("misfire_policy", "run_once")
+                limit = task.get("misfire_max_runs") or DEFAULT_MISFIRE_MAX_RUNS
+                missed = count_missed_runs(task, now, limit if policy == "run_all" else 1)
+
+                if policy == "skip":
+                    next_run = get_next_run_time(task, now)
+                    if next_run is None:
+                        # A missed one-time task has nothing left to run
+                        self.scheduled_tasks.pop(task["task_id"], None)
+                        self.mark_deleted(task["task_id"])
+                        continue
+                    task["next_run"] = next_run
+                    task.pop("catch_up_runs", None)
+                else:
+                    task["catch_up_runs"] = missed
+                    offset = startup_jitter(task["task_id"], self.startup_spread_seconds)
+                    task["next_run"] = now + timedelta(seconds=offset)
+                self.push_task(task)
+                self.mark_dirty(task["task_id"], RUN_STATE_FIELDS)
+                logger.info(f"Task '{task['task_name']}' missed {missed} run(s); policy '{policy}'")
+
+    def mark_dirty(self, task_id, fields=None):
+        """Record that a task's fields (all of them if None) must be written on the next flush.
+
+        Caller must hold the lock.
+        """
+        self.deleted_tasks.discard(task_id)
+        if fields is None:
+            self.dirty_tasks[task_id] = None
+        elif task_id not in self.dirty_tasks:
+            self.dirty_tasks[task_id] = set(fields)
+        elif self.dirty_tasks[task_id] is not None:
+            self.dirty_tasks[task_id].update(fields)
+
+    def mark_deleted(self, task_id):
+        """Record that a task must be deleted on the next flush. Caller must hold the lock."""
+        self.dirty_tasks.pop(task_id, None)
+        self.deleted_tasks.add(task_id)
+
+    def flush_changes(self):
+        """Write only the tasks and fields changed since the last flush, in one transaction.
+
+        Changed fields are merged into the stored rows, and the merged rows are
+        taken back, so edits other processes made meanwhile are picked up.
+        """
+        with self.flush_lock:
+            with self.lock:
+                changes = [(dict(self.scheduled_tasks[task_id]), fields)
+                           for task_id, fields in self.dirty_tasks.items() if task_id in self.scheduled_tasks]
+                deletes = list(self.deleted_tasks)
+                self.dirty_tasks.clear()
+                self.deleted_tasks.clear()
+            try:
+                written, missing = self.store.merge_batch(changes, deletes)
+            except Exception as e:
+                logger.error(f"Failed to save scheduled tasks: {e}")
+                # Keep the changes pending so the next flush retries them
+                with self.lock:
+                    for task, fields in changes:
+                        if task["task_id"] not in self.deleted_tasks:
+                            self.mark_dirty(task["task_id"], fields)
+                    for task_id in deletes:
+                        if task_id not in self.scheduled_tasks:
+                            self.deleted_tasks.add(task_id)
+                return
+        self.apply_stored_tasks(written, missing)
+
+    def apply_stored_tasks(self, stored_tasks, removed_ids):
+        """Adopt rows just written by a flush and drop tasks that were deleted from the store meanwhile."""
+        updated, removed = [], []
+        with self.lock:
+            for task in stored_tasks:
+                task_id = task["task_id"]
+                current = self.scheduled_tasks.get(task_id)
+                # Tasks changed again since the flush are picked up by the next one
+                if current is None or current == task or task_id in self.dirty_tasks:
+                    continue
+                self.scheduled_tasks[task_id] = task
+                if needs_requeue(current, task):
+                    self.push_task(task)
+                    self.lock.notify()
+                updated.append(dict(task))
+            for task_id in removed_ids:
+                if task_id in self.scheduled_tasks and task_id not in self.dirty_tasks:
+                    del self.scheduled_tasks[task_id]
+                    removed.append(task_id)
+        for task in updated:
+            self.emit("task_updated", task)
+        for task_id in removed:
+            self.emit("task_removed", task_id)
+
+    # --- Dispatch --------------------------------------------------------
+
+    def push_task(self, task):
+        """Queue a task on the run heap under its current next_run. Caller must hold the lock.
+
+        The new entry supersedes any earlier entry for the task. Does nothing
+        unless this engine is the dispatcher.
+        """
+        if not self.lease.held:
+            return
+        sequence = next(self.queue_sequence)
+        self.queued_sequences[task["task_id"]] = sequence
+        heapq.heappush(self.run_queue, (task["next_run"], sequence, task["task_id"]))
+
+    def pop_due_tasks(self, now):
+        """Pop every task whose next_run has passed, each at most once. Caller must hold the lock."""
+        due_tasks = []
+        while self.run_queue and self.run_queue[0][0] <= now:
+            next_run, sequence, task_id = heapq.heappop(self.run_queue)
+            if self.queued_sequences.get(task_id) != sequence:
+                continue  # Superseded by a later push
+            del self.queued_sequences[task_id]
+            task = self.scheduled_tasks.get(task_id)
+            # Skip entries for deleted, paused or rescheduled tasks
+            if task is None or task.get("paused") or task["next_run"] != next_run:
+                continue
+            due_tasks.append(task)
+        return due_tasks
+
+    def seconds_until_next_run(self, now):
+        """Return how long the scheduler may sleep before the earliest task is due."""
+        max_sleep = min(self.MAX_SLEEP_SECONDS, self.STORE_SYNC_SECONDS)
+        if not self.lease.held or not self.run_queue:
+            return max_sleep
+        delay = (self.run_queue[0][0] - now).total_seconds()
+        return min(max(delay, 0), max_sleep)
+
+    def run_scheduler(self):
+        """Run scheduled tasks based on their schedules until stop() is called."""
+        while True:
+            tasks_to_execute = []
+            tasks_updated = []
+            tasks_removed = []
+            self.flush_changes()  # Run results recorded by workers since the last pass
+            if self.store.has_external_changes():
+                self.sync_from_store()
+            if not self.lease.held:
+                self.acquire_lease()  # Viewers retry on every pass, to take over when the dispatcher exits
+            with self.lock:
+                # Sleep until the earliest deadline, until a task is added or deleted,
+                # or until it is time to look for changes from other processes
+                due_tasks = self.pop_due_tasks(datetime.now())
+                if self.running and not due_tasks:
+                    self.lock.wait(self.seconds_until_next_run(datetime.now()))
+                    due_tasks = self.pop_due_tasks(datetime.now())
+                if not self.running:
+                    return
+                if not due_tasks:
+                    continue
+
+                for task in due_tasks:
+                    # Catch-up runs after a restart execute back to back in one worker slot
+                    runs = task.pop("catch_up_runs", None) or 1
+                    if task["close_after"] is not None:
+                        runs = max(1, min(runs, task["close_after"] - task["run_count"]))
+
+                    # Hand a snapshot to the worker pool; the child runs outside the lock
+                    tasks_to_execute.append((dict(task), runs))
+
+                    # Increment run count
+                    task["run_count"] += runs
+
+                    # Check if task should be closed after a certain number of executions
+                    if task["close_after"] is not None and task["run_count"] >= task["close_after"]:
+                        self.scheduled_tasks.pop(task["task_id"], None)
+                        self.mark_deleted(task["task_id"])
+                        tasks_removed.append(task["task_id"])
+                        continue  # Skip rescheduling
+
+                    # Determine next run time based on schedule type
+                    next_run = get_next_run_time(task)
+                    if next_run:
+                        task["next_run"] = next_run
+                        self.push_task(task)
+                        self.mark_dirty(task["task_id"], RUN_STATE_FIELDS)
+                        tasks_updated.append(dict(task))
+                    else:
+                        # Remove one-time tasks after execution
+                        self.scheduled_tasks.pop(task["task_id"], None)
+                        self.mark_deleted(task["task_id"])
+                        tasks_removed.append(task["task_id"])
+
+            # One transaction per pass covering only the tasks that fired
+            self.flush_changes()
+
+            for task, runs in tasks_to_execute:
+                self.worker_pool.submit(self.execute_task, task, runs)
+
+            for task in tasks_updated:
+                self.emit("task_updated", task)
+            for task_id in tasks_removed:
+                self.emit("task_removed", task_id)
+
+    def execute_task(self, task, runs=1):
+        """Execute the specified task `runs` times in a row."""
+        for _ in range(runs):
+            self.execute_task_once(task)
+
+    def execute_task_once(self, task):
+        """Execute the specified task and report the outcome to listeners."""
+        command = task["command"]
+        working_directory = task.get("working_directory")
+        save_output = task.get("save_output") or {}
+        save_output_enabled = save_output.get("enabled", False)
+        output_method = save_output.get("method")
+        output_path = save_output.get("path")
+
+        meter = RunMeter("schedule", task["task_name"], command)
+        output_location = None
+        output_error = None
+        try:
+            if save_output_enabled and output_method and output_path:
+                # Stream output through the sink so disk writes never stall the child
+                run_output = self.output_sinks.open_run(task)
+                output_location = run_output.path
+                output_bytes = 0
+                try:
+                    process = subprocess.Popen(
+                        command, cwd=working_directory, shell=True,
+                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+                    )
+                    with process.stdout:
+                        for chunk in iter(lambda: process.stdout.read1(OUTPUT_CHUNK_SIZE), b""):
+                            output_bytes += len(chunk)
+                            run_output.write(chunk)
+                    # stderr is merged into the saved output, so only a combined count exists
+                    record = meter.finish(process, stdout_bytes=output_bytes)
+                finally:
+                    run_output.close()
+                output_error = run_output.wait()
+            else:
+                # Wait so the worker slot stays occupied for the child's lifetime
+                process = subprocess.Popen(command, cwd=working_directory, shell=True)
+                record = meter.finish(process)
+            if output_error:
+                status, output_location = "output_error", None
+            else:
+                status = "success" if process.returncode == 0 else "failed"
+            self.history.record(task, meter.started_at, datetime.now(), process.returncode, status, output_location)
+            record["task_id"] = task["task_id"]
+            resource_ledger.add(record)
+            self.record_run(task["task_id"], record)
+            if output_error:
+                logger.error(f"Task '{task['task_name']}' ran, but its output could not be saved: {output_error}")
+                self.emit("task_failed", {**task, "error": f"Output could not be saved: {output_error}"})
+            else:
+                logger.info(f"Task '{task['task_name']}' has been executed.")
+                self.emit("task_executed", {**task, "last_run": record})
+        except Exception as e:
+            self.history.record(task, meter.started_at, datetime.now(), None, "error", output_location)
+            logger.error(f"Failed to execute task '{task['task_name']}': {e}")
+            self.emit("task_failed", {**task, "error": str(e)})
+
+    def record_run(self, task_id, record):
+        """Store a run's resource record and running totals on the live task."""
+        with self.lock:
+            task = self.scheduled_tasks.get(task_id)
+            if task is None:
+                return  # Removed after its final run; the record stays in the ledger
+            totals = task.setdefault(
+                "resource_totals", {"runs": 0, "cpu_seconds": 0.0, "wall_seconds": 0.0, "max_rss_kb": 0}
+            )
+            totals["runs"] += 1
+            totals["cpu_seconds"] += (record["user_cpu_seconds"] or 0) + (record["system_cpu_seconds"] or 0)
+            totals["wall_seconds"] += record["wall_seconds"]
+            totals["max_rss_kb"] = max(totals["max_rss_kb"], record["max_rss_kb"] or 0)
+            task["last_run"] = record
+            # Written by the scheduler thread's next pass, batched with other runs
+            self.mark_dirty(task_id, RUN_STATE_FIELDS)
+            snapshot = dict(task)
+        self.emit("task_updated", snapshot)
+
+def main():
+    """Run the scheduler as a headless service until interrupted."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the SITS scheduler without the GUI.")
+    parser.add_argument("--database", default=TASK_DB, help="Path to the scheduled tasks database.")
+    parser.add_argument("--history-database", default=None,
+                        help="Path to the run history database (default: next to the task database).")
+    parser.add_argument("--max-workers", type=int, default=None, help="Maximum number of tasks running at once.")
+    parser.add_argument("--startup-spread", type=float, default=None,
+                        help="Seconds over which runs missed during downtime are spread.")
+    args = parser.parse_args()
+
+    setup_logging("scheduler")
+
+    engine = SchedulerEngine(
+        store=TaskStore(args.database), max_workers=args.max_workers,
+        history=RunHistory(args.history_database) if args.history_database else None,
+        startup_spread_seconds=args.startup_spread
+    )
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    engine.start()
+    logger.info(f"Scheduler engine started with {len(engine.list_tasks())} task(s)")
+    stop_event.wait()
+    logger.info("Stopping scheduler engine...")
+    engine.stop()
+
+
+if __name__ == "__main__":
+    main()
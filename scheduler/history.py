@@ -0,0 +1,213 @@
+# scheduler/history.py
+"""Run history for scheduled tasks.
+
+One row per execution in its own WAL-mode SQLite database, indexed by task
+and start time. Task runners only append to an in-memory queue; a background
+thread writes the queue in batched transactions and enforces retention, so
+recording never slows dispatch. Kept apart from the task database so history
+writes do not look like schedule changes to other processes.
+"""
+import os
+import math
+import queue
+import sqlite3
+import threading
+import logging
+import time
+from datetime import datetime, timedelta
+from scheduler.store import CONFIG_DIR
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DB = os.path.join(CONFIG_DIR, "run_history.db")
+RUN_STATUSES = ("success", "failed", "error")  # Exit 0, non-zero exit, could not be run
+DEFAULT_RETENTION_DAYS = 30
+DEFAULT_MAX_ROWS = 1_000_000
+BATCH_SIZE = 1000  # Rows written per transaction at most
+FLUSH_INTERVAL_SECONDS = 0.5  # Longest a recorded run waits before it is written
+PRUNE_INTERVAL_SECONDS = 60
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(len(sorted_values) * fraction))
+    return sorted_values[rank - 1]
+
+
+def summarize_runs(rows):
+    """Return run count, failure rate and duration percentiles for (duration, status) rows."""
+    durations = sorted(duration for duration, _ in rows)
+    failures = sum(1 for _, status in rows if status != "success")
+    return {
+        "runs": len(rows),
+        "failures": failures,
+        "failure_rate": failures / len(rows) if rows else None,
+        "p50_seconds": percentile(durations, 0.50),
+        "p95_seconds": percentile(durations, 0.95),
+        "p99_seconds": percentile(durations, 0.99),
+        "max_seconds": durations[-1] if durations else None,
+    }
+
+
+class RunHistory:
+    """Append-mostly store of task runs with batched background writes."""
+
+    def __init__(self, db_path=HISTORY_DB, retention_days=DEFAULT_RETENTION_DAYS, max_rows=DEFAULT_MAX_ROWS):
+        self.db_path = db_path
+        self.retention_days = retention_days
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.create_schema()
+        self.pending = queue.Queue()
+        self.writer_thread = None
+        self.last_prune = 0.0
+
+    def create_schema(self):
+        with self.lock:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id INTEGER PRIMARY KEY,
+                    task_id TEXT NOT NULL,
+                    task_name TEXT NOT NULL,
+                    started_at TEXT NOT NULL,
+                    finished_at TEXT NOT NULL,
+                    duration REAL NOT NULL,
+                    status TEXT NOT NULL,
+                    exit_code INTEGER,
+                    output_path TEXT
+                );
+                CREATE INDEX IF NOT EXISTS runs_task_started ON runs (task_id, started_at);
+                CREATE INDEX IF NOT EXISTS runs_started ON runs (started_at);
+            """)
+
+    # --- Recording -------------------------------------------------------
+
+    def record(self, task, started_at, finished_at, exit_code, status, output_path=None):
+        """Queue one run for writing; returns immediately."""
+        self.pending.put((
+            task["task_id"], task["task_name"],
+            started_at.isoformat(timespec="microseconds"), finished_at.isoformat(timespec="microseconds"),
+            (finished_at - started_at).total_seconds(), status, exit_code, output_path
+        ))
+        if self.writer_thread is None:
+            with self.lock:
+                if self.writer_thread is None:
+                    self.writer_thread = threading.Thread(target=self.run_writer, name="sits-run-history", daemon=True)
+                    self.writer_thread.start()
+
+    def run_writer(self):
+        """Write queued runs in batches until a None sentinel arrives."""
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + FLUSH_INTERVAL_SECONDS
+            while batch[-1] is not None and len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.pending.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            rows = [row for row in batch if row is not None]
+            try:
+                self.write_rows(rows)
+                if time.monotonic() - self.last_prune >= PRUNE_INTERVAL_SECONDS:
+                    self.prune()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to write {len(rows)} run history record(s): {e}")
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
+            if stop:
+                return
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO runs (task_id, task_name, started_at, finished_at, duration, status, "
+                    "exit_code, output_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def prune(self):
+        """Drop runs older than the retention window and the oldest beyond max_rows."""
+        self.last_prune = time.monotonic()
+        with self.lock:
+            if self.retention_days:
+                cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat(timespec="microseconds")
+                self.conn.execute("DELETE FROM runs WHERE started_at < ?", (cutoff,))
+            if self.max_rows:
+                self.conn.execute(
+                    "DELETE FROM runs WHERE run_id <= (SELECT MAX(run_id) FROM runs) - ?", (self.max_rows,)
+                )
+
+    def flush(self):
+        """Block until every queued run has been written."""
+        self.pending.join()
+
+    def close(self):
+        if self.writer_thread is not None:
+            self.pending.put(None)
+            self.writer_thread.join()
+            self.writer_thread = None
+        with self.lock:
+            self.conn.close()
+
+    # --- Queries ---------------------------------------------------------
+
+    def window_clause(self, task_id=None, since=None, until=None):
+        clauses, params = [], []
+        if task_id is not None:
+            clauses.append("task_id = ?")
+            params.append(task_id)
+        if since is not None:
+            clauses.append("started_at >= ?")
+            params.append(since.isoformat(timespec="microseconds"))
+        if until is not None:
+            clauses.append("started_at < ?")
+            params.append(until.isoformat(timespec="microseconds"))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def list_runs(self, task_id=None, since=None, until=None, limit=100):
+        """Return runs newest first within the window."""
+        where, params = self.window_clause(task_id, since, until)
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT run_id, task_id, task_name, started_at, finished_at, duration, status, exit_code, "
+                f"output_path FROM runs{where} ORDER BY started_at DESC, run_id DESC LIMIT ?", params + [limit]
+            )
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def task_stats(self, task_id, since=None, until=None):
+        """Return run count, failure rate and p50/p95/p99 durations for one task."""
+        where, params = self.window_clause(task_id, since, until)
+        with self.lock:
+            rows = self.conn.execute(f"SELECT duration, status FROM runs{where}", params).fetchall()
+        return {"task_id": task_id, **summarize_runs(rows)}
+
+    def all_task_stats(self, since=None, until=None):
+        """Return task_stats() for every task with runs in the window, most failures first."""
+        where, params = self.window_clause(None, since, until)
+        with self.lock:
+            rows = self.conn.execute(f"SELECT task_id, task_name, duration, status FROM runs{where}", params).fetchall()
+        by_task = {}
+        for task_id, task_name, duration, status in rows:
+            by_task.setdefault(task_id, (task_name, []))[1].append((duration, status))
+        stats = [
+            {"task_id": task_id, "task_name": task_name, **summarize_runs(task_rows)}
+            for task_id, (task_name, task_rows) in by_task.items()
+        ]
+        stats.sort(key=lambda entry: (entry["failures"], entry["p95_seconds"]), reverse=True)
+        return stats
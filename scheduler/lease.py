@@ -0,0 +1,66 @@
+# scheduler/lease.py
+"""Single-dispatcher lease on a task database.
+
+Any number of engines may open the same task database, but only the one
+holding the lease runs tasks. The others act as viewers and editors whose
+changes reach the dispatcher through the store. The lease is an exclusive
+lock on a file next to the database. The kernel drops the lock when its
+holder exits or crashes, so a waiting engine can take over.
+"""
+import os
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class DispatchLease:
+    """Non-blocking exclusive lock on <db_path>.lock."""
+
+    def __init__(self, db_path):
+        self.path = f"{db_path}.lock"
+        self.fd = None
+        self.error_logged = False
+
+    @property
+    def held(self):
+        return self.fd is not None
+
+    def try_acquire(self):
+        """Take the lease unless another engine holds it; return whether this one does."""
+        if self.fd is not None:
+            return True
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            if not self.error_logged:
+                logger.error(f"Cannot open scheduler lock file {self.path}: {e}")
+                self.error_logged = True
+            return False
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        # The holder's PID, for whoever wonders which process is dispatching
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is None:
+            return
+        if not fcntl:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        os.close(self.fd)  # Closing the descriptor drops a flock
+        self.fd = None
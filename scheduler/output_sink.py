@@ -0,0 +1,380 @@
+# scheduler/output_sink.py
+"""Asynchronous, rotating output sinks for scheduled task output.
+
+Task runners hand output chunks to an OutputSinkManager, which queues them
+for a single background writer thread, so a task never waits on the disk.
+Finished segments are compressed and pruned on a separate background thread.
+
+Both save modes of the Schedule Manager map onto a sink:
+
+- single_file: one active file that rotates by size and/or age, checked on
+  every write; rotated segments are compressed and kept up to
+  backup_count / max_age_days. Runs that overlap are written in blocks, and
+  a block that resumes a run after another run's output is labelled with it.
+- separate_files: one file per run; finished files are optionally compressed
+  and kept up to max_files / max_age_days per task.
+"""
+import os
+import re
+import gzip
+import queue
+import shutil
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    import zstandard  # Optional: pip install zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024  # Rotate the single output file at 10 MiB
+DEFAULT_BACKUP_COUNT = 10  # Rotated single-file segments to keep
+DEFAULT_MAX_FILES = 1000  # Per-run files to keep per task in separate_files mode
+QUEUE_SIZE = 1024  # Chunks buffered between task runners and the writer thread
+RUN_BUFFER_BYTES = 64 * 1024  # Output an overlapping single_file run collects before writing it as one block
+COMPRESSION_METHODS = ("gzip", "zstd", "none")
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def compression_method(name):
+    """Map a save_output compression setting to a method name, or None for no compression."""
+    return None if name in (None, "none") else name
+
+
+def compress_file(path, compression):
+    """Compress path next to itself and remove the original. Returns the new path."""
+    if compression == "zstd" and zstandard is None:
+        logger.warning("zstandard is not installed; compressing with gzip instead")
+        compression = "gzip"
+    target = path + COMPRESSION_SUFFIXES[compression]
+    with open(path, "rb") as source:
+        if compression == "zstd":
+            with open(target, "wb") as raw, zstandard.ZstdCompressor().stream_writer(raw) as destination:
+                shutil.copyfileobj(source, destination)
+        else:
+            with gzip.open(target, "wb") as destination:
+                shutil.copyfileobj(source, destination)
+    os.remove(path)
+    return target
+
+
+def prune_files(paths, keep, max_age_days):
+    """Delete all but the newest `keep` paths, and any older than max_age_days."""
+    entries = []
+    for path in paths:
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:
+            continue  # Removed concurrently
+    entries.sort(reverse=True)
+    cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+    for index, (mtime, path) in enumerate(entries):
+        if (keep is not None and index >= keep) or (cutoff is not None and mtime < cutoff):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Failed to remove old output file {path}: {e}")
+
+
+class SingleFileSink:
+    """Appends every run to one file, rotating it by size and/or age."""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, rotate_seconds=None,
+                 backup_count=DEFAULT_BACKUP_COUNT, max_age_days=None, compression="gzip"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.max_age_days = max_age_days
+        self.compression = compression
+        self.file = None
+        self.segment_started = None  # When this process started appending to the active file
+        self.active_runs = 0
+        self.buffers = {}  # run_id -> output not yet written
+        self.written_runs = set()  # Active runs that already have output in the file
+        self.last_run = None  # Run whose output was written last to the active file
+
+    def reserve_path(self, task):
+        return self.path
+
+    def open_run(self, run_id, task, path):
+        self.open_file()  # An unwritable path fails here, before the run is registered
+        self.active_runs += 1
+        header = f"\n--- Output at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} [run {run_id}] ---\n"
+        self.buffers[run_id] = bytearray(header.encode())
+
+    def open_file(self):
+        if self.file is None:
+            self.file = open(self.path, "ab")
+            if self.segment_started is None:
+                self.segment_started = time.time()
+
+    def write(self, run_id, data, finish):
+        buffer = self.buffers[run_id]
+        buffer += data
+        # A run on its own writes through; overlapping runs are grouped into blocks
+        if self.active_runs == 1 or len(buffer) >= RUN_BUFFER_BYTES:
+            self.write_block(run_id, finish)
+
+    def write_block(self, run_id, finish):
+        buffer = self.buffers[run_id]
+        if not buffer:
+            return
+        self.open_file()
+        if run_id in self.written_runs and self.last_run != run_id:
+            self.file.write(f"\n--- [run {run_id}] continued ---\n".encode())
+        self.file.write(buffer)
+        buffer.clear()
+        self.written_runs.add(run_id)
+        self.last_run = run_id
+        if self.needs_rotation():
+            self.rotate(finish)
+
+    def close_run(self, run_id, finish):
+        self.write_block(run_id, finish)
+        del self.buffers[run_id]
+        self.written_runs.discard(run_id)
+        self.active_runs -= 1
+        if self.file is None:
+            return
+        self.file.flush()
+        if self.needs_rotation():
+            self.rotate(finish)
+        elif self.active_runs == 0:
+            self.file.close()
+            self.file = None
+
+    def abort_run(self, run_id):
+        """Forget a run whose output could not be written."""
+        if self.buffers.pop(run_id, None) is None:
+            return
+        self.written_runs.discard(run_id)
+        self.active_runs -= 1
+        if self.active_runs == 0:
+            self.close()
+
+    def needs_rotation(self):
+        if self.max_bytes and self.file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self.segment_started >= self.rotate_seconds
+
+    def rotate(self, finish):
+        """Move the active file aside and hand the segment to the background finisher."""
+        self.file.close()
+        self.file = None
+        self.segment_started = None
+        self.last_run = None
+        segment = f"{self.path}.{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        os.replace(self.path, segment)
+        finish(self.finish_segment, segment)
+
+    def finish_segment(self, segment):
+        if self.compression:
+            compress_file(segment, self.compression)
+        directory = os.path.dirname(self.path) or "."
+        # Only segments named by rotate(), never other files that share the prefix
+        pattern = re.compile(rf"^{re.escape(os.path.basename(self.path))}\.\d{{8}}_\d{{6}}_\d{{6}}(\.gz|\.zst)?$")
+        segments = [os.path.join(directory, name) for name in os.listdir(directory) if pattern.match(name)]
+        prune_files(segments, self.backup_count, self.max_age_days)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class SeparateFilesSink:
+    """Writes each run to its own file in a directory, with per-task retention."""
+
+    def __init__(self, directory, max_files=DEFAULT_MAX_FILES, max_age_days=None, compression=None):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_age_days = max_age_days
+        self.compression = compression
+        self.files = {}  # run_id -> (file, task_name)
+        self.reserved = set()  # Paths handed out but not yet opened by the writer
+
+    def reserve_path(self, task):
+        """Pick a unique file name for a new run. Called under the manager lock."""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(self.directory, f"{task['task_name']}_{timestamp}.txt")
+        suffix = 1
+        while path in self.reserved or os.path.exists(path):
+            path = os.path.join(self.directory, f"{task['task_name']}_{timestamp}_{suffix}.txt")
+            suffix += 1
+        self.reserved.add(path)
+        return path
+
+    def open_run(self, run_id, task, path):
+        self.reserved.discard(path)
+        self.files[run_id] = (open(path, "wb"), task["task_name"])
+
+    def write(self, run_id, data, finish):
+        self.files[run_id][0].write(data)
+
+    def close_run(self, run_id, finish):
+        file, task_name = self.files.pop(run_id)
+        file.close()
+        finish(self.finish_run, file.name, task_name)
+
+    def abort_run(self, run_id):
+        """Forget a run whose output could not be written."""
+        file, _ = self.files.pop(run_id, (None, None))
+        if file:
+            file.close()
+
+    def finish_run(self, path, task_name):
+        if self.compression:
+            compress_file(path, self.compression)
+        pattern = re.compile(rf"^{re.escape(task_name)}_\d{{8}}_\d{{6}}(_\d+)?\.txt(\.gz|\.zst)?$")
+        runs = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if pattern.match(name)]
+        prune_files(runs, self.max_files, self.max_age_days)
+
+    def close(self):
+        for file, _ in self.files.values():
+            file.close()
+        self.files.clear()
+
+
+class RunOutput:
+    """Handle a task runner uses to stream one run's output into a sink.
+
+    If the sink fails, error says why and the rest of the run's output is dropped.
+    """
+
+    def __init__(self, manager, sink, run_id, path):
+        self.manager = manager
+        self.sink = sink
+        self.run_id = run_id
+        self.path = path  # File the run's output goes to (before any compression)
+        self.error = None  # Set by the writer thread
+        self.closed = threading.Event()  # Set once the writer has handled close()
+
+    def write(self, data):
+        if data and self.error is None:
+            self.manager.queue.put(("write", self, data))
+
+    def close(self):
+        self.manager.queue.put(("close", self, None))
+
+    def wait(self, timeout=None):
+        """Block until the writer has handled close(); return the sink error, or None."""
+        self.closed.wait(timeout)
+        return self.error
+
+
+class OutputSinkManager:
+    """Routes task output to sinks through a background writer thread."""
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.sinks = {}  # (method, path) -> (settings, sink)
+        self.lock = threading.Lock()
+        self.run_ids = iter(range(1, 2 ** 63))
+        self.finisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sits-output-finish")
+        self.writer_thread = threading.Thread(target=self.run_writer, name="sits-output-writer", daemon=True)
+        self.writer_thread.start()
+
+    def get_sink(self, save_output):
+        """Return the shared sink for a task's save_output settings.
+
+        Changed settings for a path get a new sink; runs still writing
+        through the old one finish there.
+        """
+        method, path = save_output["method"], save_output["path"]
+        settings = tuple(sorted((key, value) for key, value in save_output.items() if key != "enabled"))
+        with self.lock:
+            cached_settings, sink = self.sinks.get((method, path), (None, None))
+            if sink is None or cached_settings != settings:
+                if method == "single_file":
+                    sink = SingleFileSink(
+                        path,
+                        max_bytes=save_output.get("max_bytes", DEFAULT_MAX_BYTES),
+                        rotate_seconds=save_output.get("rotate_seconds"),
+                        backup_count=save_output.get("backup_count", DEFAULT_BACKUP_COUNT),
+                        max_age_days=save_output.get("max_age_days"),
+                        compression=compression_method(save_output.get("compression", "gzip")),
+                    )
+                elif method == "separate_files":
+                    sink = SeparateFilesSink(
+                        path,
+                        max_files=save_output.get("max_files", DEFAULT_MAX_FILES),
+                        max_age_days=save_output.get("max_age_days"),
+                        compression=compression_method(save_output.get("compression")),
+                    )
+                else:
+                    raise ValueError(f"Unknown output method '{method}'")
+                self.sinks[(method, path)] = (settings, sink)
+        return sink
+
+    def open_run(self, task):
+        """Start capturing one run of a task; returns a RunOutput to write to and close."""
+        sink = self.get_sink(task["save_output"])
+        with self.lock:
+            run_id = next(self.run_ids)
+            path = sink.reserve_path(task)
+        run = RunOutput(self, sink, run_id, path)
+        self.queue.put(("open", run, (task, path)))
+        return run
+
+    def run_writer(self):
+        """Apply queued sink operations in order on a single thread.
+
+        The first failure of a run is logged and stored on its RunOutput; the
+        run's later operations are dropped.
+        """
+        while True:
+            action, run, payload = self.queue.get()
+            if action == "stop":
+                self.queue.task_done()
+                return
+            try:
+                if run.error is None:
+                    self.apply(action, run, payload)
+            finally:
+                if action == "close":
+                    run.closed.set()
+                self.queue.task_done()
+
+    def apply(self, action, run, payload):
+        try:
+            if action == "open":
+                run.sink.open_run(run.run_id, *payload)
+            elif action == "write":
+                run.sink.write(run.run_id, payload, self.finish)
+            elif action == "close":
+                run.sink.close_run(run.run_id, self.finish)
+        except Exception as e:
+            run.error = str(e)
+            logger.error(f"Output sink {action} failed for {run.path}: {e}; the run's remaining output is dropped")
+            try:
+                run.sink.abort_run(run.run_id)
+            except Exception as cleanup_error:
+                logger.error(f"Failed to clean up output of {run.path}: {cleanup_error}")
+
+    def finish(self, fn, *args):
+        """Run compression and retention off the writer thread."""
+        def run():
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"Failed to finish output segment: {e}")
+        self.finisher.submit(run)
+
+    def flush(self):
+        """Block until every queued write has reached its sink."""
+        self.queue.join()
+
+    def close(self):
+        """Drain the queue, close all sinks and wait for background compression."""
+        self.queue.put(("stop", None, None))
+        self.writer_thread.join()
+        with self.lock:
+            for _, sink in self.sinks.values():
+                sink.close()
+        self.finisher.shutdown(wait=True)
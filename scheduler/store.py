@@ -0,0 +1,274 @@
+# scheduler/store.py
+"""Transactional SQLite store for scheduled tasks.
+
+Each task is one row, so saving a change touches only the rows that changed.
+The database runs in WAL mode: writers commit atomically, a crash mid-write
+never loses the schedule, and the FastAPI process can read while the
+scheduler writes.
+"""
+import os
+import json
+import sqlite3
+import threading
+import logging
+import uuid
+import base64
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
+TASK_DB = os.path.join(CONFIG_DIR, "scheduled_tasks.db")
+LEGACY_SCHEDULE_FILE = os.path.join(CONFIG_DIR, "scheduled_tasks.json")  # Pre-SQLite task file
+
+
+def encode_task(task):
+    """Serialize a task dictionary to a JSON row payload."""
+    return json.dumps({**task, "next_run": task["next_run"].isoformat()})
+
+
+def decode_task(data):
+    """Deserialize a JSON row payload back to a task dictionary."""
+    task = json.loads(data)
+    task["next_run"] = datetime.fromisoformat(task["next_run"])
+    return task
+
+
+def encode_cursor(next_run, task_id):
+    return base64.urlsafe_b64encode(json.dumps([next_run, task_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        next_run, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(next_run), str(task_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+
+
+class TaskStore:
+    """One row per task in a WAL-mode SQLite database."""
+
+    def __init__(self, db_path=TASK_DB, legacy_file=LEGACY_SCHEDULE_FILE):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints, atomic always
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.create_schema()
+        if legacy_file:
+            self.import_legacy_file(legacy_file)
+        self.seen_data_version = self.data_version()
+
+    def create_schema(self):
+        with self.lock:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    schedule_type TEXT NOT NULL,
+                    next_run TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS tasks_next_run ON tasks (next_run, task_id);
+                CREATE INDEX IF NOT EXISTS tasks_type_next_run ON tasks (schedule_type, next_run, task_id);
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+            """)
+
+    def import_legacy_file(self, legacy_file):
+        """Import tasks from scheduled_tasks.json once, the first time the database is opened."""
+        with self.lock:
+            imported = self.conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone()
+        if imported:
+            return
+        tasks = []
+        if os.path.exists(legacy_file) and os.path.getsize(legacy_file) > 0:
+            try:
+                with open(legacy_file, "r") as file:
+                    tasks = json.load(file)
+                for task in tasks:
+                    task["next_run"] = datetime.fromisoformat(task["next_run"])
+                    task.setdefault("task_id", uuid.uuid4().hex)
+                    task.setdefault("paused", False)
+            except (json.JSONDecodeError, KeyError, ValueError) as e:
+                logger.error(f"Failed to import legacy scheduled tasks from {legacy_file}: {e}")
+                return
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.upsert_rows(tasks)
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_imported', ?)",
+                                  (datetime.now().isoformat(),))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        if tasks:
+            logger.info(f"Imported {len(tasks)} task(s) from {legacy_file}")
+
+    def load_tasks(self):
+        """Return every stored task. Rows that cannot be decoded are skipped and logged."""
+        with self.lock:
+            rows = self.conn.execute("SELECT task_id, data FROM tasks ORDER BY rowid").fetchall()
+        tasks = []
+        for task_id, data in rows:
+            try:
+                tasks.append(decode_task(data))
+            except (json.JSONDecodeError, KeyError, ValueError) as e:
+                logger.error(f"Skipping unreadable scheduled task {task_id}: {e}")
+        return tasks
+
+    def get_task(self, task_id):
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return decode_task(row[0]) if row else None
+
+    def list_page(self, limit=100, cursor=None, schedule_type=None, next_run_after=None, next_run_before=None):
+        """Return (tasks, next_cursor) ordered by next_run, using keyset pagination.
+
+        The cursor is opaque to callers; pass back the returned next_cursor to
+        get the following page, or stop when it is None.
+        """
+        clauses, params = [], []
+        if schedule_type:
+            clauses.append("schedule_type = ?")
+            params.append(schedule_type)
+        if next_run_after:
+            clauses.append("next_run >= ?")
+            params.append(next_run_after.isoformat())
+        if next_run_before:
+            clauses.append("next_run < ?")
+            params.append(next_run_before.isoformat())
+        if cursor:
+            last_next_run, last_task_id = decode_cursor(cursor)
+            clauses.append("(next_run, task_id) > (?, ?)")
+            params.extend([last_next_run, last_task_id])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT next_run, task_id, data FROM tasks {where} ORDER BY next_run, task_id LIMIT ?",
+                (*params, limit + 1)
+            ).fetchall()
+        next_cursor = encode_cursor(rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+        return [decode_task(data) for _, _, data in rows[:limit]], next_cursor
+
+    def update_tasks(self, task_ids, update):
+        """Read, modify and write tasks in one transaction.
+
+        `update(task)` returns the modified task, or None to delete it. Returns
+        (updated tasks, ids that were not found).
+        """
+        task_ids = list(dict.fromkeys(task_ids))
+        changed, deletes, missing = [], [], []
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for task_id in task_ids:
+                    row = self.conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+                    if row is None:
+                        missing.append(task_id)
+                        continue
+                    task = update(decode_task(row[0]))
+                    if task is None:
+                        deletes.append(task_id)
+                    else:
+                        changed.append(task)
+                self.upsert_rows(changed)
+                if deletes:
+                    self.conn.executemany("DELETE FROM tasks WHERE task_id = ?", [(task_id,) for task_id in deletes])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return changed, missing
+
+    def data_version(self):
+        with self.lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def has_external_changes(self):
+        """True if another connection (e.g. the REST API process) committed since the last check."""
+        version = self.data_version()
+        if version == self.seen_data_version:
+            return False
+        self.seen_data_version = version
+        return True
+
+    def write_batch(self, upserts=(), deletes=()):
+        """Atomically upsert and delete tasks in a single transaction."""
+        upserts = list(upserts)
+        deletes = list(deletes)
+        if not upserts and not deletes:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.upsert_rows(upserts)
+                if deletes:
+                    self.conn.executemany("DELETE FROM tasks WHERE task_id = ?", [(task_id,) for task_id in deletes])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def merge_batch(self, changes=(), deletes=()):
+        """Atomically write (task, fields) changes and delete tasks in a single transaction.
+
+        With fields None the whole task is written. Otherwise only those fields
+        are copied onto the stored row, so edits other processes made to the
+        rest of the task survive, and a task deleted meanwhile is not recreated.
+        Returns (the rows as written, ids of partial changes whose task was gone).
+        """
+        changes = list(changes)
+        deletes = list(deletes)
+        written, missing = [], []
+        if not changes and not deletes:
+            return written, missing
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for task, fields in changes:
+                    if fields is not None:
+                        row = self.conn.execute(
+                            "SELECT data FROM tasks WHERE task_id = ?", (task["task_id"],)
+                        ).fetchone()
+                        if row is None:
+                            missing.append(task["task_id"])
+                            continue
+                        try:
+                            stored = decode_task(row[0])
+                        except (json.JSONDecodeError, KeyError, ValueError) as e:
+                            logger.error(f"Replacing unreadable scheduled task {task['task_id']}: {e}")
+                        else:
+                            for field in fields:
+                                if field in task:
+                                    stored[field] = task[field]
+                                else:
+                                    stored.pop(field, None)
+                            task = stored
+                    written.append(task)
+                self.upsert_rows(written)
+                if deletes:
+                    self.conn.executemany("DELETE FROM tasks WHERE task_id = ?", [(task_id,) for task_id in deletes])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return written, missing
+
+    def upsert_rows(self, tasks):
+        """Write task rows. Caller must hold the lock and own the transaction."""
+        self.conn.executemany(
+            "INSERT INTO tasks (task_id, schedule_type, next_run, data) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(task_id) DO UPDATE SET schedule_type = excluded.schedule_type, "
+            "next_run = excluded.next_run, data = excluded.data",
+            [(task["task_id"], task["schedule_type"], task["next_run"].isoformat(), encode_task(task))
+             for task in tasks]
+        )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -13,6 +13,8 @@ import platform
 import shlex
 import shutil
 
+from utils.warm_runner import WarmRunnerError, get_warm_runner
+
 
 class ScriptExecutor:
     CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config')
@@ -331,13 +333,15 @@ class ScriptExecutor:
                 else:
                     messagebox.showerror("Error", "Unsupported operating system.")
             else:
-                process = subprocess.Popen(
-                    [sys.executable, script_path],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    bufsize=1
-                )
+                process = self.start_warm(script_path)
+                if process is None:
+                    process = subprocess.Popen(
+                        [sys.executable, script_path],
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                        text=True,
+                        bufsize=1
+                    )
 
                 def read_stream(stream):
                     for line in iter(stream.readline, ''):
@@ -358,6 +362,22 @@ class ScriptExecutor:
         except Exception as e:
             self.output_queue.put(f"\nFailed to execute script:\n{str(e)}\n")
 
+    def start_warm(self, script_path):
+        """Starts the script through the warm runner if it is enabled; returns None to fall back to a new interpreter."""
+        runner = get_warm_runner()
+        if runner is None:
+            return None
+        try:
+            return runner.popen(
+                [script_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+        except WarmRunnerError as e:
+            self.output_queue.put(f"[Warm runner unavailable, starting a new interpreter: {e}]\n")
+            return None
+
     def process_output_queue(self):
         """Processes the output queue and updates the output_text widget."""
         while not self.output_queue.empty():
@@ -9,12 +9,11 @@ import sys
 import psutil
 from multiprocessing import Process
 
-# Configure logging to capture initialization and process management errors
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler(sys.stdout)]
-)
+from utils.logging_setup import setup_logging
+
+# Configure logging to capture initialization and process management errors.
+# Records are written by a background thread, so logging never stalls the Tk main loop.
+setup_logging("sits", console=sys.stdout)
 
 
 class UnifiedApp:
@@ -0,0 +1,155 @@
+# utils/admission.py
+"""Admission control for endpoints that spawn subprocesses.
+
+Requests take a slot before starting a child. A global limit and a
+per-client limit bound how many run at once. Requests over the limit wait in
+a bounded FIFO queue until a slot frees up or their timeout passes. When a
+client already has too many requests pending, or the queue is full, the
+request is rejected at once with a Retry-After hint, rather than piling up
+children on the host.
+
+The controller is not thread-safe; use it from the event loop only.
+"""
+import math
+import time
+import asyncio
+import logging
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT = 8  # Children running at once across all clients
+MAX_PER_CLIENT = 4  # Children running at once per client
+MAX_QUEUED = 64  # Requests waiting for a slot across all clients
+MAX_QUEUED_PER_CLIENT = 16  # Requests waiting for a slot per client
+QUEUE_TIMEOUT_SECONDS = 30.0
+WAIT_SAMPLES = 1000  # Recent wait and hold times kept for metrics and Retry-After
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries the HTTP status and Retry-After seconds."""
+
+    def __init__(self, status_code, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Global and per-client concurrency limits with a bounded, timed wait queue."""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT, max_per_client=MAX_PER_CLIENT, max_queued=MAX_QUEUED,
+                 max_queued_per_client=MAX_QUEUED_PER_CLIENT, queue_timeout=QUEUE_TIMEOUT_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.max_per_client = max_per_client
+        self.max_queued = max_queued
+        self.max_queued_per_client = max_queued_per_client
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.client_active = Counter()
+        self.client_queued = Counter()
+        self.waiters = deque()  # (future, client_id) in arrival order
+        self.wait_times = deque(maxlen=WAIT_SAMPLES)
+        self.hold_times = deque(maxlen=WAIT_SAMPLES)
+        self.counters = Counter()  # admitted, rejected_client, rejected_queue_full, timed_out
+
+    def can_start(self, client_id):
+        return self.active < self.max_concurrent and self.client_active[client_id] < self.max_per_client
+
+    def start(self, client_id):
+        self.active += 1
+        self.client_active[client_id] += 1
+
+    def retry_after(self):
+        """Estimate seconds until a queued request would get a slot."""
+        average_hold = sum(self.hold_times) / len(self.hold_times) if self.hold_times else 1.0
+        estimate = average_hold * (len(self.waiters) + 1) / self.max_concurrent
+        return max(1, min(60, math.ceil(estimate)))
+
+    async def acquire(self, client_id, queue_limits=True):
+        """Wait for a slot; raises AdmissionRejected if the request cannot be admitted.
+
+        With queue_limits false the caller waits as long as it takes, ignoring the
+        queue caps and timeout; for work that belongs to a request already accepted.
+        """
+        if queue_limits and self.client_queued[client_id] >= self.max_queued_per_client:
+            self.counters["rejected_client"] += 1
+            raise AdmissionRejected(429, "Too many concurrent requests from this client.", self.retry_after())
+        started = time.monotonic()
+        # Waiters only remain queued while they are blocked, so a free slot is ours to take
+        if self.can_start(client_id):
+            self.start(client_id)
+        else:
+            if queue_limits and len(self.waiters) >= self.max_queued:
+                self.counters["rejected_queue_full"] += 1
+                raise AdmissionRejected(503, "Server is busy; execution queue is full.", self.retry_after())
+            waiter = asyncio.get_running_loop().create_future()
+            entry = (waiter, client_id)
+            self.waiters.append(entry)
+            self.client_queued[client_id] += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout if queue_limits else None)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.done() and not waiter.cancelled():
+                    # Granted a slot just as we gave up: hand it on
+                    self.release(client_id)
+                else:
+                    waiter.cancel()
+                    self.waiters.remove(entry)
+                if isinstance(e, asyncio.TimeoutError):
+                    self.counters["timed_out"] += 1
+                    raise AdmissionRejected(503, "Timed out waiting for an execution slot.", self.retry_after())
+                raise
+            finally:
+                self.client_queued[client_id] -= 1
+                if not self.client_queued[client_id]:
+                    del self.client_queued[client_id]
+        self.counters["admitted"] += 1
+        self.wait_times.append(time.monotonic() - started)
+
+    def release(self, client_id, held_seconds=None):
+        """Free a slot and grant it to the oldest waiter that is under its client limit."""
+        if held_seconds is not None:
+            self.hold_times.append(held_seconds)
+        self.active -= 1
+        self.client_active[client_id] -= 1
+        if not self.client_active[client_id]:
+            del self.client_active[client_id]
+        for entry in list(self.waiters):
+            waiter, waiting_client = entry
+            if self.can_start(waiting_client):
+                self.waiters.remove(entry)
+                self.start(waiting_client)
+                waiter.set_result(None)
+            if self.active >= self.max_concurrent:
+                break
+
+    @asynccontextmanager
+    async def admit(self, client_id, queue_limits=True):
+        """Hold a slot for the duration of the block."""
+        await self.acquire(client_id, queue_limits)
+        held = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(client_id, time.monotonic() - held)
+
+    def stats(self):
+        wait_times = sorted(self.wait_times)
+        return {
+            "active": self.active,
+            "queued": len(self.waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_per_client": self.max_per_client,
+            "max_queued": self.max_queued,
+            "clients": len(self.client_active.keys() | self.client_queued.keys()),
+            "admitted": self.counters["admitted"],
+            "rejected_client": self.counters["rejected_client"],
+            "rejected_queue_full": self.counters["rejected_queue_full"],
+            "timed_out": self.counters["timed_out"],
+            "wait_seconds_avg": sum(wait_times) / len(wait_times) if wait_times else 0.0,
+            "wait_seconds_p95": wait_times[max(0, math.ceil(len(wait_times) * 0.95) - 1)] if wait_times else 0.0,
+            "wait_seconds_max": wait_times[-1] if wait_times else 0.0,
+        }
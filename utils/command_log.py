@@ -0,0 +1,245 @@
+# utils/command_log.py
+"""Append-only, searchable on-disk log of executed commands.
+
+One JSON object per line, in the order commands were received. A sparse
+index of (timestamp, byte offset) pairs every INDEX_INTERVAL entries lets a
+time-range query seek close to its start instead of scanning from the top.
+Retention is enforced by compaction: retained entries are copied to a new
+file that replaces the old one atomically. Compaction runs without blocking
+appends; only the final copy of newly appended lines holds the lock.
+"""
+import os
+import json
+import base64
+import bisect
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
+COMMAND_LOG = os.path.join(CONFIG_DIR, "command_history.jsonl")
+RETENTION_DAYS = 90
+MAX_LOG_BYTES = 64 * 1024 * 1024
+INDEX_INTERVAL = 256  # Entries between sparse index points
+COMPACT_CHECK_INTERVAL = 1000  # Appends between retention checks
+
+
+def encode_cursor(generation, offset):
+    return base64.urlsafe_b64encode(json.dumps([generation, offset]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        generation, offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(generation), int(offset)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+
+
+class CommandLog:
+    """JSONL command log with a sparse time index, retention and paginated search."""
+
+    def __init__(self, path=COMMAND_LOG, retention_days=RETENTION_DAYS, max_bytes=MAX_LOG_BYTES):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.compacting = False
+        self.appends_since_check = 0
+        self.index_times = []  # Timestamps (ISO strings) of indexed entries, ascending
+        self.index_offsets = []  # Byte offsets of the same entries
+        self.entry_count = 0
+        self.file = open(self.path, "ab")
+        self.size = self.file.tell()
+        # Compaction swaps in a new file, so cursors carry the inode they were issued for
+        self.generation = os.fstat(self.file.fileno()).st_ino
+        self.build_index()
+        self.maybe_compact()
+
+    def build_index(self):
+        """Scan the log once to rebuild the sparse index."""
+        index = ([], [], 0, 0)
+        with open(self.path, "rb") as file:
+            for line in file:
+                index = self.index_line(index, line)
+        self.index_times, self.index_offsets, self.entry_count, _ = index
+
+    def index_line(self, index, line):
+        """Advance a (times, offsets, entry count, size) index over one more line."""
+        times, offsets, count, size = index
+        if count % INDEX_INTERVAL == 0:
+            timestamp = self.parse_timestamp(line)
+            if timestamp is not None:
+                times.append(timestamp)
+                offsets.append(size)
+        return times, offsets, count + 1, size + len(line)
+
+    @staticmethod
+    def parse_timestamp(line):
+        try:
+            return json.loads(line)["timestamp"]
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def append(self, command, timestamp=None):
+        """Append one command; returns the stored entry."""
+        entry = {"timestamp": (timestamp or datetime.now()).isoformat(timespec="microseconds"), "command": command}
+        line = (json.dumps(entry) + "\n").encode()
+        with self.lock:
+            if self.entry_count % INDEX_INTERVAL == 0:
+                self.index_times.append(entry["timestamp"])
+                self.index_offsets.append(self.size)
+            self.file.write(line)
+            self.file.flush()
+            self.size += len(line)
+            self.entry_count += 1
+            self.appends_since_check += 1
+            check = self.appends_since_check >= COMPACT_CHECK_INTERVAL or self.size > self.max_bytes
+        if check:
+            self.maybe_compact()
+        return entry
+
+    def needs_compaction(self):
+        if self.size > self.max_bytes:
+            return True
+        if self.retention_days and self.index_times:
+            cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat(timespec="microseconds")
+            return self.index_times[0] < cutoff
+        return False
+
+    def maybe_compact(self):
+        """Compact in a background thread if retention limits are exceeded."""
+        with self.lock:
+            self.appends_since_check = 0
+            if self.compacting or not self.needs_compaction():
+                return
+            self.compacting = True
+        threading.Thread(target=self.compact, name="sits-command-log-compact", daemon=True).start()
+
+    def compact(self):
+        """Rewrite the log keeping entries inside the retention window and under the size limit."""
+        try:
+            with self.lock:
+                end = self.size
+            cutoff = None
+            if self.retention_days:
+                cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat(timespec="microseconds")
+            # Newest entries win when trimming for size: keep at most half the limit to leave headroom
+            budget = self.max_bytes // 2
+            start = 0
+            with open(self.path, "rb") as source:
+                if end > budget:
+                    source.seek(end - budget)
+                    source.readline()  # Skip to the next full line
+                    start = source.tell()
+                source.seek(start)
+                kept = []
+                position = start
+                while position < end:
+                    line = source.readline()
+                    position += len(line)
+                    timestamp = self.parse_timestamp(line)
+                    if timestamp is not None and (cutoff is None or timestamp >= cutoff):
+                        kept.append(line)
+            # Index the new file as it is written, so the swap below stays short
+            index = ([], [], 0, 0)  # times, offsets, entry count, size
+            temp_path = self.path + ".compact"
+            with open(temp_path, "wb") as target:
+                for line in kept:
+                    index = self.index_line(index, line)
+                target.writelines(kept)
+                with self.lock:
+                    # Carry over lines appended while we were filtering, then swap files
+                    with open(self.path, "rb") as source:
+                        source.seek(end)
+                        for line in source:
+                            index = self.index_line(index, line)
+                            target.write(line)
+                    target.flush()
+                    os.fsync(target.fileno())
+                    os.replace(temp_path, self.path)
+                    self.file.close()
+                    self.file = open(self.path, "ab")
+                    self.generation = os.fstat(self.file.fileno()).st_ino
+                    self.index_times, self.index_offsets, self.entry_count, self.size = index
+            logger.info(f"Compacted command log {self.path}: {self.entry_count} entries, {self.size} bytes")
+        except OSError as e:
+            logger.error(f"Failed to compact command log {self.path}: {e}")
+        finally:
+            with self.lock:
+                self.compacting = False
+
+    def search(self, contains=None, prefix=None, since=None, until=None, limit=100, cursor=None):
+        """Return (entries, next_cursor) in time order, filtered by substring, prefix and time range."""
+        since_key = since.isoformat(timespec="microseconds") if since else None
+        until_key = until.isoformat(timespec="microseconds") if until else None
+        with self.lock:
+            generation, end = self.generation, self.size
+            offset = 0
+            if cursor:
+                cursor_generation, offset = decode_cursor(cursor)
+                if cursor_generation != generation:
+                    raise ValueError("Cursor expired; the history was compacted. Restart the search.")
+            elif since_key:
+                # Seek to the last index point before `since`
+                position = bisect.bisect_left(self.index_times, since_key) - 1
+                offset = self.index_offsets[position] if position >= 0 else 0
+            # Hold the file open across a concurrent compaction swap
+            source = open(self.path, "rb")
+        entries = []
+        with source:
+            source.seek(offset)
+            while offset < end:
+                line = source.readline()
+                if not line:
+                    break
+                offset += len(line)
+                # Cheap raw-bytes prefilter before decoding JSON
+                if contains and contains.encode() not in line and json.dumps(contains)[1:-1].encode() not in line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if since_key and entry["timestamp"] < since_key:
+                    continue
+                if until_key and entry["timestamp"] >= until_key:
+                    return entries, None
+                if contains and contains not in entry["command"]:
+                    continue
+                if prefix and not entry["command"].startswith(prefix):
+                    continue
+                entries.append(entry)
+                if len(entries) >= limit:
+                    return entries, (encode_cursor(generation, offset) if offset < end else None)
+        return entries, None
+
+    def recent(self, count):
+        """Return the last `count` entries, oldest first, reading backwards from the end of the log."""
+        with self.lock:
+            end = self.size
+            source = open(self.path, "rb")
+        with source:
+            block = 64 * 1024
+            data = b""
+            position = end
+            while position > 0 and data.count(b"\n") <= count:
+                step = min(block, position)
+                position -= step
+                source.seek(position)
+                data = source.read(step) + data
+        # The first line may be cut off; it is dropped unless the whole file was read
+        lines = data.splitlines()[-count:] if count else []
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+        return entries
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,122 @@
+# utils/dir_listing.py
+"""Single-pass, paginated directory listing.
+
+os.scandir yields each entry's type from the directory read itself, so
+listing, filtering and sorting by name or type need no per-entry stat.
+Only the entries on the returned page are stat'ed for size and mtime,
+unless the listing is sorted by one of those. Pages are keyset-paginated:
+the cursor holds the sort key of the last entry returned. Entries added or
+removed between requests therefore never shift later pages.
+"""
+import os
+import json
+import base64
+import fnmatch
+
+SORT_FIELDS = ("name", "type", "size", "mtime")
+ENTRY_TYPES = ("file", "directory", "symlink", "other")
+
+
+def entry_type(entry):
+    """Type of a DirEntry without following symlinks; usually free on Linux (d_type)."""
+    try:
+        if entry.is_symlink():
+            return "symlink"
+        if entry.is_dir(follow_symlinks=False):
+            return "directory"
+        if entry.is_file(follow_symlinks=False):
+            return "file"
+    except OSError:
+        pass
+    return "other"
+
+
+def entry_stat(entry):
+    """stat() of a DirEntry, following symlinks like /metadata does; lstat for broken links. None if gone."""
+    try:
+        return entry.stat()
+    except FileNotFoundError:
+        try:
+            return entry.stat(follow_symlinks=False)
+        except OSError:
+            return None
+    except OSError:
+        return None
+
+
+def scan_directory(path):
+    """Return [(DirEntry, type)] for a directory in one pass."""
+    with os.scandir(path) as entries:
+        return [(entry, entry_type(entry)) for entry in entries]
+
+
+def encode_cursor(sort, descending, key):
+    return base64.urlsafe_b64encode(json.dumps([sort, descending, list(key)]).encode()).decode()
+
+
+def decode_cursor(cursor, sort, descending):
+    try:
+        cursor_sort, cursor_descending, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if cursor_sort != sort or cursor_descending != descending:
+        raise ValueError("Cursor was issued for a different sort order.")
+    return tuple(key)
+
+
+def list_directory(path, pattern=None, types=None, include_hidden=True, sort="name", descending=False,
+                   limit=1000, cursor=None, scan=scan_directory, stat=entry_stat):
+    """Return (entries, next_cursor, total) for one page of a directory.
+
+    pattern is a glob matched against names (case-sensitive), and types
+    restricts entry types. total counts every entry that matches the
+    filters. scan and stat can be swapped for cached versions.
+    Raises ValueError for a bad sort field or cursor, and OSError from the scan.
+    """
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of {', '.join(SORT_FIELDS)}.")
+    after = decode_cursor(cursor, sort, descending) if cursor else None
+
+    matches = [
+        (entry, kind) for entry, kind in scan(path)
+        if (include_hidden or not entry.name.startswith("."))
+        and (pattern is None or fnmatch.fnmatchcase(entry.name, pattern))
+        and (types is None or kind in types)
+    ]
+    stats = {}
+
+    def key(item):
+        entry, kind = item
+        if sort == "name":
+            return (entry.name,)
+        if sort == "type":
+            return (kind, entry.name)
+        if entry.name not in stats:
+            stats[entry.name] = stat(entry)
+        result = stats[entry.name]
+        if result is None:
+            return (-1, entry.name)  # Vanished since the scan
+        return (result.st_size if sort == "size" else result.st_mtime_ns, entry.name)
+
+    keyed = sorted(((key(item), item) for item in matches), key=lambda pair: pair[0], reverse=descending)
+    start = 0
+    if after is not None:
+        start = next(
+            (index for index, (item_key, _) in enumerate(keyed) if (item_key < after if descending else item_key > after)),
+            len(keyed)
+        )
+    page = keyed[start:start + limit]
+
+    entries = []
+    for _, (entry, kind) in page:
+        result = stats[entry.name] if entry.name in stats else stat(entry)
+        entries.append({
+            "name": entry.name,
+            "type": kind,
+            "size": result.st_size if result is not None else None,
+            "mtime": result.st_mtime if result is not None else None,
+        })
+    next_cursor = None
+    if start + limit < len(keyed) and page:
+        next_cursor = encode_cursor(sort, descending, page[-1][0])
+    return entries, next_cursor, len(matches)
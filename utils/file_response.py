@@ -0,0 +1,118 @@
+# utils/file_response.py
+"""Byte-range file responses that stream from disk in constant memory.
+
+The file is read in fixed-size chunks with os.pread on a worker thread, so
+serving the last megabyte of a huge log costs one megabyte of reads, not a
+scan. When the server offers the ASGI zero-copy send extension
+(http.response.zerocopysend), it gets the file descriptor instead and can
+use sendfile(2); the bytes then never pass through Python.
+"""
+import os
+import asyncio
+import hashlib
+import logging
+from email.utils import formatdate
+from urllib.parse import quote
+
+from starlette.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024  # Bytes read per chunk when streaming without zero-copy
+
+
+class FileTruncated(OSError):
+    """The file shrank after its Content-Length was sent; the response cannot be completed."""
+
+
+class RangeNotSatisfiable(ValueError):
+    """The requested range starts beyond the end of the file."""
+
+    def __init__(self, size):
+        super().__init__(f"Range not satisfiable for a {size}-byte file.")
+        self.size = size
+
+
+def parse_range(header, size):
+    """Parse a single-range 'bytes=' header into an inclusive (start, end), or None to serve everything.
+
+    Malformed headers, other units and multi-range requests are ignored, as
+    RFC 9110 allows. Raises RangeNotSatisfiable for a range past the end.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, separator, last = spec.strip().partition("-")
+    if not separator:
+        return None
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start is None:
+        # bytes=-N: the last N bytes
+        if end is None or end < 0:
+            return None
+        if end == 0 or size == 0:
+            raise RangeNotSatisfiable(size)
+        return max(size - end, 0), size - 1
+    if start < 0 or (end is not None and end < start):
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(size)
+    return start, size - 1 if end is None else min(end, size - 1)
+
+
+def validator_headers(stats):
+    """ETag and Last-Modified for a file, for caching and If-Range checks."""
+    tag = hashlib.md5(f"{stats.st_ino}-{stats.st_size}-{stats.st_mtime_ns}".encode(), usedforsecurity=False)
+    return {"ETag": f'"{tag.hexdigest()}"', "Last-Modified": formatdate(stats.st_mtime, usegmt=True)}
+
+
+def content_disposition(filename, disposition="attachment"):
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
+class FileRangeResponse(StreamingResponse):
+    """Serve length bytes from offset start of an open binary file; the response closes the file.
+
+    Size the response from os.fstat on the open file, not a stat of the path.
+    If the file still shrinks mid-stream, the response raises FileTruncated,
+    so the server aborts the connection rather than ending a short body.
+    """
+
+    def __init__(self, file, start, length, status_code=200, headers=None, media_type=None):
+        self.file = file
+        self.start = start
+        self.length = length
+        super().__init__(self.read_chunks(), status_code=status_code, headers=headers, media_type=media_type)
+        self.headers["content-length"] = str(length)
+
+    async def read_chunks(self):
+        loop = asyncio.get_running_loop()
+        fd = self.file.fileno()
+        position, end = self.start, self.start + self.length
+        while position < end:
+            chunk = await loop.run_in_executor(None, os.pread, fd, min(CHUNK_SIZE, end - position), position)
+            if not chunk:
+                logger.warning(f"File shrank while streaming: got {position - self.start} of {self.length} bytes")
+                raise FileTruncated(f"File ended at byte {position}, expected {end}.")
+            position += len(chunk)
+            yield chunk
+
+    async def __call__(self, scope, receive, send):
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+                await send({
+                    "type": "http.response.zerocopysend", "file": self.file,
+                    "offset": self.start, "count": self.length, "more_body": False,
+                })
+            else:
+                await super().__call__(scope, receive, send)
+        finally:
+            self.file.close()
@@ -0,0 +1,437 @@
+# utils/fs_cache.py
+"""In-process cache of directory listings and stat results, invalidated by inotify.
+
+Every cached directory is watched with inotify, along with its ancestors, so
+a rename higher up the tree is noticed too. Pending events are read without
+blocking at the start of every lookup. A change that finished before a
+request arrived is therefore never served stale, and no watcher thread is
+needed. Cached stats live with their parent directory's record. They are
+dropped when an event names them. A create, delete or rename in a directory
+also drops its listing and its own stat.
+
+Where a directory cannot be watched, its record expires after a TTL instead.
+That covers inotify being unavailable or the watch limit being reached. It
+also covers network filesystems (NFS, SMB, FUSE...), where inotify only sees
+local changes. Records are evicted least recently used first, bounded by
+directory count and by cached names plus stats. Symlinks are never cached,
+since their targets may live anywhere. Thread-safe.
+"""
+import os
+import stat
+import time
+import errno
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+from collections import Counter, OrderedDict
+
+from utils.dir_listing import scan_directory
+
+logger = logging.getLogger(__name__)
+
+MAX_DIRECTORIES = 1024  # Cached directory records (each holds inotify watches)
+MAX_ITEMS = 500000  # Cached listing entries plus stat results, across all directories
+FALLBACK_TTL_SECONDS = 5  # Lifetime of records for directories that cannot be watched
+READ_SIZE = 64 * 1024
+
+# inotify(7) event bits
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+NAME_CHANGES = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+SELF_GONE = IN_DELETE_SELF | IN_MOVE_SELF | IN_UNMOUNT
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# statfs(2) f_type of filesystems whose changes inotify may not see
+NETWORK_FILESYSTEMS = {
+    0x6969: "nfs",
+    0xFF534D42: "cifs",
+    0xFE534D42: "smb2",
+    0x517B: "smb",
+    0x65735546: "fuse",
+    0x01021997: "9p",
+    0x00C36400: "ceph",
+    0x564C: "ncp",
+    0x5346414F: "afs",
+    0x47504653: "gpfs",
+}
+
+
+def load_libc():
+    if not hasattr(os, "statvfs"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        for name in ("inotify_init1", "inotify_add_watch", "inotify_rm_watch", "statfs"):
+            getattr(libc, name)
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    libc.statfs.argtypes = [ctypes.c_char_p, ctypes.c_void_p]
+    return libc
+
+
+libc = load_libc()
+AVAILABLE = libc is not None
+
+
+def filesystem_type(path):
+    """statfs(2) f_type of the filesystem holding path, or None if unknown."""
+    if libc is None:
+        return None
+    buffer = ctypes.create_string_buffer(256)  # Larger than struct statfs; f_type is its first field
+    if libc.statfs(os.fsencode(path), buffer) != 0:
+        return None
+    return ctypes.c_ulong.from_buffer(buffer).value & 0xFFFFFFFF
+
+
+class Inotify:
+    """Minimal non-blocking inotify(7) wrapper over ctypes."""
+
+    def __init__(self):
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def rm_watch(self, wd):
+        libc.inotify_rm_watch(self.fd, wd)  # Fails harmlessly if the kernel already dropped it
+
+    def read_events(self):
+        """Return every pending (wd, mask, name) without blocking."""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                events.append((wd, mask, name))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryRecord:
+    """Cached listing and child stats of one directory."""
+
+    def __init__(self, path):
+        self.path = path
+        self.listing = None  # [(DirEntry, type)] from scan_directory, or None
+        self.stats = {}  # child name -> os.stat_result
+        self.generation = 0  # Bumped on every invalidation, so racing fills are discarded
+        self.expires_at = None  # Set when the directory is not watched
+        self.watched = []  # Paths whose watches this record holds (itself and its ancestors)
+
+    def items(self):
+        return (len(self.listing) if self.listing is not None else 0) + len(self.stats)
+
+
+class FilesystemCache:
+    """LRU cache of directory listings and stats with inotify invalidation and a TTL fallback."""
+
+    def __init__(self, max_directories=MAX_DIRECTORIES, max_items=MAX_ITEMS, fallback_ttl=FALLBACK_TTL_SECONDS,
+                 watch=True):
+        self.max_directories = max_directories
+        self.max_items = max_items
+        self.fallback_ttl = fallback_ttl
+        self.lock = threading.Lock()
+        self.records = OrderedDict()  # directory path -> DirectoryRecord, least recently used first
+        self.items = 0
+        self.watches = {}  # path -> wd
+        self.watch_paths = {}  # wd -> set of paths (one inode can be reached by several paths)
+        self.watch_refs = Counter()  # path -> records holding its watch
+        self.counters = Counter()
+        self.inotify = None
+        if watch and AVAILABLE:
+            try:
+                self.inotify = Inotify()
+            except OSError as e:
+                logger.warning(f"inotify unavailable, filesystem cache falls back to a {fallback_ttl} s TTL: {e}")
+
+    # Lookups
+
+    def scan(self, path):
+        """Cached scan_directory(path): [(DirEntry, type)]. Raises OSError like os.scandir."""
+        path = os.path.abspath(path)
+        with self.lock:
+            self.process_events()
+            record = self.lookup(path)
+            if record is not None and record.listing is not None:
+                self.counters["hits"] += 1
+                return record.listing
+            self.counters["misses"] += 1
+            record = self.ensure_record(path)
+            generation = record.generation
+        try:
+            listing = scan_directory(path)
+        except OSError:
+            with self.lock:
+                if not record.items():
+                    self.drop_record(record)
+            raise
+        with self.lock:
+            if self.records.get(path) is record and record.generation == generation:
+                self.items += len(listing) - (len(record.listing) if record.listing is not None else 0)
+                record.listing = listing
+                self.enforce_bounds()
+        return listing
+
+    def listdir(self, path):
+        """Cached os.listdir(path)."""
+        return [entry.name for entry, _ in self.scan(path)]
+
+    def stat(self, path):
+        """Cached os.stat(path). Raises OSError like os.stat."""
+        path = os.path.abspath(path)
+        parent, name = os.path.split(path)
+        if not name:
+            return os.stat(path)
+        with self.lock:
+            self.process_events()
+            return self.cached_stat(parent, name, path)
+
+    def stat_entry(self, entry):
+        """Cached stat of a DirEntry from scan(), like dir_listing.entry_stat: lstat for broken links, None if gone.
+
+        Expects scan() to have just read the inotify queue, so it does not read it again per entry.
+        """
+        # scan() lists absolute paths, so the parent is the path minus the name
+        parent = entry.path[:-len(entry.name) - 1] or os.sep
+        try:
+            with self.lock:
+                return self.cached_stat(parent, entry.name, entry.path)
+        except FileNotFoundError:
+            try:
+                return os.lstat(entry.path)
+            except OSError:
+                return None
+        except OSError:
+            return None
+
+    def cached_stat(self, parent, name, path):
+        """Called with the lock held; the stat itself runs without it."""
+        record = self.lookup(parent)
+        if record is not None and name in record.stats:
+            self.counters["hits"] += 1
+            return record.stats[name]
+        self.counters["misses"] += 1
+        record = self.ensure_record(parent)
+        generation = record.generation
+        self.lock.release()
+        try:
+            result = os.lstat(path)
+            if stat.S_ISLNK(result.st_mode):
+                return os.stat(path)  # Not cached: the target may be anywhere
+            if stat.S_ISDIR(result.st_mode):
+                # A directory's own stat changes with its entries, which only its own watch reports
+                with self.lock:
+                    self.ensure_record(os.path.join(parent, name))
+        finally:
+            self.lock.acquire()
+        if self.records.get(parent) is record and record.generation == generation:
+            if name not in record.stats:
+                self.items += 1
+            record.stats[name] = result
+            self.enforce_bounds()
+        return result
+
+    def lookup(self, path):
+        """Return the live record for path, or None. Called with the lock held."""
+        record = self.records.get(path)
+        if record is None:
+            return None
+        if record.expires_at is not None and record.expires_at <= time.monotonic():
+            self.counters["expirations"] += 1
+            self.drop_record(record)
+            return None
+        self.records.move_to_end(path)
+        return record
+
+    # Invalidation
+
+    def invalidate(self, path):
+        """Forget cached data for path and its subtree, e.g. after the API itself changed it."""
+        path = os.path.abspath(path)
+        parent, name = os.path.split(path)
+        with self.lock:
+            self.process_events()
+            self.forget_child(parent, name, renamed=True)
+            self.forget_child(*os.path.split(parent))
+            self.drop_subtree(path)
+
+    def clear(self):
+        with self.lock:
+            for record in list(self.records.values()):
+                self.drop_record(record)
+
+    def process_events(self):
+        """Apply pending inotify events. Called with the lock held."""
+        if self.inotify is None:
+            return
+        for wd, mask, name in self.inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                self.counters["overflows"] += 1
+                logger.warning("inotify queue overflowed; clearing the filesystem cache")
+                for record in list(self.records.values()):
+                    self.drop_record(record)
+                continue
+            for path in list(self.watch_paths.get(wd, ())):
+                if name:
+                    self.forget_child(path, name, renamed=bool(mask & NAME_CHANGES), subtree=bool(mask & IN_ISDIR))
+                    if mask & NAME_CHANGES:
+                        self.forget_child(*os.path.split(path))  # Its mtime changed
+                elif mask & (SELF_GONE | IN_IGNORED):
+                    self.drop_subtree(path)
+                    self.forget_child(*os.path.split(path), renamed=True)
+                else:
+                    self.forget_child(*os.path.split(path))
+            if mask & IN_IGNORED:
+                # The kernel removed the watch (directory deleted or unmounted)
+                for path in self.watch_paths.pop(wd, ()):
+                    self.watches.pop(path, None)
+                    self.watch_refs.pop(path, None)
+
+    def forget_child(self, parent, name, renamed=False, subtree=False):
+        """Drop the cached stat of parent/name, and parent's listing when names changed."""
+        record = self.records.get(parent)
+        if record is not None:
+            if record.stats.pop(name, None) is not None:
+                self.items -= 1
+                self.counters["invalidations"] += 1
+            if renamed and record.listing is not None:
+                self.items -= len(record.listing)
+                record.listing = None
+                self.counters["invalidations"] += 1
+            record.generation += 1
+        if renamed and subtree:
+            self.drop_subtree(os.path.join(parent, name))
+
+    def drop_subtree(self, path):
+        prefix = path.rstrip(os.sep) + os.sep
+        for record in [record for key, record in self.records.items() if key == path or key.startswith(prefix)]:
+            self.drop_record(record)
+
+    # Records and watches
+
+    def ensure_record(self, path):
+        """Return the record for path, creating it with its watches. Called with the lock held."""
+        record = self.records.get(path)
+        if record is not None:
+            return record
+        record = DirectoryRecord(path)
+        self.records[path] = record
+        if self.inotify is None:
+            record.expires_at = time.monotonic() + self.fallback_ttl
+        elif filesystem_type(path) in NETWORK_FILESYSTEMS:
+            record.expires_at = time.monotonic() + self.fallback_ttl
+            self.counters["network_directories"] += 1
+        else:
+            ancestors = [path]
+            while os.path.dirname(ancestors[-1]) != ancestors[-1]:
+                ancestors.append(os.path.dirname(ancestors[-1]))
+            try:
+                for ancestor in ancestors:
+                    self.acquire_watch(ancestor)
+                    record.watched.append(ancestor)
+            except OSError as e:
+                if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    self.counters["watch_failures"] += 1
+                    logger.warning(f"Cannot watch {e.filename}, caching {path} for {self.fallback_ttl} s: {e}")
+                self.release_watches(record)
+                record.expires_at = time.monotonic() + self.fallback_ttl
+        self.enforce_bounds()
+        return record
+
+    def acquire_watch(self, path):
+        if path not in self.watches:
+            wd = self.inotify.add_watch(path)
+            self.watches[path] = wd
+            self.watch_paths.setdefault(wd, set()).add(path)
+        self.watch_refs[path] += 1
+
+    def release_watches(self, record):
+        for path in record.watched:
+            self.watch_refs[path] -= 1
+            if self.watch_refs[path] > 0:
+                continue
+            del self.watch_refs[path]
+            wd = self.watches.pop(path, None)
+            if wd is None:
+                continue
+            paths = self.watch_paths.get(wd, set())
+            paths.discard(path)
+            if not paths:
+                self.watch_paths.pop(wd, None)
+                self.inotify.rm_watch(wd)
+        record.watched = []
+
+    def drop_record(self, record):
+        if self.records.get(record.path) is not record:
+            return
+        del self.records[record.path]
+        self.items -= record.items()
+        record.generation += 1
+        self.release_watches(record)
+        # Without its watch, the directory's own stat cached in its parent's record can go stale
+        parent, name = os.path.split(record.path)
+        parent_record = self.records.get(parent)
+        if name and parent_record is not None and parent_record.stats.pop(name, None) is not None:
+            self.items -= 1
+
+    def enforce_bounds(self):
+        while self.records and (len(self.records) > self.max_directories or self.items > self.max_items):
+            self.drop_record(next(iter(self.records.values())))
+            self.counters["evictions"] += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                "mode": "inotify" if self.inotify is not None else "ttl",
+                "directories": len(self.records),
+                "max_directories": self.max_directories,
+                "items": self.items,
+                "max_items": self.max_items,
+                "watches": len(self.watch_paths),
+                "ttl_directories": sum(1 for record in self.records.values() if record.expires_at is not None),
+                "hits": self.counters["hits"],
+                "misses": self.counters["misses"],
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+                "invalidations": self.counters["invalidations"],
+                "evictions": self.counters["evictions"],
+                "expirations": self.counters["expirations"],
+                "watch_failures": self.counters["watch_failures"],
+                "overflows": self.counters["overflows"],
+            }
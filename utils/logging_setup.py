@@ -0,0 +1,203 @@
+# utils/logging_setup.py
+"""Shared, non-blocking logging for the API, the GUI and the headless scheduler.
+
+Loggers only put records on a bounded in-memory queue (QueueHandler); a
+QueueListener thread formats and writes them. That thread writes to the
+console and to a size-rotated file of JSON lines under config/logs. A
+request handler or the Tk main loop therefore never waits on a terminal or
+a disk. When the queue is full, records are dropped and counted instead of
+blocking.
+
+Settings come from config/logging.json when it exists, e.g.:
+
+    {"level": "INFO", "levels": {"uvicorn.access": "WARNING"},
+     "sampling": {"uvicorn.access": 0.1}, "max_message_chars": 4096}
+
+"sampling" keeps that fraction of a logger's (and its children's) records
+below WARNING; warnings and errors are always kept.
+"""
+import os
+import sys
+import copy
+import json
+import atexit
+import queue
+import random
+import logging
+import logging.handlers
+from datetime import datetime
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
+LOGGING_CONFIG = os.path.join(CONFIG_DIR, "logging.json")
+LOG_DIR = os.path.join(CONFIG_DIR, "logs")
+QUEUE_SIZE = 10000  # Records waiting for the writer thread; more are dropped
+MAX_MESSAGE_CHARS = 8192  # Longer messages (e.g. command output) are truncated
+MAX_LOG_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+CONSOLE_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+active_listener = None  # Writer thread started by setup_logging()
+
+# Attributes every LogRecord has; anything else was passed with extra= and goes into the JSON.
+# uvicorn adds color_message, an ANSI-colored copy of the message.
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "color_message"
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including fields passed with extra=."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of the records below WARNING from selected loggers."""
+
+    def __init__(self, rates):
+        super().__init__()
+        # Longest prefix first, so a child logger's own rate wins over its parent's
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        for name, rate in self.rates:
+            if record.name == name or record.name.startswith(name + "."):
+                return random.random() < rate
+        return True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that truncates long messages and drops records instead of blocking when full."""
+
+    def __init__(self, log_queue, max_message_chars=MAX_MESSAGE_CHARS):
+        super().__init__(log_queue)
+        self.setFormatter(logging.Formatter())
+        self.max_message_chars = max_message_chars
+        self.dropped = 0
+
+    def prepare(self, record):
+        """Resolve the message (truncated) and traceback now; args and exc_info may not outlive the call."""
+        record = copy.copy(record)
+        message = record.getMessage()
+        if self.max_message_chars and len(message) > self.max_message_chars:
+            omitted = len(message) - self.max_message_chars
+            message = f"{message[:self.max_message_chars]}... [truncated {omitted} chars]"
+        record.msg = message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                # Report the gap as soon as there is room again
+                notice = logging.LogRecord(
+                    "logging", logging.WARNING, __file__, 0,
+                    f"Log queue was full; dropped {self.dropped} record(s)", None, None
+                )
+                self.queue.put_nowait(notice)
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def load_config(path=LOGGING_CONFIG):
+    config = {
+        "level": "INFO",
+        "console_level": None,
+        "levels": {},
+        "sampling": {},
+        "max_message_chars": MAX_MESSAGE_CHARS,
+        "max_bytes": MAX_LOG_BYTES,
+        "backup_count": BACKUP_COUNT,
+    }
+    try:
+        with open(path, "r") as file:
+            config.update(json.load(file))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        print(f"Failed to read logging settings from {path}: {e}", file=sys.stderr)
+    return config
+
+
+def setup_logging(name, level=None, console=sys.stderr, capture=(), config_path=LOGGING_CONFIG):
+    """Route all logging through a background writer thread; stop it with shutdown_logging().
+
+    name picks the log file (config/logs/<name>.log). level overrides the
+    configured root level. capture lists loggers that were given their own
+    handlers elsewhere (e.g. uvicorn's); their records are sent through the
+    queue instead. Calling it again replaces the previous setup.
+    """
+    global active_listener
+    shutdown_logging()
+    config = load_config(config_path)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for logger_name in capture:
+        captured = logging.getLogger(logger_name)
+        for handler in list(captured.handlers):
+            captured.removeHandler(handler)
+        captured.propagate = True
+    root.setLevel(level or config["level"])
+    for logger_name, logger_level in config["levels"].items():
+        logging.getLogger(logger_name).setLevel(logger_level)
+
+    handlers = []
+    if console is not None:
+        console_handler = logging.StreamHandler(console)
+        console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        if config["console_level"]:
+            console_handler.setLevel(config["console_level"])
+        handlers.append(console_handler)
+    try:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(LOG_DIR, f"{name}.log"), maxBytes=config["max_bytes"],
+            backupCount=config["backup_count"], encoding="utf-8"
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    except OSError as e:
+        print(f"Failed to open log file in {LOG_DIR}: {e}", file=sys.stderr)
+
+    log_queue = queue.Queue(QUEUE_SIZE)
+    queue_handler = BoundedQueueHandler(log_queue, config["max_message_chars"])
+    if config["sampling"]:
+        queue_handler.addFilter(SamplingFilter(config["sampling"]))
+    root.addHandler(queue_handler)
+
+    active_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    active_listener.start()
+
+
+def shutdown_logging():
+    """Write out queued records and stop the writer thread started by setup_logging()."""
+    global active_listener
+    if active_listener is not None:
+        active_listener.stop()
+        for handler in active_listener.handlers:
+            handler.close()
+        active_listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,152 @@
+# utils/output_capture.py
+"""Bounded capture of command output.
+
+A capture keeps the first and last bytes of a stream in memory. Once a stream
+outgrows that, the complete stream is spilled to a temporary file instead,
+so memory stays flat no matter how much a command prints. Spilled output is
+registered with a CaptureStore and can be fetched later by ID until it expires.
+"""
+import os
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEAD_BYTES = 64 * 1024
+DEFAULT_TAIL_BYTES = 64 * 1024
+CAPTURE_TTL_SECONDS = 3600  # Spilled output is kept this long after the command finishes
+MAX_STORED_CAPTURES = 100  # Oldest spilled outputs are deleted beyond this
+
+
+class BoundedCapture:
+    """File-like sink that keeps head and tail in memory and spills the rest to disk."""
+
+    def __init__(self, head_bytes=DEFAULT_HEAD_BYTES, tail_bytes=DEFAULT_TAIL_BYTES, spill_path=None):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.spill_path = spill_path  # Where the full stream goes if it overflows; None disables spilling
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+        self.spill_file = None
+
+    def write(self, chunk):
+        self.total_bytes += len(chunk)
+        if self.spill_file is None and self.total_bytes > self.head_bytes + self.tail_bytes and self.spill_path:
+            # First overflow: start the spill file with everything kept so far
+            self.spill_file = open(self.spill_path, "wb")
+            self.spill_file.write(self.head)
+            self.spill_file.write(self.tail)
+        if self.spill_file is not None:
+            self.spill_file.write(chunk)
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk and self.tail_bytes:
+            self.tail += chunk[-self.tail_bytes:]
+            del self.tail[:-self.tail_bytes]
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+
+    @property
+    def truncated(self):
+        return self.total_bytes > len(self.head) + len(self.tail)
+
+    @property
+    def spilled(self):
+        return self.spill_file is not None
+
+    def text(self):
+        """Decoded head and tail, with a marker where bytes were left out."""
+        head = self.head.decode(errors="replace")
+        if not self.truncated:
+            return head + self.tail.decode(errors="replace")
+        omitted = self.total_bytes - len(self.head) - len(self.tail)
+        return f"{head}\n... [{omitted} bytes omitted] ...\n{self.tail.decode(errors='replace')}"
+
+    def info(self):
+        return {
+            "total_bytes": self.total_bytes,
+            "truncated": self.truncated,
+            "omitted_bytes": self.total_bytes - len(self.head) - len(self.tail),
+        }
+
+
+class CaptureStore:
+    """Temporary directory of spilled outputs, addressed by capture ID, with TTL and count limits."""
+
+    def __init__(self, ttl_seconds=CAPTURE_TTL_SECONDS, max_captures=MAX_STORED_CAPTURES):
+        self.ttl_seconds = ttl_seconds
+        self.max_captures = max_captures
+        self.directory = None
+        self.captures = OrderedDict()  # capture_id -> (created, {stream: path}), oldest first
+        self.lock = threading.Lock()
+
+    def new_captures(self, streams, head_bytes=DEFAULT_HEAD_BYTES, tail_bytes=DEFAULT_TAIL_BYTES):
+        """Return (capture_id, {stream: BoundedCapture}) for a new command run."""
+        with self.lock:
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix="sits-output-")
+        capture_id = uuid.uuid4().hex
+        return capture_id, {
+            stream: BoundedCapture(head_bytes, tail_bytes, os.path.join(self.directory, f"{capture_id}.{stream}"))
+            for stream in streams
+        }
+
+    def register(self, capture_id, captures):
+        """Keep the spilled streams of a finished run. Returns True if anything was spilled."""
+        paths = {stream: capture.spill_path for stream, capture in captures.items() if capture.spilled}
+        if not paths:
+            return False
+        with self.lock:
+            self.captures[capture_id] = (time.monotonic(), paths)
+            self.expire()
+        return True
+
+    def get_path(self, capture_id, stream):
+        with self.lock:
+            self.expire()
+            entry = self.captures.get(capture_id)
+        if entry is None:
+            return None
+        return entry[1].get(stream)
+
+    def delete(self, capture_id):
+        with self.lock:
+            entry = self.captures.pop(capture_id, None)
+        if entry is None:
+            return False
+        self.remove_files(entry[1])
+        return True
+
+    def expire(self):
+        """Drop captures past their TTL or beyond the count limit. Caller must hold the lock."""
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self.captures:
+            capture_id, (created, paths) = next(iter(self.captures.items()))
+            if created >= cutoff and len(self.captures) <= self.max_captures:
+                break
+            del self.captures[capture_id]
+            self.remove_files(paths)
+
+    def remove_files(self, paths):
+        for path in paths.values():
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Failed to remove captured output {path}: {e}")
+
+    def close(self):
+        with self.lock:
+            self.captures.clear()
+            if self.directory:
+                shutil.rmtree(self.directory, ignore_errors=True)
+                self.directory = None
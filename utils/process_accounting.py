@@ -0,0 +1,203 @@
+# utils/process_accounting.py
+"""Per-run resource accounting for child processes.
+
+Children are reaped with os.wait4 so the kernel's rusage for the child (and
+any descendants it waited for, e.g. the commands run by a shell) is captured
+at exit. On platforms without wait4, psutil is sampled just before the child
+is reaped instead.
+"""
+import io
+import os
+import sys
+import time
+import selectors
+import shlex
+import subprocess
+import threading
+from collections import deque, defaultdict
+from datetime import datetime
+
+from utils.process_tree import NEW_SESSION, TreeKiller
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MAX_RECORDS = 1000  # Resource records kept in memory per process
+READ_CHUNK_SIZE = 64 * 1024
+PIPE_POLL_SECONDS = 0.5  # How often a timed run re-checks whether to give up on its pipes
+
+
+def exit_code_from_status(status):
+    """Convert a wait status to a Popen-style return code (negative signal number if killed)."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    if os.WIFEXITED(status):
+        return os.WEXITSTATUS(status)
+    return status
+
+
+def sample_psutil_usage(pid):
+    """Best-effort CPU and peak memory of a still-unreaped child via psutil."""
+    if psutil is None:
+        return None
+    try:
+        proc = psutil.Process(pid)
+        cpu = proc.cpu_times()
+        memory = proc.memory_info()
+    except (psutil.Error, OSError):
+        return None
+    peak = getattr(memory, "peak_wset", None) or memory.rss  # peak_wset exists on Windows only
+    return {"user_cpu_seconds": cpu.user, "system_cpu_seconds": cpu.system, "max_rss_kb": peak // 1024}
+
+
+def wait_process(process):
+    """Reap a Popen child and return its usage as a dict (values are None if unavailable)."""
+    if hasattr(os, "wait4"):
+        try:
+            _, status, rusage = os.wait4(process.pid, 0)
+        except ChildProcessError:
+            # Already reaped elsewhere; the exit code is all that is left
+            process.wait()
+            return {"user_cpu_seconds": None, "system_cpu_seconds": None, "max_rss_kb": None}
+        process.returncode = exit_code_from_status(status)
+        # ru_maxrss is kilobytes on Linux but bytes on macOS
+        max_rss_kb = rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+        return {"user_cpu_seconds": rusage.ru_utime, "system_cpu_seconds": rusage.ru_stime, "max_rss_kb": max_rss_kb}
+    usage = sample_psutil_usage(process.pid)
+    process.wait()
+    return usage or {"user_cpu_seconds": None, "system_cpu_seconds": None, "max_rss_kb": None}
+
+
+class RunMeter:
+    """Measures one child run; call finish() once the child's pipes are drained."""
+
+    def __init__(self, source, name, command):
+        self.source = source
+        self.name = name
+        self.command = command
+        self.started_at = datetime.now()
+        self.started = time.monotonic()
+
+    def finish(self, process, stdout_bytes=None, stderr_bytes=None, timed_out=False):
+        """Reap the child and return its resource record."""
+        usage = wait_process(process)
+        return {
+            "source": self.source,
+            "name": self.name,
+            "command": self.command,
+            "pid": process.pid,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "wall_seconds": round(time.monotonic() - self.started, 3),
+            **usage,
+            "stdout_bytes": stdout_bytes,
+            "stderr_bytes": stderr_bytes,
+            "exit_code": process.returncode,
+            "timed_out": timed_out,
+        }
+
+
+def run_accounted(args, source, name=None, stdout=None, stderr=None, on_start=None, timeout=None,
+                  **popen_kwargs):
+    """Run a command to completion, writing its stdout and stderr to file-like sinks.
+
+    stdout/stderr default to in-memory buffers, and on_start(process) is called
+    once the child is launched. Returns (stdout, stderr, record).
+    Both pipes are drained with a selector rather than communicate(), which
+    would reap the child before wait4 can.
+
+    With a timeout the child runs in its own session, and its whole process
+    tree is terminated (then killed) once the timeout elapses.
+    """
+    command = args if isinstance(args, str) else shlex.join(args)
+    meter = RunMeter(source, name or command, command)
+    sinks = {"stdout": stdout if stdout is not None else io.BytesIO(),
+             "stderr": stderr if stderr is not None else io.BytesIO()}
+    byte_counts = {"stdout": 0, "stderr": 0}
+    if timeout:
+        popen_kwargs = {**NEW_SESSION, **popen_kwargs}
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **popen_kwargs)
+    killer = TreeKiller(process, timeout) if timeout else None
+    if on_start is not None:
+        on_start(process)
+    pipes = {process.stdout: "stdout", process.stderr: "stderr"}
+
+    def consume(pipe, chunk):
+        byte_counts[pipes[pipe]] += len(chunk)
+        sinks[pipes[pipe]].write(chunk)
+
+    if sys.platform == "win32":
+        # Selectors do not support pipes on Windows; read stderr on a helper thread
+        def drain(pipe):
+            for chunk in iter(lambda: pipe.read(READ_CHUNK_SIZE), b""):
+                consume(pipe, chunk)
+        reader = threading.Thread(target=drain, args=(process.stderr,))
+        reader.start()
+        drain(process.stdout)
+        reader.join()
+    else:
+        with selectors.DefaultSelector() as selector:
+            for pipe in pipes:
+                selector.register(pipe, selectors.EVENT_READ)
+            while selector.get_map():
+                if killer is not None and killer.pipes_abandoned():
+                    # Only processes that escaped the group still hold the pipes; stop reading
+                    break
+                for key, _ in selector.select(PIPE_POLL_SECONDS if killer is not None else None):
+                    chunk = os.read(key.fd, READ_CHUNK_SIZE)
+                    if chunk:
+                        consume(key.fileobj, chunk)
+                    else:
+                        selector.unregister(key.fileobj)
+    process.stdout.close()
+    process.stderr.close()
+    try:
+        record = meter.finish(process, byte_counts["stdout"], byte_counts["stderr"],
+                              timed_out=killer is not None and killer.timed_out)
+    finally:
+        if killer is not None:
+            killer.stop()
+    resource_ledger.add(record)
+    return sinks["stdout"], sinks["stderr"], record
+
+
+class ResourceLedger:
+    """Thread-safe ring buffer of the most recent resource records."""
+
+    def __init__(self, max_records=MAX_RECORDS):
+        self.records = deque(maxlen=max_records)
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+
+    def recent(self, limit=None, source=None, name=None):
+        """Return the newest records first, optionally filtered by source and name."""
+        with self.lock:
+            records = list(self.records)
+        records = [
+            record for record in reversed(records)
+            if (source is None or record["source"] == source) and (name is None or record["name"] == name)
+        ]
+        return records[:limit] if limit else records
+
+    def top(self, limit=10, source=None):
+        """Aggregate records by (source, name), most total CPU time first."""
+        totals = defaultdict(lambda: {"runs": 0, "cpu_seconds": 0.0, "wall_seconds": 0.0, "max_rss_kb": 0})
+        for record in self.recent(source=source):
+            entry = totals[(record["source"], record["name"])]
+            entry["runs"] += 1
+            entry["cpu_seconds"] += (record["user_cpu_seconds"] or 0) + (record["system_cpu_seconds"] or 0)
+            entry["wall_seconds"] += record["wall_seconds"]
+            entry["max_rss_kb"] = max(entry["max_rss_kb"], record["max_rss_kb"] or 0)
+        ranked = [
+            {"source": source_name, "name": name, **entry}
+            for (source_name, name), entry in totals.items()
+        ]
+        ranked.sort(key=lambda entry: entry["cpu_seconds"], reverse=True)
+        return ranked[:limit]
+
+
+resource_ledger = ResourceLedger()
@@ -0,0 +1,131 @@
+# utils/process_tree.py
+"""Signal a child process together with everything it started.
+
+Children meant to be killable as a tree are started with
+start_new_session=True (see NEW_SESSION), which makes the child the leader of
+its own process group; signalling the group reaches grandchildren too, e.g.
+the commands a shell script runs. Windows has no process groups, so the tree
+is walked with psutil instead.
+"""
+import os
+import time
+import signal
+import logging
+import threading
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+# Popen keyword arguments that make a child killable as a tree
+NEW_SESSION = {"start_new_session": True} if os.name == "posix" else {}
+KILL_GRACE_SECONDS = 5.0  # Time between SIGTERM and SIGKILL
+
+
+def signal_process_tree(process, force=False):
+    """Send SIGTERM (or SIGKILL if force) to process and its descendants. Returns False if it had exited."""
+    if process.returncode is not None:
+        return False
+    if os.name == "posix":
+        try:
+            os.killpg(process.pid, signal.SIGKILL if force else signal.SIGTERM)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # Not a group leader (started without NEW_SESSION); signal the child alone
+            process.kill() if force else process.terminate()
+        return True
+    if psutil is not None:
+        try:
+            children = psutil.Process(process.pid).children(recursive=True)
+        except psutil.Error:
+            children = []
+        for child in children:
+            try:
+                child.kill() if force else child.terminate()
+            except psutil.Error:
+                pass
+    try:
+        process.kill() if force else process.terminate()
+    except OSError:
+        return False
+    return True
+
+
+def kill_process_group(pgid):
+    """SIGKILL whatever is left of a process group whose leader was already reaped.
+
+    Background processes of a NEW_SESSION child stay in its group and may keep
+    its pipes open after it exits. The group ID cannot be reused while any
+    member is alive, so this is safe after the leader is gone.
+    """
+    if os.name != "posix":
+        return False
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        return False
+    return True
+
+
+class TreeKiller:
+    """Terminate a process tree: SIGTERM, then SIGKILL if it is still running after a grace period.
+
+    With a timeout, termination starts by itself once the timeout elapses.
+    Call stop() after the child is reaped so no signal is sent to a reused PID.
+    """
+
+    def __init__(self, process, timeout=None, grace=KILL_GRACE_SECONDS):
+        self.process = process
+        self.grace = grace
+        self.timed_out = False
+        self.terminated_at = None  # Monotonic times of the first SIGTERM and the SIGKILL
+        self.killed_at = None
+        self.lock = threading.Lock()
+        self.timer = None
+        self.stopped = False
+        if timeout:
+            self.schedule(timeout, self.expire)
+
+    def schedule(self, delay, action):
+        with self.lock:
+            if self.stopped:
+                return
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(delay, action)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def expire(self):
+        self.timed_out = True
+        logger.warning(f"Process {self.process.pid} timed out; terminating its process tree")
+        self.terminate()
+
+    def terminate(self):
+        """Send SIGTERM now and SIGKILL after the grace period. Returns False if the process had exited."""
+        if self.terminated_at is not None:
+            return True
+        if not signal_process_tree(self.process):
+            return False
+        self.terminated_at = time.monotonic()
+        self.schedule(self.grace, self.kill)
+        return True
+
+    def kill(self):
+        self.killed_at = time.monotonic()
+        if signal_process_tree(self.process, force=True):
+            logger.warning(f"Process tree of {self.process.pid} outlived the SIGTERM grace period; sent SIGKILL")
+
+    def pipes_abandoned(self):
+        """True once the tree was killed a grace period ago, so pipes still open belong to escaped processes."""
+        return self.killed_at is not None and time.monotonic() - self.killed_at >= self.grace
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            if self.timer is not None:
+                self.timer.cancel()
@@ -0,0 +1,86 @@
+# utils/result_cache.py
+"""In-memory result cache with per-entry TTL, an LRU bound and single-flight.
+
+Concurrent lookups of a key that is being computed wait for that one
+computation instead of starting their own. Not thread-safe; use it from the
+event loop only.
+"""
+import time
+import asyncio
+from collections import Counter, OrderedDict
+
+MAX_ENTRIES = 256
+
+
+class ResultCache:
+    """TTL + LRU cache of awaitable results with single-flight coalescing."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self.inflight = {}  # key -> Future of the computation in progress
+        self.counters = Counter()  # hits, misses, coalesced, evictions, expirations
+
+    async def get_or_run(self, key, ttl, compute):
+        """Return (value, outcome) where outcome is 'hit', 'coalesced' or 'miss'.
+
+        compute is an async callable run only on a miss; its result is cached
+        for ttl seconds. Exceptions are passed to every waiter but not cached.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[1], "hit"
+            del self.entries[key]
+            self.counters["expirations"] += 1
+
+        future = self.inflight.get(key)
+        if future is not None:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(future), "coalesced"
+
+        self.counters["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        # Keep an unobserved failure from being logged when no one else was waiting
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self.inflight[key] = future
+        try:
+            value = await compute()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+            raise
+        finally:
+            del self.inflight[key]
+        if ttl > 0:
+            self.store(key, value, ttl)
+        future.set_result(value)
+        return value, "miss"
+
+    def store(self, key, value, ttl):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.counters["hits"] + self.counters["misses"] + self.counters["coalesced"]
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "inflight": len(self.inflight),
+            "hits": self.counters["hits"],
+            "misses": self.counters["misses"],
+            "coalesced": self.counters["coalesced"],
+            "evictions": self.counters["evictions"],
+            "expirations": self.counters["expirations"],
+            "hit_rate": (self.counters["hits"] + self.counters["coalesced"]) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,200 @@
+# utils/tree_search.py
+"""Parallel recursive file search over os.scandir.
+
+Each directory is one task on a thread pool. A task scans its directory
+once and queues its subdirectories as new tasks. Entries are filtered by
+name first, so only candidate matches are stat'ed. A walk spends most of its
+time in getdents/stat syscalls, which release the GIL, so several threads
+keep several directory reads in flight across cores. On a network
+filesystem, they also overlap the round trips. Matches go to a bounded
+queue as they are found, so a slow reader slows the walk rather than
+growing memory. The walk stops at the result cap, or when the reader
+closes it.
+"""
+import os
+import re
+import time
+import queue
+import fnmatch
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.dir_listing import entry_type, entry_stat
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXCLUDES = (".git", "node_modules")  # Directory names never descended into by default
+DEFAULT_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+MAX_WORKERS = 64
+RESULT_QUEUE_SIZE = 1024  # Matches waiting for the reader; the walk blocks beyond this
+BATCH_SIZE = 256  # Matches handed to the reader at a time
+POLL_SECONDS = 0.1
+
+
+class SearchCriteria:
+    """Filters an entry must pass to be reported; None means no constraint."""
+
+    def __init__(self, pattern=None, regex=None, types=None, min_size=None, max_size=None,
+                 modified_after=None, modified_before=None):
+        self.pattern = pattern  # Glob matched against the entry name
+        self.regex = re.compile(regex) if isinstance(regex, str) else regex  # Searched in the relative path
+        self.types = set(types) if types else None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.modified_after = modified_after  # Epoch seconds
+        self.modified_before = modified_before
+
+    def matches_name(self, name, relative_path, kind):
+        return (
+            (self.types is None or kind in self.types)
+            and (self.pattern is None or fnmatch.fnmatchcase(name, self.pattern))
+            and (self.regex is None or self.regex.search(relative_path) is not None)
+        )
+
+    def matches_stat(self, stats):
+        if stats is None:
+            return False
+        return (
+            (self.min_size is None or stats.st_size >= self.min_size)
+            and (self.max_size is None or stats.st_size <= self.max_size)
+            and (self.modified_after is None or stats.st_mtime >= self.modified_after)
+            and (self.modified_before is None or stats.st_mtime <= self.modified_before)
+        )
+
+
+class TreeSearch:
+    """Walk a directory tree on a thread pool and collect matching entries.
+
+    Symlinked directories are reported but not followed, so the walk cannot
+    loop. Directories named in exclude, and hidden ones when include_hidden
+    is false, are pruned. max_depth limits how many levels below root are
+    descended into (0 searches root's own entries only).
+    """
+
+    def __init__(self, root, criteria, exclude=DEFAULT_EXCLUDES, include_hidden=True, max_depth=None,
+                 max_results=10000, workers=DEFAULT_WORKERS):
+        self.root = root
+        self.criteria = criteria
+        self.exclude = set(exclude)
+        self.include_hidden = include_hidden
+        self.max_depth = max_depth
+        self.max_results = max_results
+        self.workers = workers
+        self.results = queue.Queue(RESULT_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.finished = threading.Event()
+        self.executor = None
+        self.pending = 0  # Directories queued or being scanned
+        self.matches = 0
+        self.directories = 0
+        self.entries = 0
+        self.errors = 0
+        self.truncated = False
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tree-search")
+        self.submit(self.root, "", 0)
+
+    def submit(self, path, relative_path, depth):
+        with self.lock:
+            self.pending += 1
+        try:
+            self.executor.submit(self.scan, path, relative_path, depth)
+        except RuntimeError:
+            self.task_done()  # The executor was shut down by close()
+
+    def task_done(self):
+        with self.lock:
+            self.pending -= 1
+            if self.pending == 0:
+                self.finished.set()
+
+    def scan(self, path, relative_path, depth):
+        scanned = None  # Entries read; None if the directory was never opened
+        try:
+            if self.stopped.is_set():
+                return
+            descend = self.max_depth is None or depth < self.max_depth
+            with os.scandir(path) as entries:
+                scanned = 0
+                for entry in entries:
+                    if self.stopped.is_set():
+                        break
+                    scanned += 1
+                    name = entry.name
+                    if not self.include_hidden and name.startswith("."):
+                        continue
+                    kind = entry_type(entry)
+                    relative = f"{relative_path}/{name}" if relative_path else name
+                    if kind == "directory" and descend and name not in self.exclude:
+                        self.submit(entry.path, relative, depth + 1)
+                    if self.criteria.matches_name(name, relative, kind):
+                        stats = entry_stat(entry)
+                        if self.criteria.matches_stat(stats):
+                            self.emit({
+                                "path": entry.path, "type": kind,
+                                "size": stats.st_size, "mtime": stats.st_mtime,
+                            })
+        except OSError as e:
+            logger.debug(f"Search skipped {path}: {e}")
+            with self.lock:
+                self.errors += 1
+        finally:
+            if scanned is not None:
+                with self.lock:
+                    self.directories += 1
+                    self.entries += scanned
+            self.task_done()
+
+    def emit(self, result):
+        with self.lock:
+            if self.matches >= self.max_results:
+                self.truncated = True
+                self.stopped.set()
+                return
+            self.matches += 1
+        while not self.stopped.is_set():
+            try:
+                self.results.put(result, timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+        with self.lock:
+            self.matches -= 1  # Stopped before it could be delivered
+
+    def next_batch(self, max_items=BATCH_SIZE):
+        """Block until matches are available; return up to max_items of them, or None when the walk is done."""
+        while True:
+            try:
+                batch = [self.results.get(timeout=POLL_SECONDS)]
+                break
+            except queue.Empty:
+                if self.finished.is_set() and self.results.empty():
+                    return None
+        while len(batch) < max_items:
+            try:
+                batch.append(self.results.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def close(self):
+        """Stop the walk; safe to call at any point, including after it finished."""
+        self.stopped.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def summary(self):
+        with self.lock:
+            return {
+                "matches": self.matches,
+                "truncated": self.truncated,
+                "directories": self.directories,
+                "entries": self.entries,
+                "errors": self.errors,
+                "elapsed_seconds": round(time.monotonic() - self.started_at, 3) if self.started_at else 0.0,
+            }
@@ -0,0 +1,437 @@
+# utils/warm_runner.py
+"""Pre-forked Python runner: start scripts from a warm interpreter instead of a fresh one.
+
+A zygote process imports a configurable set of modules once and listens on a
+Unix socket. Each run request carries argv, cwd and environment as a line of
+JSON, with the child's stdin, stdout and stderr attached as file descriptors
+(SCM_RIGHTS). The zygote forks, and the child runs the script with runpy the
+way `python script.py` would. The child starts its own session, so
+process-tree kills reach it as usual. The zygote replies with the child's PID
+and, once it exits, its exit code and rusage.
+
+This file is also the zygote's entry point. It is started by path, not as
+part of the utils package, so scripts never see SITS modules in sys.modules.
+Only available where os.fork and socket.send_fds exist (POSIX, Python 3.9+).
+"""
+import os
+import sys
+import json
+import atexit
+import shutil
+import signal
+import socket
+import logging
+import selectors
+import tempfile
+import threading
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
+RUNNER_CONFIG = os.path.join(CONFIG_DIR, "warm_runner.json")
+STARTUP_TIMEOUT_SECONDS = 30  # Time the zygote gets to import its preload modules
+MAX_MESSAGE_BYTES = 1024 * 1024  # Upper bound for one request line (argv + environment)
+AVAILABLE = hasattr(os, "fork") and hasattr(socket, "send_fds") and hasattr(socket, "AF_UNIX")
+
+
+class WarmRunnerError(Exception):
+    """The warm runner is unavailable or could not start a script."""
+
+
+def read_message(connection, buffer):
+    """Read one JSON line from a socket. Returns (message, remaining buffer); message is None at EOF."""
+    while b"\n" not in buffer:
+        chunk = connection.recv(64 * 1024)
+        if not chunk:
+            return None, buffer
+        buffer += chunk
+        if len(buffer) > MAX_MESSAGE_BYTES:
+            raise ValueError("Message too large.")
+    line, _, buffer = buffer.partition(b"\n")
+    return json.loads(line), buffer
+
+
+def send_message(connection, message):
+    connection.sendall(json.dumps(message).encode() + b"\n")
+
+
+# Zygote side
+
+def run_child(request, fds, inherited):
+    """Body of a forked child: become the requested script. Never returns."""
+    code = 1
+    try:
+        os.setsid()
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        for fd in inherited:
+            os.close(fd)
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            if fd > 2:
+                os.close(fd)
+        if request.get("cwd"):
+            os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        sys.argv = list(request["argv"])
+        sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+        # Rebuild stdio on the new descriptors; the zygote's objects were buffered for its own pipes
+        buffering = 1 if request.get("unbuffered") else -1
+        sys.stdin = sys.__stdin__ = open(0, "r", closefd=False)
+        sys.stdout = sys.__stdout__ = open(1, "w", buffering=buffering, closefd=False)
+        sys.stderr = sys.__stderr__ = open(2, "w", buffering=1, errors="backslashreplace", closefd=False)
+
+        import runpy
+        import traceback
+        try:
+            runpy.run_path(sys.argv[0], run_name="__main__")
+            code = 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        atexit._run_exitfuncs()
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except (OSError, ValueError):
+                pass
+    finally:
+        os._exit(code & 0xFF)
+
+
+def serve(socket_path, preload):
+    """Zygote main loop: fork a child per request until stdin (the owner's pipe) closes."""
+    import importlib
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"Warm runner failed to preload {name}: {e}", file=sys.stderr)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(64)
+    # SIGCHLD wakes the select loop through a pipe, so the zygote stays single-threaded and fork-safe
+    wake_read, wake_write = os.pipe()
+    os.set_blocking(wake_read, False)
+    os.set_blocking(wake_write, False)
+    signal.set_wakeup_fd(wake_write)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    children = {}  # pid -> connection awaiting the exit status
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    selector.register(wake_read, selectors.EVENT_READ)
+    selector.register(0, selectors.EVENT_READ)
+    # Descriptors a forked child must not keep
+    inherited = [listener.fileno(), wake_read, wake_write]
+    if hasattr(selector, "fileno"):
+        inherited.append(selector.fileno())
+    sys.stdout.write("ready\n")
+    sys.stdout.flush()
+
+    while True:
+        for key, _ in selector.select():
+            if key.fileobj is listener:
+                connection, _ = listener.accept()
+                connection.settimeout(5)
+                try:
+                    data, fds, _, _ = socket.recv_fds(connection, 64 * 1024, 3)
+                    request, _ = read_message(connection, data)
+                    if request is None or len(fds) != 3:
+                        raise ValueError("Incomplete request.")
+                except (OSError, ValueError) as e:
+                    print(f"Warm runner rejected a request: {e}", file=sys.stderr)
+                    connection.close()
+                    continue
+                pid = os.fork()
+                if pid == 0:
+                    run_child(request, fds, inherited + [connection.fileno()])
+                for fd in fds:
+                    os.close(fd)
+                children[pid] = connection
+                try:
+                    send_message(connection, {"pid": pid})
+                except OSError:
+                    pass
+            elif key.fileobj == wake_read:
+                try:
+                    while os.read(wake_read, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                reap_children(children)
+            elif not os.read(0, 4096):
+                # The owner went away; children keep running in their own sessions
+                listener.close()
+                return
+
+
+def reap_children(children):
+    """Collect exited children and report their status to whoever started them."""
+    while children:
+        try:
+            pid, status, rusage = os.wait4(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        connection = children.pop(pid, None)
+        if connection is None:
+            continue
+        max_rss_kb = rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+        try:
+            send_message(connection, {
+                "exit_code": os.waitstatus_to_exitcode(status),
+                "user_cpu_seconds": rusage.ru_utime,
+                "system_cpu_seconds": rusage.ru_stime,
+                "max_rss_kb": max_rss_kb,
+            })
+        except OSError:
+            pass
+        connection.close()
+
+
+# Client side
+
+class WarmProcess:
+    """Popen-like handle for a script started by the warm runner.
+
+    The script is not our child, so its status comes from the zygote; usage
+    holds its rusage once it has exited.
+    """
+
+    def __init__(self, connection, buffer, pid, args, stdin=None, stdout=None, stderr=None):
+        self.connection = connection
+        self.buffer = buffer
+        self.pid = pid
+        self.args = args
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+        self.usage = None
+        self.lock = threading.Lock()
+
+    def wait(self, timeout=None):
+        with self.lock:
+            if self.returncode is not None:
+                return self.returncode
+            self.connection.settimeout(timeout)
+            try:
+                message, self.buffer = read_message(self.connection, self.buffer)
+            except (socket.timeout, BlockingIOError):
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            except (OSError, ValueError) as e:
+                logger.error(f"Lost contact with warm runner for pid {self.pid}: {e}")
+                message = None
+            if message is None:
+                logger.error(f"Warm runner exited before reporting the status of pid {self.pid}")
+                message = {"exit_code": -signal.SIGKILL}
+            self.returncode = message.pop("exit_code")
+            self.usage = message or None
+            self.connection.close()
+            return self.returncode
+
+    def poll(self):
+        try:
+            return self.wait(timeout=0)
+        except subprocess.TimeoutExpired:
+            return None
+
+    def send_signal(self, signum):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class WarmRunner:
+    """Owns a zygote process and starts scripts through it; the zygote is restarted if it dies."""
+
+    def __init__(self, preload=()):
+        self.preload = list(preload)
+        self.process = None
+        self.directory = None
+        self.socket_path = None
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Start the zygote and wait until it has imported its preload modules."""
+        if not AVAILABLE:
+            raise WarmRunnerError("The warm runner needs os.fork and socket.send_fds.")
+        with self.lock:
+            if self.running:
+                return
+            self.stop_process()
+            self.directory = tempfile.mkdtemp(prefix="sits-runner-")  # Private (0700), like the socket in it
+            self.socket_path = os.path.join(self.directory, "runner.sock")
+            args = [sys.executable, os.path.abspath(__file__), "--socket", self.socket_path]
+            for name in self.preload:
+                args += ["--preload", name]
+            self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            with selectors.DefaultSelector() as selector:
+                selector.register(self.process.stdout, selectors.EVENT_READ)
+                ready = selector.select(STARTUP_TIMEOUT_SECONDS) and self.process.stdout.readline() == b"ready\n"
+            if not ready:
+                self.stop_process()
+                raise WarmRunnerError("The warm runner did not start.")
+            logger.info(f"Warm runner started (pid {self.process.pid}, preloaded: {', '.join(self.preload) or 'none'})")
+
+    def popen(self, argv, cwd=None, env=None, stdin=None, stdout=None, stderr=None, text=False, unbuffered=False):
+        """Run `python argv[0] argv[1:]` in a forked child of the zygote.
+
+        stdin/stdout/stderr accept what subprocess.Popen does: None to inherit,
+        PIPE, DEVNULL, a file descriptor or a file object.
+        """
+        if not self.running:
+            self.start()
+        remote = []  # Descriptors handed to the child; ours are closed once sent
+        local = []  # Our ends of pipes, as file objects
+        try:
+            for target, spec in enumerate((stdin, stdout, stderr)):
+                if spec == subprocess.PIPE:
+                    read_fd, write_fd = os.pipe()
+                    ours, theirs = (write_fd, read_fd) if target == 0 else (read_fd, write_fd)
+                    remote.append(theirs)
+                    mode = ("w" if target == 0 else "r") + ("" if text else "b")
+                    local.append(open(ours, mode, buffering=1 if text and target == 0 else -1))
+                    continue
+                if spec == subprocess.DEVNULL:
+                    remote.append(os.open(os.devnull, os.O_RDWR))
+                elif spec is None:
+                    remote.append(os.dup(target))
+                else:
+                    remote.append(os.dup(spec if isinstance(spec, int) else spec.fileno()))
+                local.append(None)
+
+            request = {
+                "argv": list(argv),
+                "cwd": cwd or os.getcwd(),
+                "env": dict(os.environ if env is None else env),
+                "unbuffered": unbuffered,
+            }
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                connection.connect(self.socket_path)
+                socket.send_fds(connection, [json.dumps(request).encode() + b"\n"], remote)
+                message, buffer = read_message(connection, b"")
+            except (OSError, ValueError) as e:
+                connection.close()
+                raise WarmRunnerError(f"Warm runner request failed: {e}")
+            if message is None:
+                connection.close()
+                raise WarmRunnerError("Warm runner closed the connection.")
+        except BaseException:
+            for file in local:
+                if file is not None:
+                    file.close()
+            raise
+        finally:
+            for fd in remote:
+                os.close(fd)
+        return WarmProcess(connection, buffer, message["pid"], list(argv), *local)
+
+    def stop_process(self):
+        if self.process is not None:
+            self.process.stdin.close()  # The zygote exits when its stdin closes
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+    def close(self):
+        with self.lock:
+            self.stop_process()
+
+
+def load_config(path=RUNNER_CONFIG):
+    """Read the warm runner settings: {"enabled": bool, "preload": [module names]}."""
+    config = {"enabled": False, "preload": []}
+    try:
+        with open(path, "r") as file:
+            config.update(json.load(file))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to read warm runner settings from {path}: {e}")
+    return config
+
+
+def python_script_argv(args):
+    """Return (script argv, unbuffered) if args is a plain `python [-u] script.py ...` run
+    by this interpreter, else None."""
+    if not args or os.path.basename(args[0]) not in ("python", "python3"):
+        return None
+    executable = shutil.which(args[0])
+    if executable is None or os.path.dirname(os.path.abspath(executable)) != os.path.dirname(sys.executable):
+        return None
+    try:
+        if not os.path.samefile(executable, sys.executable):
+            return None
+    except OSError:
+        return None
+    rest = list(args[1:])
+    unbuffered = False
+    while rest and rest[0] == "-u":
+        unbuffered = True
+        rest.pop(0)
+    if not rest or rest[0].startswith("-"):
+        return None  # -c, -m and other interpreter options need a real interpreter
+    return rest, unbuffered
+
+
+# Dependency for the shared warm runner
+warm_runner_instance = None
+warm_runner_lock = threading.Lock()
+
+
+def get_warm_runner():
+    """Return the shared warm runner if enabled in config/warm_runner.json and supported here, else None."""
+    global warm_runner_instance
+    if not AVAILABLE:
+        return None
+    with warm_runner_lock:
+        if warm_runner_instance is None:
+            config = load_config()
+            if not config["enabled"]:
+                return None
+            warm_runner_instance = WarmRunner(config["preload"])
+            atexit.register(warm_runner_instance.close)
+        return warm_runner_instance
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="SITS warm Python runner (zygote).")
+    parser.add_argument("--socket", required=True)
+    parser.add_argument("--preload", action="append", default=[])
+    options = parser.parse_args()
+    serve(options.socket, options.preload)